@@ -1,32 +1,48 @@
 """
 API endpoint for file store
 """
-from tempfile import NamedTemporaryFile
-from typing import Optional, IO
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, UploadFile, File, Depends, Response, HTTPException, Form
+from bson import ObjectId
+
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form, Request, Response
 from fastapi.params import Header
 from fastapi.logger import logger
-from filetype import filetype
+from fastapi.responses import ORJSONResponse
+from pydantic import ValidationError
 from starlette import status
+from starlette.responses import StreamingResponse
 
 from api.models.file_request import (
     DownloadFileRequest,
     ReadFileInfoRequest,
     ListFileInfoRequest,
     DeleteFileRequest,
+    DeleteFilesRequest,
     SearchFileInfoRequest,
+    LookupFilesRequest,
     ReadFileCountRequest,
     ReadUsageRequest,
+    SetAllowanceRequest,
 )
 from api.models.file_response import (
     UploadFileResponse,
     ReadFileInfoResponse,
     ListFileInfoResponse,
     DeleteFileResponse,
+    DeleteFilesResponse,
+    DeleteFilesItemResponse,
     SearchFileInfoResponse,
+    LookupFileResponse,
     ReadFileCountResponse,
     ReadUsageResponse,
+    SetAllowanceResponse,
+    ReadStorageStatsResponse,
+    ContentCacheStatsResponse,
+    MetadataCacheStatsResponse,
+    TokenCacheStatsResponse,
 )
 from api.models.jwt_payload import JWTPayload
 from api.models.role import Role
@@ -34,13 +50,31 @@ from config import settings
 from db.database import Database, get_db
 from db.model.file_meta import FileMeta
 from db.respositories.file_repository import FileRepository
-from utils.exceptions import FileValidationError
+from db.respositories.quota_repository import QuotaRepository
+from utils.byte_range import parse_range_header, new_boundary, multipart_length
+from utils.conditional_request import make_etag, make_info_etag, validator_headers, is_not_modified, if_range_matches
+from utils.content_cache import content_cache
+from utils.metadata_cache import metadata_cache
+from utils.token_cache import token_cache
+from utils.exceptions import (
+    FileValidationError,
+    FileTooLargeError,
+    RangeNotSatisfiableError,
+    InvalidCursorError,
+    InvalidFieldError,
+    SearchError,
+    QuotaExceededError,
+)
 from utils.file_validator import check_file
+from utils import ndjson
+from utils.page_cursor import PageCursor
 from utils.permission_checker import (
     check_upload_permission,
     check_download_permission,
     check_view_permission,
     check_delete_permission,
+    check_stats_permission,
+    check_allowance_permission,
 )
 
 files_router = APIRouter()
@@ -63,21 +97,6 @@ async def upload_file(
     # Check header to see if file is bigger than the limit
     if content_length > settings.FILE_SIZE_LIMIT:
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too big")
-    # Check if the size of the file is really what the header says, in case the header's been spoofed
-    # Solution offered by the FastAPI creator; https://github.com/tiangolo/fastapi/issues/362
-    real_file_size = 0
-    temp: IO = NamedTemporaryFile()
-    for chunk in file.file:
-        real_file_size += len(chunk)
-        if real_file_size > content_length:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="File too big",
-            )
-        temp.write(chunk)
-    temp.close()
-    # reset file read pointer to start
-    file.file.seek(0)
 
     if user_id and user_id != current_user_jwt.sub:
         if current_user_jwt.role == Role.ADMIN:
@@ -96,14 +115,40 @@ async def upload_file(
         check_file(file)
     except FileValidationError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # fail early, rather than after the whole file has been stored. Concurrent uploads of the same name are still
+    # turned away by the unique index
+    file_repo = FileRepository(db)
+    if await file_repo.find_file_entry(storage_user_id, file.filename):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File with the same name exists")
+
+    # the declared size is held against the allowance until the file is stored and counted in the usage
+    quota_repo = QuotaRepository(db)
+    reservation_id = str(ObjectId())
+    try:
+        await quota_repo.reserve(
+            storage_user_id,
+            reservation_id,
+            size=content_length,
+            expires_at=datetime.utcnow() + timedelta(minutes=settings.QUOTA_RESERVATION_EXPIRE_MINUTES),
+            allowance=current_user_jwt.storage_allowance if storage_user_id == current_user_jwt.sub else None,
+            allowance_as_of=current_user_jwt.iat,
+        )
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
 
     try:
-        upload_file_meta = await FileRepository(db).add_file(storage_user_id, file)
+        # the real size of the file is checked against the header while it's being stored,
+        # in case the header's been spoofed
+        upload_file_meta = await file_repo.add_file(storage_user_id, file, size_limit=content_length)
         logger.info(f"File uploaded in [{storage_user_id}] by [{current_user_jwt.sub}]: {file.filename}")
         return UploadFileResponse(**upload_file_meta.dict())
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         logger.error(f"File upload failed [{storage_user_id}]: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        await quota_repo.release(storage_user_id, reservation_id)
 
 
 @files_router.get("/download")
@@ -111,11 +156,17 @@ async def download_file(
     request: DownloadFileRequest = Depends(),
     db: Database = Depends(get_db),
     current_user_jwt: JWTPayload = Depends(check_download_permission),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    if_modified_since: Optional[str] = Header(None, alias="If-Modified-Since"),
 ):
     """
     Download a files with the given name from a given user's storage.<br>
     If user_id is not provided, the caller's storage will be accessed by default.<br>
-    A user cannot download a file from another user's storage unless they are admins.
+    A user cannot download a file from another user's storage unless they are admins.<br>
+    Parts of the file can be downloaded with a `Range` header. Several ranges are sent as multipart/byteranges.<br>
+    Conditional requests with `If-None-Match` or `If-Modified-Since` get 304 if the file hasn't changed.
     - **filename**: filename to download
     - **user_id**: source storage owner's id
     """
@@ -129,25 +180,68 @@ async def download_file(
         request.user_id = current_user_jwt.sub
 
     try:
-        file_in_bin: bytes = await FileRepository(db).download_file(
-            storage_user_id=request.user_id, filename=request.filename
-        )
-        logger.info(f"Download initiated from [{request.user_id}] by [{current_user_jwt.sub}]: {request.filename}")
-        return Response(content=file_in_bin, media_type=filetype.guess_mime(file_in_bin))
+        download = await FileRepository(db).download_file(storage_user_id=request.user_id, filename=request.filename)
     except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
 
+    etag = make_etag(download.meta.md5) if download.meta.md5 else None
+    headers = {"Accept-Ranges": "bytes", **validator_headers(etag, download.meta.uploaded_at)}
+    # answered from the file entry alone without reading any data
+    if is_not_modified(if_none_match, if_modified_since, etag, download.meta.uploaded_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if not if_range_matches(if_range, etag, download.meta.uploaded_at):
+        # the client's partial copy is outdated, so the whole file is sent
+        range_header = None
+
+    try:
+        ranges = parse_range_header(range_header, download.length)
+    except RangeNotSatisfiableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={**headers, "Content-Range": str(e)},
+        )
+
+    logger.info(f"Download initiated from [{request.user_id}] by [{current_user_jwt.sub}]: {request.filename}")
+    # the file is sent chunk by chunk as it's read from DB
+    if ranges is None:
+        headers["Content-Length"] = str(download.length)
+        return StreamingResponse(download.stream(), media_type=download.content_type, headers=headers)
+    if len(ranges) == 1:
+        byte_range = ranges[0]
+        headers["Content-Length"] = str(byte_range.size)
+        headers["Content-Range"] = byte_range.content_range(download.length)
+        return StreamingResponse(
+            download.stream(byte_range.start, byte_range.end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=download.content_type,
+            headers=headers,
+        )
+    boundary = new_boundary()
+    headers["Content-Length"] = str(multipart_length(boundary, download.content_type, ranges, download.length))
+    return StreamingResponse(
+        download.stream_ranges(ranges, boundary),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
+
 
 @files_router.get("", response_model=ReadFileInfoResponse)
 async def get_file_meta(
+    response: Response,
     request: ReadFileInfoRequest = Depends(),
     db: Database = Depends(get_db),
     current_user_jwt: JWTPayload = Depends(check_view_permission),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    if_modified_since: Optional[str] = Header(None, alias="If-Modified-Since"),
 ):
     """
     Get info of a file.<br>
     If user_id is not provided, the caller's storage will be accessed by default.<br>
-    A user cannot check files from another user's storage unless they are admins.
+    A user cannot check files from another user's storage unless they are admins.<br>
+    Conditional requests with `If-None-Match` or `If-Modified-Since` get 304 if the file hasn't changed. The entity tag
+    is of the info, not of the content, so a file uploaded again with the same content gets a new one.
     - **filename**: filename to get info of
     - **user_id**: source storage owner's id
     """
@@ -163,12 +257,17 @@ async def get_file_meta(
         meta_data: FileMeta = await FileRepository(db).read_file_info(
             storage_user_id=request.user_id, filename=request.filename
         )
-        return ReadFileInfoResponse(**meta_data.dict())
     except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    etag = make_info_etag(meta_data.md5, meta_data.uploaded_at) if meta_data.md5 else None
+    headers = validator_headers(etag, meta_data.uploaded_at)
+    if is_not_modified(if_none_match, if_modified_since, etag, meta_data.uploaded_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return ReadFileInfoResponse(**meta_data.dict())
 
 
-@files_router.get("/list/", response_model=ListFileInfoResponse)
+@files_router.get("/list/", response_model=ListFileInfoResponse, response_class=ORJSONResponse)
 async def get_file_meta_list(
     request: ListFileInfoRequest = Depends(),
     db: Database = Depends(get_db),
@@ -183,6 +282,10 @@ async def get_file_meta_list(
     - **desc**: sorting direction. True for descending, false for ascending
     - **offset**: the number of items to skip from the head when returning the sorted list
     - **limit**: the maximum number of items to return
+    - **cursor**: `next_cursor` of the previous page to get the page after it. Sorting follows the cursor
+    - **with_totals**: whether to add the number and total size of all the files, so the count and usage endpoints
+    don't have to be called as well. True by default
+    - **fields**: comma separated fields of file info to return, such as `filename,size`. All of them by default
     - **user_id**: source storage owner's id
     """
     repo = FileRepository(db)
@@ -196,33 +299,61 @@ async def get_file_meta_list(
         request.user_id = current_user_jwt.sub
 
     request.convert_sort_by()
+    try:
+        after = PageCursor.decode(request.cursor) if request.cursor else None
+        fields = request.selected_fields()
+    except (InvalidCursorError, InvalidFieldError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    metadata_iterator = repo.list_files_info(
-        storage_user_id=request.user_id,
-        offset=request.offset,
-        limit=request.limit,
-        sort_by=request.sort_by,
-        desc=request.desc,
-    )
-    response = ListFileInfoResponse()
-    async for info in metadata_iterator:
-        response.files.append(ReadFileInfoResponse(**info.dict()))
-    return response
+    async def read_page() -> ListFileInfoResponse:
+        metadata_iterator = repo.list_files_info(
+            storage_user_id=request.user_id,
+            offset=request.offset,
+            limit=request.limit,
+            sort_by=request.sort_by,
+            desc=request.desc,
+            after=after,
+            fields=fields,
+        )
+        # rows are read from DB as they are, so the response is built and serialized without validating them again
+        page = ListFileInfoResponse.construct(files=[])
+        last_info = None
+        async for info in metadata_iterator:
+            page.files.append(info.dict(include=set(fields)))
+            last_info = info
+        if last_info is not None and len(page.files) == request.limit:
+            sort_by, desc = (after.sort_by, after.desc) if after else (request.sort_by, request.desc)
+            last_doc = FileMeta.to_odm(last_info)
+            page.next_cursor = PageCursor(sort_by, desc, last_doc[sort_by], last_doc["_id"]).encode()
+        return page
+
+    if request.with_totals:
+        # totals are a single lookup of the user's counters, done while the page is read. gather() sees the outcome
+        # of both, so a failure of either is never left unretrieved
+        response, totals = await asyncio.gather(read_page(), repo.get_usage(request.user_id))
+        response.total_count = totals.files
+        response.total_bytes = totals.bytes
+    else:
+        response = await read_page()
+    return ORJSONResponse(response.dict())
 
 
-@files_router.get("/search/", response_model=SearchFileInfoResponse)
+@files_router.get("/search/", response_model=SearchFileInfoResponse, response_class=ORJSONResponse)
 async def search_file(
     request: SearchFileInfoRequest = Depends(),
     db: Database = Depends(get_db),
     current_user_jwt: JWTPayload = Depends(check_view_permission),
 ):
     """
-    Search stored file meta from DB using the given regex pattern
+    Search stored file meta from DB by filename, best match first<br>
     If user_id is not provided, the caller's storage will be accessed by default.<br>
     A user cannot check files from another user's storage unless they are admins.<br>
     - **user_id**: source storage owner's id
-    - **pattern**: regex pattern to search files with
+    - **pattern**: text to search files with, or a regex in `regex` mode
+    - **mode**: `substring`, `prefix`, `fuzzy` or `regex`. By default, regex if the pattern has regex syntax in it,
+    substring otherwise. Regex searches are stopped if they take too long
     - **limit**: maximum number of items to return
+    - **fields**: comma separated fields of file info to return, such as `filename,size`. All of them by default
     """
     repo = FileRepository(db)
     if request.user_id and request.user_id != current_user_jwt.sub:
@@ -234,16 +365,95 @@ async def search_file(
     else:
         request.user_id = current_user_jwt.sub
 
-    metadata_iterator = repo.search_files_by_regex(
-        storage_user_id=request.user_id,
-        pattern=request.pattern,
-        limit=request.limit,
-    )
+    try:
+        fields = request.selected_fields()
+        metadata_list = await repo.search_files(
+            storage_user_id=request.user_id,
+            pattern=request.pattern,
+            mode=request.mode,
+            limit=request.limit,
+            fields=fields,
+        )
+    except (InvalidFieldError, SearchError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    response = SearchFileInfoResponse.construct(files=[info.dict(include=set(fields)) for info in metadata_list])
+    return ORJSONResponse(response.dict())
 
-    response = SearchFileInfoResponse()
-    async for info in metadata_iterator:
-        response.files.append(ReadFileInfoResponse(**info.dict()))
-    return response
+
+async def read_lookup_filenames(request: Request) -> List[str]:
+    """
+    Read the filenames to look up from a request body, sent as JSON or NDJSON
+    Args:
+        request: the lookup request
+
+    Raises:
+        ValueError: if the body isn't a valid list of filenames
+
+    Returns:
+        the filenames in the order they're sent
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() != ndjson.MEDIA_TYPE:
+        try:
+            return LookupFilesRequest.parse_raw(await request.body()).filenames
+        except ValidationError as e:
+            raise ValueError(str(e))
+    # names are parsed as they arrive, so only they are kept and not the whole body.
+    # The body has to be read before the response starts, as a streamed response listens to the same channel
+    filenames = []
+    async for line in ndjson.read_lines(request.stream()):
+        if not isinstance(line, dict) or not isinstance(line.get("filename"), str):
+            raise ValueError("Every line must be an object with a filename")
+        filenames.append(line["filename"])
+        if len(filenames) > settings.LOOKUP_MAX_FILENAMES:
+            raise ValueError(f"Too many filenames. Send up to {settings.LOOKUP_MAX_FILENAMES} at once")
+    return filenames
+
+
+@files_router.post("/lookup", response_model=List[LookupFileResponse])
+async def lookup_files(
+    request: Request,
+    user_id: Optional[str] = None,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_view_permission),
+):
+    """
+    Look up many files by filename at once, such as to check which files of a directory are already stored.<br>
+    Filenames are sent either as JSON `{"filenames": [...]}` of up to `LOOKUP_BATCH_SIZE` names, or as NDJSON lines
+    of `{"filename": ...}` with `Content-Type: application/x-ndjson` for longer lists.<br>
+    Results are streamed back as NDJSON, one line per filename in the same order, as each batch of names is read
+    with a single query. Files that don't exist have `exists` false and no other info.<br>
+    If user_id is not provided, the caller's storage will be accessed by default.<br>
+    A user cannot check files from another user's storage unless they are admins.<br>
+    - **user_id**: source storage owner's id
+    """
+    if user_id and user_id != current_user_jwt.sub:
+        if current_user_jwt.role != Role.ADMIN:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to get other user's files info",
+            )
+    else:
+        user_id = current_user_jwt.sub
+
+    try:
+        filenames = await read_lookup_filenames(request)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    repo = FileRepository(db)
+    info_fields = set(LookupFileResponse.__fields__).difference({"filename", "exists"})
+
+    async def results():
+        for start in range(0, len(filenames), settings.LOOKUP_BATCH_SIZE):
+            batch = filenames[start : start + settings.LOOKUP_BATCH_SIZE]
+            for filename, meta in zip(batch, await repo.lookup_files(user_id, batch)):
+                row = {"filename": filename, "exists": meta is not None}
+                if meta is not None:
+                    row.update(meta.dict(include=info_fields))
+                yield ndjson.dump_line(row)
+
+    return StreamingResponse(results(), media_type=ndjson.MEDIA_TYPE)
 
 
 @files_router.get("/count", response_model=ReadFileCountResponse)
@@ -300,6 +510,66 @@ async def get_usage(
     return ReadUsageResponse(storage_used=used)
 
 
+@files_router.put("/allowance", response_model=SetAllowanceResponse)
+async def set_allowance(
+    request: SetAllowanceRequest,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_allowance_permission),
+):
+    """
+    Set the storage allowance uploads to a user's storage are checked against.<br>
+    Called by the user service whenever an allowance changes, so uploads never have to ask it.<br>
+    Only an admin can set an allowance.<br>
+    - **user_id**: target storage owner's id
+    - **storage_allowance**: storage allowance in bytes
+    """
+    await QuotaRepository(db).set_allowance(request.user_id, request.storage_allowance)
+    logger.info(f"Allowance of [{request.user_id}] set to {request.storage_allowance} by [{current_user_jwt.sub}]")
+    return SetAllowanceResponse(user_id=request.user_id, storage_allowance=request.storage_allowance)
+
+
+@files_router.get("/stats", response_model=ReadStorageStatsResponse)
+async def get_storage_stats(
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_stats_permission),
+):
+    """
+    Get the storage statistics of the whole service.<br>
+    Shows the logical size of all the files against the bytes actually stored after deduplication and compression.<br>
+    Counters of the in-memory caches are those of the worker process serving the request.<br>
+    Only admins can get the statistics.
+    """
+    stats = await FileRepository(db).get_storage_stats()
+    return ReadStorageStatsResponse(
+        **stats.dict(),
+        dedup_saved_bytes=stats.dedup_saved_bytes,
+        compression_saved_bytes=stats.compression_saved_bytes,
+        content_cache=ContentCacheStatsResponse(
+            entries=len(content_cache),
+            bytes=content_cache.current_bytes,
+            hits=content_cache.hits,
+            misses=content_cache.misses,
+            evictions=content_cache.evictions,
+        ),
+        metadata_cache=MetadataCacheStatsResponse(
+            entries=len(metadata_cache),
+            hits=metadata_cache.hits,
+            misses=metadata_cache.misses,
+            evictions=metadata_cache.evictions,
+        ),
+        token_cache=TokenCacheStatsResponse(
+            entries=len(token_cache),
+            hits=token_cache.hits,
+            misses=token_cache.misses,
+            evictions=token_cache.evictions,
+            hit_ratio=token_cache.hit_ratio,
+            saved_ms=token_cache.saved_seconds * 1000,
+            hit_avg_us=token_cache.hit_avg_seconds * 1e6,
+            miss_avg_us=token_cache.miss_avg_seconds * 1e6,
+        ),
+    )
+
+
 @files_router.delete("", response_model=DeleteFileResponse)
 async def delete_file(
     request: DeleteFileRequest = Depends(),
@@ -326,3 +596,38 @@ async def delete_file(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
     logger.info(f"File deleted from [{request.user_id}] by [{current_user_jwt.sub}]: {request.filename}")
     return DeleteFileResponse(filename=request.filename)
+
+
+@files_router.post("/delete", response_model=DeleteFilesResponse)
+async def delete_files(
+    request: DeleteFilesRequest,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_delete_permission),
+):
+    """
+    Delete many files at once.<br>
+    Files are deleted in batches with a few queries per batch, instead of a request per file.<br>
+    If user_id is not provided, the caller's storage will be accessed by default.<br>
+    A user cannot delete files from another user's storage unless they are admins.
+    - **filenames**: filenames to delete, up to `BULK_DELETE_MAX_FILENAMES`
+    - **user_id**: target storage owner's id
+    """
+    if request.user_id and request.user_id != current_user_jwt.sub:
+        if current_user_jwt.role != Role.ADMIN:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to delete other user's files",
+            )
+    else:
+        request.user_id = current_user_jwt.sub
+
+    outcomes = await FileRepository(db).delete_files(storage_user_id=request.user_id, filenames=request.filenames)
+    deleted_count = len({filename for filename, deleted in zip(request.filenames, outcomes) if deleted})
+    logger.info(f"{deleted_count} files deleted from [{request.user_id}] by [{current_user_jwt.sub}]")
+    return DeleteFilesResponse(
+        deleted_count=deleted_count,
+        files=[
+            DeleteFilesItemResponse(filename=filename, deleted=deleted)
+            for filename, deleted in zip(request.filenames, outcomes)
+        ],
+    )
@@ -0,0 +1,186 @@
+"""
+API endpoint for resumable uploads.
+A file is uploaded in numbered parts within an upload session, so a broken upload can carry on from the parts
+that have already been received instead of starting over.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.logger import logger
+from starlette import status
+
+from api.models.file_request import CreateUploadSessionRequest
+from api.models.file_response import (
+    UploadSessionResponse,
+    UploadPartResponse,
+    UploadFileResponse,
+    DeleteUploadSessionResponse,
+)
+from api.models.jwt_payload import JWTPayload
+from api.models.role import Role
+from config import settings
+from db.database import Database, get_db
+from db.model.upload_session import UploadSession
+from db.respositories.upload_session_repository import UploadSessionRepository
+from utils.exceptions import FileValidationError, FileTooLargeError, UploadSessionError, QuotaExceededError
+from utils.file_validator import check_filename
+from utils.permission_checker import check_upload_permission
+
+uploads_router = APIRouter()
+
+
+def to_session_response(session: UploadSession) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        upload_id=session.id,
+        filename=session.filename,
+        size=session.size,
+        part_size=session.part_size,
+        expires_at=session.expires_at,
+        received_parts=[
+            UploadPartResponse(part_number=n, offset=n * session.part_size, **part.dict())
+            for n, part in sorted(session.parts.items())
+        ],
+    )
+
+
+async def get_own_session(repo: UploadSessionRepository, upload_id: str, current_user_jwt: JWTPayload) -> UploadSession:
+    """
+    Get an upload session, making sure the caller is allowed to access it.
+    A user cannot access upload sessions of another user's storage unless they are admins.
+    """
+    try:
+        session = await repo.get_session(upload_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if session.user_id != current_user_jwt.sub and current_user_jwt.role != Role.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to upload files to other user's storage",
+        )
+    return session
+
+
+@uploads_router.post("", response_model=UploadSessionResponse)
+async def create_upload_session(
+    request: CreateUploadSessionRequest,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_upload_permission),
+):
+    """
+    Start a resumable upload.<br>
+    The file is then sent in parts of `part_size` bytes using the returned `upload_id`.<br>
+    If user_id is not provided, the caller's storage will be accessed by default.<br>
+    - **filename**: filename of the file to upload
+    - **size**: total size of the file in bytes
+    - **user_id**: target storage owner's id
+    """
+    if request.size > settings.FILE_SIZE_LIMIT:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too big")
+
+    if request.user_id and request.user_id != current_user_jwt.sub:
+        if current_user_jwt.role != Role.ADMIN:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to upload files to other user's storage",
+            )
+    else:
+        request.user_id = current_user_jwt.sub
+    # the caller's token knows their allowance, in case it hasn't been pushed by the user service
+    allowance = current_user_jwt.storage_allowance if request.user_id == current_user_jwt.sub else None
+
+    try:
+        check_filename(request.filename)
+    except FileValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        session = await UploadSessionRepository(db).create_session(
+            storage_user_id=request.user_id,
+            filename=request.filename,
+            size=request.size,
+            allowance=allowance,
+            allowance_as_of=current_user_jwt.iat,
+        )
+    except FileExistsError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    logger.info(
+        f"Upload session {session.id} started in [{request.user_id}] by [{current_user_jwt.sub}]: {request.filename}"
+    )
+    return to_session_response(session)
+
+
+@uploads_router.get("/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    upload_id: str,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_upload_permission),
+):
+    """
+    Get the state of a resumable upload, including the parts received so far.<br>
+    - **upload_id**: id of the upload session
+    """
+    session = await get_own_session(UploadSessionRepository(db), upload_id, current_user_jwt)
+    return to_session_response(session)
+
+
+@uploads_router.put("/{upload_id}/parts/{part_number}", response_model=UploadPartResponse)
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_upload_permission),
+):
+    """
+    Upload a part of the file as the raw request body.<br>
+    Sending a part that has already been received replaces it.<br>
+    - **upload_id**: id of the upload session
+    - **part_number**: 0-based part number. Part n starts at byte n * part_size
+    """
+    repo = UploadSessionRepository(db)
+    session = await get_own_session(repo, upload_id, current_user_jwt)
+    try:
+        part = await repo.write_part(session, part_number, request.stream())
+    except FileTooLargeError:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Part too big")
+    except UploadSessionError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return UploadPartResponse(part_number=part_number, offset=part_number * session.part_size, **part.dict())
+
+
+@uploads_router.post("/{upload_id}/complete", response_model=UploadFileResponse)
+async def complete_upload_session(
+    upload_id: str,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_upload_permission),
+):
+    """
+    Finish a resumable upload once all the parts are received.<br>
+    - **upload_id**: id of the upload session
+    """
+    repo = UploadSessionRepository(db)
+    session = await get_own_session(repo, upload_id, current_user_jwt)
+    try:
+        file_meta = await repo.complete_session(session)
+    except (UploadSessionError, FileExistsError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    logger.info(f"File uploaded in [{session.user_id}] by [{current_user_jwt.sub}]: {session.filename}")
+    return UploadFileResponse(**file_meta.dict())
+
+
+@uploads_router.delete("/{upload_id}", response_model=DeleteUploadSessionResponse)
+async def abort_upload_session(
+    upload_id: str,
+    db: Database = Depends(get_db),
+    current_user_jwt: JWTPayload = Depends(check_upload_permission),
+):
+    """
+    Cancel a resumable upload and discard the parts received so far.<br>
+    - **upload_id**: id of the upload session
+    """
+    repo = UploadSessionRepository(db)
+    session = await get_own_session(repo, upload_id, current_user_jwt)
+    await repo.abort_session(session)
+    return DeleteUploadSessionResponse(upload_id=upload_id)
@@ -1,13 +1,40 @@
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import UploadFile, File
-from pydantic import BaseModel, conint
+from pydantic import BaseModel, conint, conlist
+
+from api.models.file_response import FILE_INFO_FIELDS
+from api.models.search_mode import SearchMode
+from config import settings
+from utils.exceptions import InvalidFieldError
+from utils.page_cursor import SORT_FIELDS
 
 
 class BaseFileRequest(BaseModel):
     pass
 
 
+class SelectFileInfoFieldsRequest(BaseFileRequest):
+    fields: Optional[str]  # comma separated fields of file info to return. All of them if not given
+
+    def selected_fields(self) -> List[str]:
+        """
+        Parse the requested fields of file info
+        Raises:
+            InvalidFieldError: if a field isn't a field of file info
+
+        Returns:
+            list of field names, in the order of file info
+        """
+        fields = {field.strip() for field in (self.fields or "").split(",") if field.strip()}
+        if not fields:
+            return list(FILE_INFO_FIELDS)
+        unknown = fields.difference(FILE_INFO_FIELDS)
+        if unknown:
+            raise InvalidFieldError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return [field for field in FILE_INFO_FIELDS if field in fields]
+
+
 class ReadFileInfoRequest(BaseFileRequest):
     user_id: Optional[str]
     filename: str
@@ -18,6 +45,12 @@ class UploadFileRequest(BaseFileRequest):
     file: UploadFile = File(...)
 
 
+class CreateUploadSessionRequest(BaseFileRequest):
+    user_id: Optional[str]
+    filename: str
+    size: conint(ge=0)  # total file size in byte
+
+
 class DownloadFileRequest(BaseFileRequest):
     user_id: Optional[str]
     filename: str
@@ -28,12 +61,14 @@ class DeleteFileRequest(BaseFileRequest):
     filename: str
 
 
-class ListFileInfoRequest(BaseFileRequest):
+class ListFileInfoRequest(SelectFileInfoFieldsRequest):
     user_id: Optional[str]
     offset: conint(ge=0, le=100) = 0
     limit: conint(ge=0, le=100) = 100
     sort_by: Optional[str] = "uploadDate"
     desc: Optional[bool] = True
+    cursor: Optional[str]  # next_cursor of the previous page
+    with_totals: bool = True  # whether to add the number and total size of all the files of the storage
 
     def convert_sort_by(self):
         """
@@ -43,17 +78,35 @@ class ListFileInfoRequest(BaseFileRequest):
             self.sort_by = "uploadDate"
         elif self.sort_by == "size":
             self.sort_by = "length"
+        # default sorting field to upload date if not valid
+        if self.sort_by not in SORT_FIELDS:
+            self.sort_by = "uploadDate"
 
 
-class SearchFileInfoRequest(BaseFileRequest):
+class SearchFileInfoRequest(SelectFileInfoFieldsRequest):
     user_id: Optional[str]
     pattern: str
+    mode: SearchMode = SearchMode.AUTO
     limit: conint(le=30) = 10
 
 
+class DeleteFilesRequest(BaseFileRequest):
+    user_id: Optional[str]
+    filenames: conlist(str, min_items=1, max_items=settings.BULK_DELETE_MAX_FILENAMES)
+
+
+class LookupFilesRequest(BaseFileRequest):
+    filenames: conlist(str, min_items=1, max_items=settings.LOOKUP_BATCH_SIZE)
+
+
 class ReadFileCountRequest(BaseFileRequest):
     user_id: Optional[str]
 
 
 class ReadUsageRequest(BaseFileRequest):
     user_id: Optional[str]
+
+
+class SetAllowanceRequest(BaseFileRequest):
+    user_id: str
+    storage_allowance: conint(ge=0)  # storage allowance in byte
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -12,16 +12,42 @@ class ReadFileInfoResponse(BaseFileResponse):
     filename: str
     uploaded_at: datetime
     size: int  # file size in byte
-    md5: str  # md5 hashing of the file
+    md5: Optional[str]  # md5 hashing of the file
+    content_type: Optional[str]  # mime type of the file
+
+
+# fields of file info a list or search can be narrowed down to
+FILE_INFO_FIELDS = tuple(ReadFileInfoResponse.__fields__)
 
 
 class UploadFileResponse(BaseFileResponse):
     filename: str
     uploaded_at: datetime
     size: int
+    md5: Optional[str]
+    content_type: Optional[str]
+
+
+class UploadPartResponse(BaseFileResponse):
+    part_number: int
+    offset: int  # position of the part's first byte in the file
+    size: int
     md5: str
 
 
+class UploadSessionResponse(BaseFileResponse):
+    upload_id: str
+    filename: str
+    size: int
+    part_size: int  # every part but the last one must be of this size
+    expires_at: datetime
+    received_parts: List[UploadPartResponse] = []
+
+
+class DeleteUploadSessionResponse(BaseFileResponse):
+    upload_id: str
+
+
 class DownloadFileResponse(BaseFileResponse):
     file: bytes
 
@@ -30,17 +56,82 @@ class DeleteFileResponse(BaseFileResponse):
     filename: str
 
 
+class DeleteFilesItemResponse(BaseModel):
+    filename: str
+    deleted: bool  # False if the file wasn't found
+
+
+class DeleteFilesResponse(BaseFileResponse):
+    deleted_count: int
+    files: List[DeleteFilesItemResponse]  # in the order of the request
+
+
 class ListFileInfoResponse(BaseFileResponse):
     files: List[ReadFileInfoResponse] = []
+    next_cursor: Optional[str]  # cursor to the next page. None if this is the last one
+    total_count: Optional[int]  # number of all the files of the storage. None if not asked for
+    total_bytes: Optional[int]  # total size of all the files of the storage. None if not asked for
 
 
 class SearchFileInfoResponse(BaseFileResponse):
     files: List[ReadFileInfoResponse] = []
 
 
+class LookupFileResponse(BaseFileResponse):
+    filename: str
+    exists: bool
+    uploaded_at: Optional[datetime]  # the rest are left out if the file doesn't exist
+    size: Optional[int]
+    md5: Optional[str]
+    content_type: Optional[str]
+
+
 class ReadFileCountResponse(BaseFileResponse):
     count: int
 
 
 class ReadUsageResponse(BaseFileResponse):
     storage_used: int
+
+
+class SetAllowanceResponse(BaseFileResponse):
+    user_id: str
+    storage_allowance: int
+
+
+class ContentCacheStatsResponse(BaseModel):
+    entries: int
+    bytes: int  # total size of the cached contents
+    hits: int
+    misses: int
+    evictions: int
+
+
+class MetadataCacheStatsResponse(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class TokenCacheStatsResponse(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+    saved_ms: float  # auth time saved by the cache
+    hit_avg_us: float  # average auth time of a request with a cached token
+    miss_avg_us: float  # average auth time of a request whose token is verified
+
+
+class ReadStorageStatsResponse(BaseFileResponse):
+    files: int
+    logical_bytes: int  # total size of all files as uploaded
+    unique_bytes: int  # total size of the distinct contents
+    stored_bytes: int  # bytes taken up by the chunks
+    dedup_saved_bytes: int
+    compression_saved_bytes: int
+    content_cache: ContentCacheStatsResponse  # of the worker that served the request
+    metadata_cache: MetadataCacheStatsResponse  # of the worker that served the request
+    token_cache: TokenCacheStatsResponse  # of the worker that served the request
@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class SearchMode(str, Enum):
+    """
+    Enum for representing how a filename search pattern is matched
+    """
+
+    AUTO = "auto"  # regex if the pattern has regex syntax in it, substring otherwise
+    SUBSTRING = "substring"  # filenames containing the pattern, case insensitive
+    PREFIX = "prefix"  # filenames starting with the pattern, case insensitive
+    FUZZY = "fuzzy"  # filenames similar to the pattern, tolerating typos
+    REGEX = "regex"  # filenames matching the pattern as a regex
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 
 from api.endpoints.files import files_router
+from api.endpoints.uploads import uploads_router
 
 api_router = APIRouter()
 api_router.include_router(files_router, prefix="/files", tags=["files"])
+api_router.include_router(uploads_router, prefix="/files/uploads", tags=["uploads"])
@@ -15,8 +15,30 @@ class Settings(BaseSettings):
     ROLE_FOR_DOWNLOAD: Set[Role] = {Role.UPLOADER, Role.ADMIN}
     ROLE_FOR_UPLOAD: Set[Role] = {Role.UPLOADER, Role.ADMIN}
     ROLE_FOR_DELETE: Set[Role] = {Role.UPLOADER, Role.ADMIN}
+    ROLE_FOR_STATS: Set[Role] = {Role.ADMIN}
+    ROLE_FOR_ALLOWANCE: Set[Role] = {Role.ADMIN}
 
     FILE_SIZE_LIMIT: int = 500_000_000  # 500MB by default
+    UPLOAD_PART_SIZE: int = 32 * 255 * 1024  # part size of resumable uploads, 32 GridFS chunks
+    CHUNK_CODEC: str = "none"  # codec to compress stored chunks with: none, zlib or zstd (needs zstandard package)
+    UPLOAD_SESSION_EXPIRE_MINUTES: int = 60 * 24  # abandoned upload sessions are removed after this
+    QUOTA_RESERVATION_EXPIRE_MINUTES: int = 60  # space reserved by a direct upload is given back after this at worst
+    CONTENT_CACHE_SIZE: int = 64 * 1024 * 1024  # memory for caching small file contents, per worker. 0 to disable
+    CONTENT_CACHE_ENTRY_SIZE: int = 255 * 1024  # files larger than this are never cached. One GridFS chunk
+    METADATA_CACHE_SIZE: int = 10000  # number of file entries cached per worker. 0 to disable
+    METADATA_CACHE_TTL_SECONDS: int = 300  # cached file entries are read again from DB after this
+    METADATA_VERSION_TTL_SECONDS: float = 2  # writes of other workers are seen by the cache after at most this
+    TOKEN_CACHE_SIZE: int = 10000  # number of verified JWTs cached per worker. 0 to disable
+    SEARCH_REGEX_MAX_TIME_MS: int = 500  # regex searches can't use an index, and are stopped after this
+    LOOKUP_BATCH_SIZE: int = 1000  # filenames looked up with a single query. Also the most a JSON lookup can have
+    LOOKUP_MAX_FILENAMES: int = 100_000  # most filenames an NDJSON lookup can have
+    BULK_DELETE_MAX_FILENAMES: int = 10_000  # most files a bulk delete can have
+    USAGE_RECONCILE_INTERVAL_MINUTES: int = 60  # usage counters are checked against the files this often. 0 to disable
+    GC_INTERVAL_SECONDS: int = 60  # data of deleted files is reclaimed this often. 0 to disable
+    GC_BATCH_SIZE: int = 100  # deleted files, or owners of chunks looked through for orphans, handled at once
+    GC_CHUNK_BATCH_SIZE: int = 64  # chunks removed at once. 16MB of GridFS chunks
+    GC_BATCH_DELAY_MS: int = 100  # pause between batches, so reclaiming doesn't crowd out requests
+    GC_ORPHAN_GRACE_MINUTES: int = 60 * 24  # chunks nothing refers to are removed once they're this old
     FILE_EXTENSION_WHITELIST: Set[str] = {
         ".pdf",
         ".doc",
@@ -30,6 +52,7 @@ class Settings(BaseSettings):
     }
 
     NO_AUTH_MODE: bool = False
+    QUERY_PLAN_CHECK: bool = False  # fail tests whose queries scan whole collections or sort in memory. Tests only
 
 
 settings = Settings()
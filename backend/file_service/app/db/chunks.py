@@ -0,0 +1,121 @@
+"""
+Low level access to the GridFS chunks collection.
+Used where data has to be written to or read from particular chunk indices, which GridFS bucket API doesn't allow.
+The chunk documents written here are the same as the ones GridFS writes, except that their data may be encoded with
+a chunk codec.
+"""
+from typing import AsyncIterator, Any, Optional, Callable, NamedTuple, Awaitable
+
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReplaceOne
+
+from utils.exceptions import FileTooLargeError
+
+# number of chunks that are sent to DB in a single batch. This bounds the memory used for writing.
+WRITE_BATCH_CHUNKS = 4
+
+
+class WrittenChunks(NamedTuple):
+    length: int  # number of bytes of the stream
+    stored_length: int  # number of bytes stored after encoding
+
+
+async def write_chunks(
+    chunks: AsyncIOMotorCollection,
+    files_id: Any,
+    stream: AsyncIterator[bytes],
+    chunk_size: int,
+    first_n: int = 0,
+    size_limit: Optional[int] = None,
+    encode: Optional[Callable[[bytes], Awaitable[bytes]]] = None,
+) -> WrittenChunks:
+    """
+    Split the given byte stream into chunks and write them with consecutive indices starting from `first_n`.
+    Existing chunks with the same indices are overwritten, so writing the same data again is harmless.
+    Args:
+        chunks: GridFS chunks collection
+        files_id: id of the file the chunks belong to
+        stream: async stream of bytes of any size
+        chunk_size: size of each chunk before encoding. All chunks but the last one will be of this size
+        first_n: index of the first chunk to write
+        size_limit: maximum number of bytes the stream may have
+        encode: coroutine function to encode each chunk with before it's stored, such as a compression codec
+
+    Raises:
+        FileTooLargeError: if the stream is bigger than the size limit
+
+    Returns:
+        number of bytes written, before and after encoding
+    """
+    buffer = bytearray()
+    batch = []
+    n = first_n
+    written = 0
+    stored = 0
+
+    async def flush():
+        nonlocal batch
+        if batch:
+            await chunks.bulk_write(batch, ordered=False)
+            batch = []
+
+    async def add_chunk(data: bytes):
+        nonlocal n, stored
+        if encode is not None:
+            data = await encode(data)
+        stored += len(data)
+        batch.append(
+            ReplaceOne({"files_id": files_id, "n": n}, {"files_id": files_id, "n": n, "data": data}, upsert=True)
+        )
+        n += 1
+
+    async for data in stream:
+        written += len(data)
+        if size_limit is not None and written > size_limit:
+            raise FileTooLargeError("File too big")
+        buffer += data
+        while len(buffer) >= chunk_size:
+            await add_chunk(bytes(buffer[:chunk_size]))
+            del buffer[:chunk_size]
+            if len(batch) >= WRITE_BATCH_CHUNKS:
+                await flush()
+    if buffer:
+        await add_chunk(bytes(buffer))
+    await flush()
+    return WrittenChunks(written, stored)
+
+
+async def read_chunks(
+    chunks: AsyncIOMotorCollection, files_id: Any, first_n: int = 0, last_n: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    Read chunk documents of a file in order, starting from `first_n`.
+    The chunks before `first_n` are never read, as the index on (files_id, n) is used to seek to it.
+    Args:
+        chunks: GridFS chunks collection
+        files_id: id of the file the chunks belong to
+        first_n: index of the first chunk to read
+        last_n: index of the last chunk to read. Until the last chunk of the file if None
+
+    Returns:
+        async stream of chunk documents
+    """
+    n_filter = {"$gte": first_n}
+    if last_n is not None:
+        n_filter["$lte"] = last_n
+    cursor = (
+        chunks.find({"files_id": files_id, "n": n_filter}).sort("n", pymongo.ASCENDING).batch_size(WRITE_BATCH_CHUNKS)
+    )
+    async for chunk in cursor:
+        yield chunk
+
+
+async def delete_chunks(chunks: AsyncIOMotorCollection, files_id: Any) -> None:
+    """
+    Delete all chunks of a file
+    Args:
+        chunks: GridFS chunks collection
+        files_id: id of the file the chunks belong to
+    """
+    await chunks.delete_many({"files_id": files_id})
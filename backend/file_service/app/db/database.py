@@ -1,7 +1,7 @@
-import pymongo
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 
 from config import settings
+from db.indexes import check_indexes
 
 
 class Database:
@@ -23,12 +23,9 @@ async def open_db_connection() -> None:
     """
     db.client = AsyncIOMotorClient(settings.MONGODB_URL)
     db.grid_client = AsyncIOMotorGridFSBucket(db.client["file_service"])
-
-    # create index
-    await db.client["file_service"]["fs.files"].create_index([("metadata.user_id", pymongo.TEXT)])
-    await db.client["file_service"]["fs.files"].create_index([("uploadDate", pymongo.DESCENDING)])
-    await db.client["file_service"]["fs.files"].create_index([("length", pymongo.DESCENDING)])
-    await db.client["file_service"]["fs.files"].create_index([("filename", pymongo.DESCENDING)])
+    # indexes are kept in sync at deploy time by scripts/sync_indexes.py, see db/indexes.py.
+    # Refuse to start without the ones that keep the data consistent
+    await check_indexes(db.client)
 
 
 async def close_db_connection() -> None:
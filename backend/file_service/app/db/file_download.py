@@ -0,0 +1,99 @@
+"""
+Streaming reads of stored files.
+The data of a file is read from DB one batch of chunks at a time only as it's sent out, so memory used by a download
+doesn't grow with the size of the file.
+"""
+from typing import AsyncIterator, Optional, List
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from db.chunks import read_chunks
+from db.model.file_meta import FileMeta
+from db.respositories.blob_repository import get_blob_id, get_file_codec
+from utils.byte_range import ByteRange, multipart_part_header, multipart_end
+from utils.content_cache import ContentCache
+from utils.upload_pipeline import guess_content_type
+
+
+class FileDownload:
+    """
+    A stored file to be downloaded. Nothing but the file entry is read until the data is streamed.
+    GridFS bucket API can't be used here, as the chunks may be shared by deduplicated files or compressed.
+    """
+
+    def __init__(self, chunks: AsyncIOMotorCollection, file_doc: dict, cache: Optional[ContentCache] = None):
+        self.chunks = chunks
+        self.cache = cache
+        self.meta = FileMeta.from_odm(file_doc)
+        self.length: int = file_doc["length"]
+        self.chunk_size: int = file_doc["chunkSize"]
+        # files stored before the content type was recorded get it from the filename, without reading the data
+        self.content_type: str = self.meta.content_type or guess_content_type(self.meta.filename)
+        self.blob_id = get_blob_id(file_doc)
+        self.codec = get_file_codec(file_doc)
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.length // self.chunk_size)
+
+    @property
+    def cacheable(self) -> bool:
+        return self.cache is not None and self.meta.md5 is not None and self.cache.accepts(self.length)
+
+    async def stream(self, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Stream the data of the file chunk by chunk.
+        Only the chunks holding the requested bytes are read. The first one is found from the chunk size directly.
+        Small files are served from the content cache, and cached whole when they're missing from it.
+        Args:
+            start: position of the first byte to stream
+            end: position of the last byte to stream, inclusive. Until the end of the file if None
+
+        Raises:
+            IOError: if some chunks of the file are missing. The response can only be aborted at this point
+
+        Returns:
+            async stream of the file data
+        """
+        end = self.length - 1 if end is None else end
+        if start > end:
+            return
+        if self.cacheable:
+            data = self.cache.get(self.meta.id, self.meta.md5)
+            if data is None:
+                data = b"".join([chunk async for chunk in self._read_chunks(0, self.length - 1)])
+                self.cache.put(self.meta.id, self.meta.md5, data)
+            yield data[start : end + 1]
+            return
+        async for data in self._read_chunks(start, end):
+            yield data
+
+    async def _read_chunks(self, start: int, end: int) -> AsyncIterator[bytes]:
+        first_n, last_n = start // self.chunk_size, end // self.chunk_size
+        n = first_n
+        async for chunk in read_chunks(self.chunks, self.blob_id, first_n, last_n):
+            if chunk["n"] != n:
+                raise IOError(f"Chunk {n} of file {self.meta.id} is missing")
+            data = await self.codec.decode_async(chunk["data"])
+            offset = n * self.chunk_size
+            yield data[max(start - offset, 0) : end - offset + 1]
+            n += 1
+        if n != last_n + 1:
+            raise IOError(f"Chunk {n} of file {self.meta.id} is missing")
+
+    async def stream_ranges(self, ranges: List[ByteRange], boundary: str) -> AsyncIterator[bytes]:
+        """
+        Stream several ranges of the file as a multipart/byteranges body
+        Args:
+            ranges: ranges to stream
+            boundary: multipart boundary
+
+        Returns:
+            async stream of the multipart body
+        """
+        for byte_range in ranges:
+            yield multipart_part_header(boundary, self.content_type, byte_range, self.length)
+            async for data in self.stream(byte_range.start, byte_range.end):
+                yield data
+            yield b"\r\n"
+        yield multipart_end(boundary)
@@ -0,0 +1,146 @@
+"""
+Declared indexes of the service.
+Every index matches a query shape of the repositories, and is kept in sync with DB by `sync_indexes()` at deploy time,
+instead of being created on every startup of every worker.
+"""
+import logging
+from typing import List, NamedTuple, Optional, Tuple
+
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils.exceptions import MissingIndexError
+
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = "file_service"
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: List[Tuple[str, int]]
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        # same as the names MongoDB gives, so indexes created before they were declared are recognised
+        return "_".join(f"{key}_{direction}" for key, direction in self.keys)
+
+    def matches(self, info: dict) -> bool:
+        """
+        Check if an existing index is the same as declared
+        Args:
+            info: the index from `index_information()`
+
+        Returns:
+            True if keys and options are the same
+        """
+        return (
+            [(key, int(direction)) for key, direction in info["key"]] == self.keys
+            and bool(info.get("unique", False)) == self.unique
+            and info.get("expireAfterSeconds") == self.expire_after_seconds
+        )
+
+
+INDEXES: List[IndexSpec] = [
+    # file lookups by name, listings sorted by filename and filename search within a storage.
+    # Filenames are unique within a storage
+    IndexSpec("fs.files", [("metadata.user_id", pymongo.ASCENDING), ("filename", pymongo.ASCENDING)], unique=True),
+    # listings sorted by upload date or size, paged with cursors on (sort field, id)
+    IndexSpec(
+        "fs.files",
+        [("metadata.user_id", pymongo.ASCENDING), ("uploadDate", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+    ),
+    IndexSpec(
+        "fs.files", [("metadata.user_id", pymongo.ASCENDING), ("length", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+    ),
+    # created by GridFS itself on its first write. Declared so it isn't dropped and created over again
+    IndexSpec("fs.files", [("filename", pymongo.ASCENDING), ("uploadDate", pymongo.ASCENDING)]),
+    # filename search looks up the trigrams of the pattern within a storage
+    IndexSpec("fs.filename_grams", [("user_id", pymongo.ASCENDING), ("grams", pymongo.ASCENDING)]),
+    # chunks are also written directly by resumable uploads, so don't rely on GridFS creating this index
+    IndexSpec("fs.chunks", [("files_id", pymongo.ASCENDING), ("n", pymongo.ASCENDING)], unique=True),
+    # abandoned upload sessions are removed once they expire
+    IndexSpec("upload_sessions", [("expires_at", pymongo.ASCENDING)], expire_after_seconds=0),
+    # reservations of uploads that never ended are looked for among the users holding any
+    IndexSpec("user_usage", [("reserved", pymongo.ASCENDING)]),
+    # the garbage collector picks up tombstones of deleted files once they're old enough
+    IndexSpec("deleted_files", [("deleted_at", pymongo.ASCENDING)]),
+    # deduplicated file data is looked up by the hash of its content
+    IndexSpec("fs.blobs", [("sha256", pymongo.ASCENDING)], unique=True),
+]
+
+
+# indexes the service can't run correctly without, checked as it starts up.
+# The unique filename index is the only thing that keeps two files of a storage from having the same name
+REQUIRED_INDEXES: List[IndexSpec] = [INDEXES[0]]
+
+
+class IndexChanges(NamedTuple):
+    created: List[str]  # "<collection>.<index name>" of the created indexes
+    dropped: List[str]  # "<collection>.<index name>" of the dropped indexes
+
+
+async def sync_indexes(
+    client: AsyncIOMotorClient, indexes: List[IndexSpec] = INDEXES, drop_unknown: bool = True
+) -> IndexChanges:
+    """
+    Reconcile the indexes in DB with the declared ones.
+    Missing indexes are created, and indexes whose keys or options changed are created again.
+    Args:
+        client: DB client
+        indexes: declared indexes
+        drop_unknown: whether to drop the indexes that aren't declared, such as indexes no query uses anymore
+
+    Returns:
+        names of the created and dropped indexes
+    """
+    changes = IndexChanges(created=[], dropped=[])
+    for collection_name in sorted({spec.collection for spec in indexes}):
+        collection = client[DATABASE_NAME][collection_name]
+        existing = await collection.index_information()
+        declared = {spec.name: spec for spec in indexes if spec.collection == collection_name}
+
+        for name, info in existing.items():
+            if name == "_id_":
+                continue
+            spec = declared.get(name)
+            if (spec is None and drop_unknown) or (spec is not None and not spec.matches(info)):
+                await collection.drop_index(name)
+                changes.dropped.append(f"{collection_name}.{name}")
+
+        existing = await collection.index_information()
+        for name, spec in declared.items():
+            if name in existing:
+                continue
+            options = {"name": name, "unique": spec.unique}
+            if spec.expire_after_seconds is not None:
+                options["expireAfterSeconds"] = spec.expire_after_seconds
+            await collection.create_index(spec.keys, **options)
+            changes.created.append(f"{collection_name}.{name}")
+
+    for name in changes.dropped:
+        logger.info(f"Dropped index {name}")
+    for name in changes.created:
+        logger.info(f"Created index {name}")
+    return changes
+
+
+async def check_indexes(client: AsyncIOMotorClient, indexes: List[IndexSpec] = REQUIRED_INDEXES) -> None:
+    """
+    Check that indexes exist in DB as declared, such as after `sync_indexes()` failed at deploy time
+    Args:
+        client: DB client
+        indexes: indexes to check
+
+    Raises:
+        MissingIndexError: if an index is missing or differs from the declared one
+    """
+    for spec in indexes:
+        info = (await client[DATABASE_NAME][spec.collection].index_information()).get(spec.name)
+        if info is None or not spec.matches(info):
+            raise MissingIndexError(
+                f"Index {spec.collection}.{spec.name} is missing or differs from the declared one. "
+                "Run scripts/sync_indexes.py"
+            )
@@ -1,36 +1,66 @@
 from datetime import datetime
+from typing import Iterable, Optional
 
 from bson import ObjectId
 from pydantic import BaseModel
 
 
+# DB field of each field of the model
+ODM_FIELDS = {
+    "id": "_id",
+    "filename": "filename",
+    "uploaded_at": "uploadDate",
+    "size": "length",
+    "md5": "md5",
+    "user_id": "metadata.user_id",
+    "content_type": "metadata.content_type",
+}
+
+
 class FileMeta(BaseModel):
     id: str
     filename: str
     uploaded_at: datetime
     size: int  # file size in byte
-    md5: str  # md5 hashing of the file
+    md5: Optional[str]  # md5 hashing of the file. GridFS doesn't compute it anymore for files it stores itself
     user_id: str  # user id of the owner
+    content_type: Optional[str] = None  # mime type detected at upload
 
     @classmethod
     def from_odm(cls, obj):
         """
-        Convert from DB document model to FileMeta model
+        Convert from DB document model to FileMeta model.
+        Documents from DB already have the right types, so the model is built without validation.
+        Fields left out by a projection are None
         Args:
             obj: ODM taken directly from DB
 
         Returns:
             FileMeta object
         """
-        return FileMeta(
+        metadata = obj.get("metadata", {})
+        return cls.construct(
             id=str(obj["_id"]),
-            filename=obj["filename"],
-            uploaded_at=obj["uploadDate"],
-            size=obj["length"],
-            md5=obj["md5"],
-            user_id=obj["metadata"]["user_id"],
+            filename=obj.get("filename"),
+            uploaded_at=obj.get("uploadDate"),
+            size=obj.get("length"),
+            md5=obj.get("md5"),
+            user_id=metadata.get("user_id"),
+            content_type=metadata.get("content_type"),
         )
 
+    @classmethod
+    def projection(cls, fields: Iterable[str]) -> dict:
+        """
+        Projection reading only the DB fields of the given fields from a document
+        Args:
+            fields: fields of the model
+
+        Returns:
+            projection for `find()`
+        """
+        return {ODM_FIELDS[field]: 1 for field in fields}
+
     @classmethod
     def to_odm(cls, obj):
         """
@@ -46,5 +76,5 @@ class FileMeta(BaseModel):
             "uploadDate": obj.uploaded_at,
             "length": obj.size,
             "md5": obj.md5,
-            "metadata": {"user_id": obj.user_id},
+            "metadata": {"user_id": obj.user_id, "content_type": obj.content_type},
         }
@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+
+
+class StorageStats(BaseModel):
+    files: int  # number of stored files
+    logical_bytes: int  # total size of all files as uploaded
+    unique_bytes: int  # total size of the distinct contents after deduplication
+    stored_bytes: int  # bytes actually taken up by the chunks after deduplication and compression
+
+    @property
+    def dedup_saved_bytes(self) -> int:
+        return self.logical_bytes - self.unique_bytes
+
+    @property
+    def compression_saved_bytes(self) -> int:
+        return self.unique_bytes - self.stored_bytes
@@ -0,0 +1,61 @@
+from datetime import datetime
+from typing import Dict
+
+from pydantic import BaseModel
+
+
+class UploadPart(BaseModel):
+    size: int  # part size in byte
+    md5: str  # md5 hashing of the part
+
+
+class UploadSession(BaseModel):
+    id: str
+    filename: str
+    size: int  # declared total file size in byte
+    part_size: int  # size of every part except the last one
+    chunk_size: int  # GridFS chunk size of the file being assembled
+    codec: str = "none"  # codec the chunks are encoded with
+    user_id: str  # user id of the owner
+    expires_at: datetime
+    parts: Dict[int, UploadPart] = {}  # received parts by part number
+
+    @property
+    def part_count(self) -> int:
+        """
+        Total number of parts needed to complete the file
+        """
+        return -(-self.size // self.part_size)
+
+    def expected_part_size(self, part_number: int) -> int:
+        """
+        Size the given part should have. Every part is full size except the last one.
+        Args:
+            part_number: 0-based part number
+
+        Returns:
+            expected size of the part in bytes
+        """
+        return min(self.part_size, self.size - part_number * self.part_size)
+
+    @classmethod
+    def from_odm(cls, obj):
+        """
+        Convert from DB document model to UploadSession model
+        Args:
+            obj: ODM taken directly from DB
+
+        Returns:
+            UploadSession object
+        """
+        return UploadSession(
+            id=str(obj["_id"]),
+            filename=obj["filename"],
+            size=obj["length"],
+            part_size=obj["partSize"],
+            chunk_size=obj["chunkSize"],
+            codec=obj.get("codec", "none"),
+            user_id=obj["user_id"],
+            expires_at=obj["expires_at"],
+            parts={int(n): UploadPart(**part) for n, part in obj.get("parts", {}).items()},
+        )
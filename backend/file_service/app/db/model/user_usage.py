@@ -0,0 +1,29 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class UserUsage(BaseModel):
+    user_id: str
+    files: int  # number of files in the user's storage
+    bytes: int  # total size of the files in the user's storage
+    reserved: int = 0  # bytes reserved by uploads in progress
+    allowance: Optional[int] = None  # storage allowance in bytes. No limit if not known
+
+    @classmethod
+    def from_odm(cls, obj):
+        """
+        Convert from DB document model to UserUsage model
+        Args:
+            obj: ODM taken directly from DB
+
+        Returns:
+            UserUsage object
+        """
+        return UserUsage(
+            user_id=obj["_id"],
+            files=obj["files"],
+            bytes=obj["bytes"],
+            reserved=obj.get("reserved", 0),
+            allowance=obj.get("allowance"),
+        )
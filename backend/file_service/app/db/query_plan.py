@@ -0,0 +1,111 @@
+"""
+Query plan verification for test runs.
+Every query sent to DB is explained on a separate connection, and plans that scan the whole collection or sort in
+memory are recorded, so a query shape without a matching index in `db/indexes.py` fails the tests.
+Enabled with `QUERY_PLAN_CHECK` setting. Never use it in production, as it doubles the round trips of every query.
+"""
+import threading
+from typing import Iterator, List, Optional
+
+from pymongo import MongoClient, monitoring
+
+# stages that mean no index serves the query
+BAD_STAGES = {"COLLSCAN", "SORT"}
+# commands that take a query filter, and where to find it in the command
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "findAndModify": "query",
+    "distinct": "query",
+}
+
+
+def plan_stages(explain: dict) -> Iterator[str]:
+    """
+    All the stage names of the winning plans in an explain output, however deep they're nested.
+    Covers the output of find and aggregate, and of both classic and slot based engines
+    Args:
+        explain: explain command output
+
+    Returns:
+        stream of stage names
+    """
+    stack = [explain]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            for key, value in node.items():
+                if key in ("rejectedPlans", "executionStats"):
+                    continue
+                if key == "stage" and isinstance(value, str):
+                    yield value
+                else:
+                    stack.append(value)
+
+
+def query_filter(command_name: str, command: dict) -> Optional[dict]:
+    """
+    Query filter of a command
+    Args:
+        command_name: name of the command
+        command: the command sent to DB
+
+    Returns:
+        the filter, or None if the command doesn't query documents
+    """
+    if command_name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[command_name]) or {}
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or [{}]
+        return pipeline[0].get("$match", {})
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        return statements[0].get("q") or {}
+    return None
+
+
+class QueryPlanChecker(monitoring.CommandListener):
+    """
+    Command listener explaining every query, to be registered on the client under test.
+    Queries without a filter read the whole collection on purpose, such as service wide statistics, and aren't checked.
+    """
+
+    def __init__(self, mongodb_url: str):
+        # a client of its own, so the explain commands aren't checked in turn
+        self.client = MongoClient(mongodb_url)
+        self.violations: List[str] = []
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        query = query_filter(event.command_name, event.command)
+        if not query:
+            return
+        # session and cluster fields can't be sent again on another connection
+        command = {key: value for key, value in event.command.items() if key != "lsid" and not key.startswith("$")}
+        # only a single write statement can be explained. Statements of a bulk write have the same shape
+        for statements in ("updates", "deletes"):
+            if statements in command:
+                command[statements] = command[statements][:1]
+        try:
+            explain = self.client[event.database_name].command("explain", command, verbosity="queryPlanner")
+        except Exception as e:
+            self._record(f"{event.command_name} {query}: explain failed: {e}")
+            return
+        bad = BAD_STAGES.intersection(plan_stages(explain))
+        if bad:
+            self._record(f"{event.command_name} on {command[event.command_name]} {query}: {', '.join(sorted(bad))}")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+    def _record(self, violation: str) -> None:
+        with self._lock:
+            self.violations.append(violation)
+
+    def close(self) -> None:
+        self.client.close()
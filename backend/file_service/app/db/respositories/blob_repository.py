@@ -0,0 +1,159 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from db.chunks import delete_chunks
+from db.respositories.base_repository import BaseRepository
+from utils.chunk_codec import ChunkCodec, get_codec
+
+
+def get_blob_id(file_doc: dict) -> Any:
+    """
+    Get the id of the chunks holding the data of a file entry.
+    Files stored before deduplication don't have a blob and own the chunks under their own id.
+    Args:
+        file_doc: file entry document from `fs.files`
+
+    Returns:
+        `files_id` of the chunks of the file
+    """
+    return file_doc.get("metadata", {}).get("blob_id", file_doc["_id"])
+
+
+def get_file_codec(file_doc: dict) -> ChunkCodec:
+    """
+    Get the codec the chunks of a file entry are encoded with
+    Args:
+        file_doc: file entry document from `fs.files`
+
+    Returns:
+        the codec. Files stored before chunk codecs have raw chunks
+    """
+    return get_codec(file_doc.get("metadata", {}).get("codec"))
+
+
+class BlobRepository(BaseRepository):
+    """
+    Repository for deduplicated file data.
+    The same content is stored only once as a blob, which is identified by the SHA-256 hash of the content.
+    A blob's chunks are kept in `fs.chunks` under the blob id, and the number of file entries referring to the blob is
+    counted in `fs.blobs` collection. A blob is removed together with its chunks when nothing refers to it anymore.
+    """
+
+    @property
+    def blobs(self):
+        return self.db.client["file_service"]["fs.blobs"]
+
+    @property
+    def chunks(self):
+        return self.db.client["file_service"]["fs.chunks"]
+
+    async def add_blob(
+        self,
+        chunks_id: Any,
+        sha256: str,
+        length: int,
+        chunk_size: int,
+        codec: str = ChunkCodec.name,
+        stored_length: Optional[int] = None,
+    ) -> dict:
+        """
+        Register newly written chunks as a blob, or refer to the existing blob with the same content instead.
+        The caller is responsible for deleting the new chunks if the existing blob is returned.
+        Args:
+            chunks_id: `files_id` of the newly written chunks
+            sha256: SHA-256 hash of the content
+            length: size of the content in bytes
+            chunk_size: size of the chunks
+            codec: name of the codec the chunks are encoded with
+            stored_length: number of bytes the chunks take up after encoding. Same as the length if not given
+
+        Returns:
+            blob document the content is stored in, with its reference already counted
+        """
+        while True:
+            blob = await self.blobs.find_one_and_update(
+                {"sha256": sha256}, {"$inc": {"refcount": 1}}, return_document=ReturnDocument.AFTER
+            )
+            if blob:
+                return blob
+            blob = {
+                "_id": chunks_id,
+                "sha256": sha256,
+                "length": length,
+                "chunkSize": chunk_size,
+                "codec": codec,
+                "storedLength": length if stored_length is None else stored_length,
+                "refcount": 1,
+                "created_at": datetime.utcnow(),
+            }
+            try:
+                await self.blobs.insert_one(blob)
+                return blob
+            except DuplicateKeyError:
+                # the same content has just been registered by a concurrent upload. Refer to that one
+                continue
+
+    async def release_blob(self, blob_id: Any) -> None:
+        """
+        Drop a reference to a blob. The blob and its chunks are deleted once it is not referred to anymore.
+        Args:
+            blob_id: id of the blob to release
+        """
+        blob = await self.blobs.find_one_and_update(
+            {"_id": blob_id}, {"$inc": {"refcount": -1}}, return_document=ReturnDocument.AFTER
+        )
+        if blob is None:
+            # chunks that were never registered as a blob belong to a single file only
+            await delete_chunks(self.chunks, blob_id)
+            return
+        if blob["refcount"] > 0:
+            return
+        # a concurrent upload may have referred to the blob again in the meantime, in which case it's kept
+        result = await self.blobs.delete_one({"_id": blob_id, "refcount": {"$lte": 0}})
+        if result.deleted_count:
+            await delete_chunks(self.chunks, blob_id)
+
+    async def release_files(self, file_docs: List[dict]) -> List[Any]:
+        """
+        Release the data of many deleted file entries at once.
+        References are dropped with a single bulk write, and the blobs nothing refers to anymore are removed with a
+        single query, instead of a few round trips per file. Their chunks are left to the caller, so they can be
+        deleted at a pace that suits it.
+        Args:
+            file_docs: the deleted file entry documents
+
+        Returns:
+            `files_id` of the chunks nothing refers to anymore
+        """
+        references = Counter(get_blob_id(doc) for doc in file_docs)
+        if not references:
+            return []
+        blob_ids = list(references)
+        await self.blobs.bulk_write(
+            [UpdateOne({"_id": blob_id}, {"$inc": {"refcount": -count}}) for blob_id, count in references.items()],
+            ordered=False,
+        )
+        registered = {}
+        async for blob in self.blobs.find({"_id": {"$in": blob_ids}}, {"refcount": 1}):
+            registered[blob["_id"]] = blob["refcount"]
+        # chunks that were never registered as a blob belong to a single file only
+        unreferenced = [blob_id for blob_id in blob_ids if blob_id not in registered]
+        released = [blob_id for blob_id, refcount in registered.items() if refcount <= 0]
+        if released:
+            # a concurrent upload may have referred to a blob again in the meantime, in which case it's kept
+            await self.blobs.delete_many({"_id": {"$in": released}, "refcount": {"$lte": 0}})
+            kept = {blob["_id"] async for blob in self.blobs.find({"_id": {"$in": released}}, {"_id": 1})}
+            unreferenced += [blob_id for blob_id in released if blob_id not in kept]
+        return unreferenced
+
+    async def release_file(self, file_doc: dict) -> None:
+        """
+        Release the data of a deleted file entry
+        Args:
+            file_doc: the deleted file entry document
+        """
+        await self.release_blob(get_blob_id(file_doc))
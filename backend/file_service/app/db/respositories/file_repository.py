@@ -1,56 +1,227 @@
-from typing import AsyncIterable, Optional
+import hashlib
+from datetime import datetime
+from typing import AsyncIterable, Iterable, Optional, List
 
 import pymongo
 from bson import ObjectId
 from fastapi import UploadFile
-from motor.motor_asyncio import AsyncIOMotorGridOut
+from gridfs import DEFAULT_CHUNK_SIZE
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 
+from api.models.search_mode import SearchMode
+from config import settings
+from db.chunks import write_chunks, delete_chunks, read_chunks
+from db.file_download import FileDownload
 from db.model.file_meta import FileMeta
+from db.model.storage_stats import StorageStats
+from db.model.user_usage import UserUsage
 from db.respositories.base_repository import BaseRepository
+from db.respositories.blob_repository import BlobRepository, get_blob_id, get_file_codec
+from db.respositories.metadata_version_repository import MetadataVersionRepository
+from db.respositories.search_repository import SearchRepository
+from db.respositories.trash_repository import TrashRepository
+from db.respositories.usage_repository import UsageRepository
+from utils.chunk_codec import ChunkCodec
+from utils.content_cache import content_cache
+from utils.metadata_cache import metadata_cache
+from utils.page_cursor import PageCursor, sort_keys, SORT_FIELDS
+from utils.upload_pipeline import UploadPipeline, sniff_content_type, SNIFF_SIZE
 
 
 class FileRepository(BaseRepository):
-    async def add_file(self, storage_user_id: str, file: UploadFile) -> Optional[FileMeta]:
+    @property
+    def files(self):
+        return self.db.client["file_service"]["fs.files"]
+
+    @property
+    def chunks(self):
+        return self.db.client["file_service"]["fs.chunks"]
+
+    async def add_file(
+        self, storage_user_id: str, file: UploadFile, size_limit: int = settings.FILE_SIZE_LIMIT
+    ) -> Optional[FileMeta]:
         """
-        Add file to database and tag it with the given user id to mark its ownership
+        Add file to database and tag it with the given user id to mark its ownership.
+        The file is piped into GridFS chunks one chunk at a time, so memory usage stays the same regardless of the file
+        size. Size check, checksums and content type detection are done in the same single pass over the file.
+        Compressible files are compressed chunk by chunk with `CHUNK_CODEC` codec.
+        If the same content is already stored, the new file refers to it and the written chunks are dropped.
         Args:
             storage_user_id: the owner of the target file
             file: file to save
+            size_limit: maximum number of bytes the file may have
 
         Returns:
-            document id of the saved file, None if failed saving
+            metadata of the saved file
         """
-        existing_file = await self.db.client["file_service"]["fs.files"].find_one(
-            {"filename": file.filename, "metadata": {"user_id": storage_user_id}}
-        )
-        if existing_file:
+        pipeline = UploadPipeline(file, size_limit=size_limit, preferred_codec=settings.CHUNK_CODEC)
+        chunks_id = ObjectId()
+        try:
+            written = await write_chunks(
+                self.chunks, chunks_id, pipeline.chunks(), DEFAULT_CHUNK_SIZE, encode=pipeline.encode
+            )
+        except Exception:
+            # some chunks may already be written at this point, so they have to be cleaned up
+            await delete_chunks(self.chunks, chunks_id)
+            raise
+        try:
+            return await self.add_file_entry(
+                storage_user_id=storage_user_id,
+                filename=file.filename,
+                chunks_id=chunks_id,
+                length=written.length,
+                chunk_size=DEFAULT_CHUNK_SIZE,
+                md5=pipeline.md5,
+                sha256=pipeline.sha256,
+                content_type=pipeline.content_type,
+                codec=pipeline.codec.name,
+                stored_length=written.stored_length,
+            )
+        except FileExistsError:
+            await delete_chunks(self.chunks, chunks_id)
+            raise
+
+    async def add_file_entry(
+        self,
+        storage_user_id: str,
+        filename: str,
+        chunks_id: ObjectId,
+        length: int,
+        chunk_size: int,
+        md5: str,
+        sha256: str,
+        content_type: str,
+        codec: str,
+        stored_length: int,
+    ) -> FileMeta:
+        """
+        Add the file entry for chunks that are already written, deduplicating the content against stored blobs.
+        The entry is added before the content is deduplicated, so it always points to complete chunks.
+        Duplicate filenames are rejected by the unique (owner, filename) index, in which case the chunks are untouched.
+        Args:
+            storage_user_id: the owner of the file
+            filename: filename of the file
+            chunks_id: `files_id` of the written chunks. Also used as the id of the entry
+            length: size of the file in bytes
+            chunk_size: size of the chunks
+            md5: md5 hashing of the file
+            sha256: SHA-256 hashing of the file, which identifies the content
+            content_type: mime type of the file
+            codec: name of the codec the chunks are encoded with
+            stored_length: number of bytes the chunks take up after encoding
+
+        Returns:
+            metadata of the added file
+        """
+        doc = {
+            "_id": chunks_id,
+            "length": length,
+            "chunkSize": chunk_size,
+            "uploadDate": datetime.utcnow(),
+            "filename": filename,
+            "md5": md5,
+            "metadata": {
+                "user_id": storage_user_id,
+                "sha256": sha256,
+                "content_type": content_type,
+                "blob_id": chunks_id,
+                "codec": codec,
+            },
+        }
+        try:
+            await self.files.insert_one(doc)
+        except DuplicateKeyError:
             raise FileExistsError("File with the same name exists")
-        file_id = await self.db.grid_client.upload_from_stream(
-            filename=file.filename,
-            source=await file.read(),
-            metadata={"user_id": storage_user_id},
-        )
-        uploaded_file = await self.db.client["file_service"]["fs.files"].find_one({"_id": file_id})
-        return FileMeta.from_odm(uploaded_file)
+        # chunks_id may come from the caller, so never let anything cached under it outlive the new entry
+        content_cache.invalidate(str(chunks_id))
+        metadata_cache.invalidate(storage_user_id, filename)
+        await UsageRepository(self.db).add(storage_user_id, files=1, size=length)
+        await SearchRepository(self.db).add(chunks_id, storage_user_id, filename)
+
+        blob = await BlobRepository(self.db).add_blob(chunks_id, sha256, length, chunk_size, codec, stored_length)
+        if blob["_id"] != chunks_id:
+            # the same content is already stored. Switch over to it and drop the copy
+            await self.files.update_one(
+                {"_id": chunks_id},
+                {
+                    "$set": {
+                        "metadata.blob_id": blob["_id"],
+                        "metadata.codec": blob.get("codec", ChunkCodec.name),
+                        "chunkSize": blob["chunkSize"],
+                    }
+                },
+            )
+            await delete_chunks(self.chunks, chunks_id)
+        # after the entry is final, so no worker caches it under the new version before it's switched over
+        await MetadataVersionRepository(self.db).bump(storage_user_id)
+        return FileMeta.from_odm(doc)
+
+    async def find_file_entry(self, storage_user_id: str, filename: str) -> Optional[dict]:
+        """
+        Look up the entry of a file by its owner and filename, through the metadata cache.
+        The metadata version of the storage is read first, and a cached entry is served only if it's of the same
+        version. Otherwise the entry is read from DB and cached, also when the file doesn't exist.
+        Args:
+            storage_user_id: the owner of the file
+            filename: filename of the file
+
+        Returns:
+            the file entry, or None if not found. Must not be changed, as it may be shared with the cache
+        """
+        if not metadata_cache.enabled:
+            return await self.files.find_one({"filename": filename, "metadata.user_id": storage_user_id})
+        version = await MetadataVersionRepository(self.db).get(storage_user_id)
+        cached, doc = metadata_cache.get(storage_user_id, filename, version)
+        if cached:
+            return doc
+        doc = await self.files.find_one({"filename": filename, "metadata.user_id": storage_user_id})
+        metadata_cache.put(storage_user_id, filename, version, doc)
+        return doc
 
-    async def download_file(self, storage_user_id: str, filename: str) -> Optional[bytes]:
+    async def lookup_files(self, storage_user_id: str, filenames: List[str]) -> List[Optional[FileMeta]]:
         """
-        Download file with the given filename and user id.
+        Look up many files of a storage by filename at once.
+        Entries are served from the metadata cache where it can, and the rest are read with a single query on the
+        (owner, filename) index and cached, so checking a whole directory is one round trip per batch of names.
+        Args:
+            storage_user_id: the owner of the files
+            filenames: filenames to look up. Keep them to `LOOKUP_BATCH_SIZE` or so, as they make up one query
+
+        Returns:
+            metadata of each file in the order of the filenames, None for files that don't exist
+        """
+        version = await MetadataVersionRepository(self.db).get(storage_user_id) if metadata_cache.enabled else 0
+        docs = {}
+        for filename in filenames:
+            cached, doc = metadata_cache.get(storage_user_id, filename, version)
+            if cached:
+                docs[filename] = doc
+        missing = list({filename for filename in filenames if filename not in docs})
+        if missing:
+            found = {}
+            async for doc in self.files.find({"metadata.user_id": storage_user_id, "filename": {"$in": missing}}):
+                found[doc["filename"]] = doc
+            for filename in missing:
+                docs[filename] = found.get(filename)
+                metadata_cache.put(storage_user_id, filename, version, docs[filename])
+        return [FileMeta.from_odm(docs[filename]) if docs[filename] else None for filename in filenames]
+
+    async def download_file(self, storage_user_id: str, filename: str) -> FileDownload:
+        """
+        Open file with the given filename and user id for download.
+        Only the file entry is read here. The data is not read until it's streamed with `FileDownload.stream()`.
         Args:
             storage_user_id: the owner id of target file
             filename: filename of the file to download
 
         Returns:
-            binary data of the file
+            the file to stream
         """
-        doc = await self.db.client["file_service"]["fs.files"].find_one(
-            {"filename": filename, "metadata": {"user_id": storage_user_id}}
-        )
-        if doc:
-            result: AsyncIOMotorGridOut = await self.db.grid_client.open_download_stream(doc["_id"])
-            return await result.read()
-        else:
+        doc = await self.find_file_entry(storage_user_id, filename)
+        if not doc:
             raise FileNotFoundError("File not found")
+        return FileDownload(self.chunks, doc, cache=content_cache)
 
     async def read_file_info(self, storage_user_id: str, filename: str) -> Optional[FileMeta]:
         """
@@ -62,9 +233,7 @@ class FileRepository(BaseRepository):
         Returns:
             metadata of the target file if found. None if not found.
         """
-        result = await self.db.client["file_service"]["fs.files"].find_one(
-            {"filename": filename, "metadata": {"user_id": storage_user_id}}
-        )
+        result = await self.find_file_entry(storage_user_id, filename)
         if result:
             return FileMeta.from_odm(result)
         else:
@@ -77,100 +246,216 @@ class FileRepository(BaseRepository):
         limit: int,
         sort_by: str = "uploadDate",
         desc: bool = True,
+        after: Optional[PageCursor] = None,
+        fields: Optional[Iterable[str]] = None,
     ) -> AsyncIterable[FileMeta]:
         """
         Get the list of stored files' metadata using the given filters.
-        This will most likely to be used for pagination.
+        This will most likely to be used for pagination. Pages after the first one should be fetched with a cursor
+        made from the last file of the previous page, so they start with an index seek instead of skipping files.
+        Ties in the sort field are broken by id, so the order is stable across pages.
         Args:
             storage_user_id: the owner of the files
-            offset: number of docs to skip from the head of list
+            offset: number of docs to skip from the head of list, or from the cursor if given
             limit: maximum number of docs to return
             sort_by: field to sort the list by. eg. filename, length
             desc: sorting direction. True if to sort by descending order
+            after: cursor to list the files after. Its sorting overrides the given one
+            fields: fields of the models to read from DB. All of them if None. The sort field is always read
 
         Returns:
             async stream of metadata models
         """
+        if after is not None:
+            sort_by, desc = after.sort_by, after.desc
         # default sorting field to upload date if not valid
-        if sort_by not in ["filename", "length", "uploadDate"]:
+        if sort_by not in SORT_FIELDS:
             sort_by = "uploadDate"
 
-        if desc:
-            sort_dir = pymongo.DESCENDING
-        else:
-            sort_dir = pymongo.ASCENDING
-
+        query = {"metadata.user_id": storage_user_id}
+        if after is not None:
+            query.update(after.query())
+        projection = {**FileMeta.projection(fields), sort_by: 1} if fields is not None else None
         cursor = (
             self.db.client["file_service"]["fs.files"]
-            .find({"metadata": {"user_id": storage_user_id}})
+            .find(query, projection)
             .skip(offset)
             .limit(limit)
-            .sort(sort_by, sort_dir)
+            .sort(sort_keys(sort_by, desc))
         )
         async for doc in cursor:
             yield FileMeta.from_odm(doc)
 
+    async def search_files(
+        self,
+        storage_user_id: str,
+        pattern: str,
+        mode: SearchMode = SearchMode.AUTO,
+        limit: int = 10,
+        fields: Optional[Iterable[str]] = None,
+    ) -> List[FileMeta]:
+        """
+        Search the list of stored files' metadata by filename, through the trigram index of the filenames.
+        Args:
+            storage_user_id: the owner of the files
+            pattern: text to search for, or a regex in regex mode
+            mode: how the pattern is matched. Regex if the pattern looks like one, substring otherwise by default
+            limit: maximum number of docs to return. 10 by default
+            fields: fields of the models to read from DB. All of them if None
+
+        Raises:
+            SearchError: if a regex is invalid or takes too long
+
+        Returns:
+            metadata models, best match first
+        """
+        return await SearchRepository(self.db).search(storage_user_id, pattern, mode, limit, fields)
+
     async def search_files_by_regex(self, storage_user_id: str, pattern: str, limit: int = 10):
         """
         Search the list of stored files' metadata by regex.
+        A regex can't use an index, so the search is stopped after `SEARCH_REGEX_MAX_TIME_MS`.
         Args:
             storage_user_id: the owner of the files
             pattern: regex pattern
             limit: maximum number of docs to return. 10 by default
 
+        Raises:
+            SearchError: if the regex is invalid or takes too long
+
         Returns:
             async stream of metadata models
         """
-        cursor = (
-            self.db.client["file_service"]["fs.files"]
-            .find(
-                {
-                    "filename": {"$regex": pattern},
-                    "metadata": {"user_id": storage_user_id},
-                }
-            )
-            .limit(limit)
-        )
-        async for doc in cursor:
-            yield FileMeta.from_odm(doc)
+        for meta in await self.search_files(storage_user_id, pattern, SearchMode.REGEX, limit):
+            yield meta
+
+    async def get_usage(self, storage_user_id: str) -> UserUsage:
+        """
+        Get both the number of files and the storage usage of the user, from the materialized counters of the user
+        Args:
+            storage_user_id: the owner of the files
+
+        Returns:
+            usage of the user's storage
+        """
+        return await UsageRepository(self.db).get(storage_user_id)
 
     async def get_files_count(self, storage_user_id: str) -> int:
         """
-        Get the total number of files owned by the user
+        Get the total number of files owned by the user, from the materialized counter of the user
         Args:
             storage_user_id: the owner of the files
 
         Returns:
             Awaitable total number of files stored in DB
         """
-        return await (
-            self.db.client["file_service"]["fs.files"].count_documents({"metadata": {"user_id": storage_user_id}})
-        )
+        return (await self.get_usage(storage_user_id)).files
 
     async def get_storage_usage(self, storage_user_id: str) -> int:
         """
-        Get the total size of the given user's storage usage.
+        Get the total size of the given user's storage usage, from the materialized counter of the user
         Args:
             storage_user_id: user id to get the usage of
 
         Returns:
             Awaitable sum of all saved files' size in bytes
         """
-        cursor = self.db.client["file_service"]["fs.files"].aggregate(
+        return (await self.get_usage(storage_user_id)).bytes
+
+    async def get_storage_stats(self) -> StorageStats:
+        """
+        Get the storage statistics of the whole service, showing how many bytes deduplication and compression save.
+        Files stored before deduplication are counted as they are.
+        Returns:
+            storage statistics
+        """
+        stats = StorageStats(files=0, logical_bytes=0, unique_bytes=0, stored_bytes=0)
+        cursor = self.files.aggregate(
             [
-                {"$match": {"metadata": {"user_id": storage_user_id}}},
-                {"$group": {"_id": "null", "total_sum": {"$sum": "$length"}}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "files": {"$sum": 1},
+                        "logical_bytes": {"$sum": "$length"},
+                        "legacy_bytes": {
+                            "$sum": {"$cond": [{"$ifNull": ["$metadata.blob_id", False]}, 0, "$length"]}
+                        },
+                    }
+                }
             ]
         )
-        try:
-            result = await cursor.next()
-            return result["total_sum"]
-        except StopAsyncIteration:
-            return 0
+        async for result in cursor:
+            stats.files = result["files"]
+            stats.logical_bytes = result["logical_bytes"]
+            stats.unique_bytes = stats.stored_bytes = result["legacy_bytes"]
+        cursor = BlobRepository(self.db).blobs.aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": None,
+                        "unique_bytes": {"$sum": "$length"},
+                        "stored_bytes": {"$sum": {"$ifNull": ["$storedLength", "$length"]}},
+                    }
+                }
+            ]
+        )
+        async for result in cursor:
+            stats.unique_bytes += result["unique_bytes"]
+            stats.stored_bytes += result["stored_bytes"]
+        return stats
+
+    async def backfill_metadata(self, batch_size: int = 500) -> int:
+        """
+        Fill in content type and md5 hashing of files stored before they were recorded at upload, so downloads never
+        have to look into the file data for them.
+        Files are updated in bulk one batch at a time. Content types are sniffed from the first chunks of the whole
+        batch, read with a single query. The whole data is read only for files missing md5 hashing.
+        Args:
+            batch_size: number of files updated at once
+
+        Returns:
+            number of updated files
+        """
+        updated = 0
+        last_id = None
+        query = {"$or": [{"metadata.content_type": None}, {"md5": None}]}
+        while True:
+            page_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+            docs = await self.files.find(page_query).sort("_id", pymongo.ASCENDING).to_list(length=batch_size)
+            if not docs:
+                return updated
+            last_id = docs[-1]["_id"]
+
+            missing_type = [doc for doc in docs if not doc["metadata"].get("content_type")]
+            first_chunks = {}
+            if missing_type:
+                cursor = self.chunks.find({"files_id": {"$in": [get_blob_id(doc) for doc in missing_type]}, "n": 0})
+                async for chunk in cursor:
+                    first_chunks[chunk["files_id"]] = chunk["data"]
+
+            updates = []
+            for doc in docs:
+                fields = {}
+                if not doc["metadata"].get("content_type"):
+                    head = first_chunks.get(get_blob_id(doc), b"")
+                    head = (await get_file_codec(doc).decode_async(head))[:SNIFF_SIZE] if head else b""
+                    fields["metadata.content_type"] = sniff_content_type(head, doc["filename"])
+                if not doc.get("md5"):
+                    md5 = hashlib.md5()
+                    async for chunk in read_chunks(self.chunks, get_blob_id(doc)):
+                        md5.update(await get_file_codec(doc).decode_async(chunk["data"]))
+                    fields["md5"] = md5.hexdigest()
+                updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+            await self.files.bulk_write(updates, ordered=False)
+            for storage_user_id in {doc["metadata"]["user_id"] for doc in docs}:
+                await MetadataVersionRepository(self.db).bump(storage_user_id)
+            updated += len(updates)
 
     async def delete_file(self, storage_user_id: str, filename: str) -> bool:
         """
-        Delete file with the given owner id and filename
+        Delete file with the given owner id and filename.
+        The entry is moved to the trash as a tombstone and the data is left to the garbage collector, so deleting
+        doesn't wait for the chunks to be removed, however large the file is.
         Args:
             storage_user_id: the owner of the target file
             filename: the filename of a file to delete
@@ -178,9 +463,56 @@ class FileRepository(BaseRepository):
         Returns:
             True if successful, False if failed
         """
-        try:
-            meta_data = await self.read_file_info(storage_user_id, filename)
-        except FileNotFoundError:
+        doc = await self.files.find_one({"filename": filename, "metadata.user_id": storage_user_id})
+        if not doc or not await TrashRepository(self.db).add([doc]):
+            return False
+        result = await self.files.delete_one({"_id": doc["_id"]})
+        if not result.deleted_count:
+            await TrashRepository(self.db).remove([doc["_id"]])
             return False
-        await self.db.grid_client.delete(ObjectId(meta_data.id))
+        await MetadataVersionRepository(self.db).bump(storage_user_id)
+        metadata_cache.invalidate(storage_user_id, filename)
+        content_cache.invalidate(str(doc["_id"]))
+        await UsageRepository(self.db).add(storage_user_id, files=-1, size=-doc["length"])
+        await SearchRepository(self.db).remove(doc["_id"])
         return True
+
+    async def delete_files(self, storage_user_id: str, filenames: List[str], batch_size: int = 1000) -> List[bool]:
+        """
+        Delete many files of a storage at once.
+        Each batch of entries is read and moved to the trash with a query each, and their data is left to the garbage
+        collector like with `delete_file()`. Usage counters are updated once for all the files.
+        Args:
+            storage_user_id: the owner of the files
+            filenames: filenames of the files to delete
+            batch_size: number of files deleted at once
+
+        Returns:
+            whether each file was deleted, in the order of the filenames. False if it wasn't found
+        """
+        names = list(dict.fromkeys(filenames))
+        deleted_docs = []
+        for start in range(0, len(names), batch_size):
+            batch = names[start : start + batch_size]
+            docs = await self.files.find({"metadata.user_id": storage_user_id, "filename": {"$in": batch}}).to_list(
+                length=None
+            )
+            # files deleted concurrently already have their tombstones, and are left out
+            ids = await TrashRepository(self.db).add(docs)
+            if not ids:
+                continue
+            await self.files.delete_many({"_id": {"$in": ids}})
+            await SearchRepository(self.db).remove_many(ids)
+            await MetadataVersionRepository(self.db).bump(storage_user_id)
+            deleted_ids = set(ids)
+            deleted_docs += [doc for doc in docs if doc["_id"] in deleted_ids]
+
+        deleted = {doc["filename"] for doc in deleted_docs}
+        if deleted_docs:
+            await UsageRepository(self.db).add(
+                storage_user_id, files=-len(deleted_docs), size=-sum(doc["length"] for doc in deleted_docs)
+            )
+            for doc in deleted_docs:
+                metadata_cache.invalidate(storage_user_id, doc["filename"])
+                content_cache.invalidate(str(doc["_id"]))
+        return [filename in deleted for filename in filenames]
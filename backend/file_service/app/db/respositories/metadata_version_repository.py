@@ -0,0 +1,46 @@
+from pymongo import ReturnDocument
+
+from db.respositories.base_repository import BaseRepository
+from utils.metadata_cache import metadata_cache
+
+
+class MetadataVersionRepository(BaseRepository):
+    """
+    Repository for the metadata version of each user's storage.
+    The version is a counter in `metadata_versions` collection, moved after every write to the file entries of the
+    storage. Cached file entries are stamped with the version read before them, so they're known to be stale once
+    the version moves. Versions are cached by the metadata cache for a short while, so the staleness is bounded by
+    `METADATA_VERSION_TTL_SECONDS` for writes of other workers, and none for writes of this one.
+    """
+
+    @property
+    def versions(self):
+        return self.db.client["file_service"]["metadata_versions"]
+
+    async def get(self, storage_user_id: str) -> int:
+        """
+        Get the metadata version of a user's storage, from the metadata cache if it's there
+        Args:
+            storage_user_id: the owner of the storage
+
+        Returns:
+            the version. 0 if the storage was never changed
+        """
+        version = metadata_cache.get_version(storage_user_id)
+        if version is None:
+            doc = await self.versions.find_one({"_id": storage_user_id})
+            version = doc["version"] if doc else 0
+            metadata_cache.put_version(storage_user_id, version)
+        return version
+
+    async def bump(self, storage_user_id: str) -> None:
+        """
+        Move the metadata version of a user's storage. Call it after the file entries are written
+        Args:
+            storage_user_id: the owner of the storage
+        """
+        doc = await self.versions.find_one_and_update(
+            {"_id": storage_user_id}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        # this worker sees its own write right away
+        metadata_cache.put_version(storage_user_id, doc["version"])
@@ -0,0 +1,157 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from db.respositories.base_repository import BaseRepository
+from db.respositories.usage_repository import UsageRepository
+from utils.exceptions import QuotaExceededError
+
+
+class QuotaRepository(BaseRepository):
+    """
+    Repository for storage allowances and the space reserved by uploads in progress.
+    Both are kept in the usage document of each user in `user_usage` collection, next to the usage counters. An upload
+    is checked against the allowance and reserves its declared size with a single conditional `$inc`, so concurrent
+    uploads can't overshoot the allowance together. The reservation is released once the upload ends, by which time a
+    stored file is counted in the usage counters instead.
+    Allowances are pushed by the user service whenever they change, so uploads never have to ask it. A push that failed
+    is made up for by the allowance in the uploader's token, which replaces the stored one if it's newer.
+    """
+
+    @property
+    def usage(self):
+        return self.db.client["file_service"]["user_usage"]
+
+    @property
+    def upload_sessions(self):
+        return self.db.client["file_service"]["upload_sessions"]
+
+    async def set_allowance(self, storage_user_id: str, allowance: int, as_of: Optional[datetime] = None) -> None:
+        """
+        Set the storage allowance of a user
+        Args:
+            storage_user_id: the owner of the storage
+            allowance: storage allowance in bytes
+            as_of: when the allowance was read by the user service, such as the issue date of the token carrying it.
+                It only replaces an allowance set before then. Set as of now if None
+        """
+        # make sure there are counters to check the allowance against
+        await UsageRepository(self.db).get(storage_user_id)
+        query = {"_id": storage_user_id}
+        if as_of is None:
+            as_of = datetime.utcnow()
+        else:
+            if as_of.tzinfo:
+                # dates of tokens are parsed as aware, the ones in DB are naive UTC
+                as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+            query["$or"] = [{"allowance_set_at": {"$exists": False}}, {"allowance_set_at": {"$lt": as_of}}]
+        await self.usage.update_one(query, {"$set": {"allowance": allowance, "allowance_set_at": as_of}})
+
+    async def reserve(
+        self,
+        storage_user_id: str,
+        reservation_id: str,
+        size: int,
+        expires_at: datetime,
+        allowance: Optional[int] = None,
+        allowance_as_of: Optional[datetime] = None,
+    ) -> None:
+        """
+        Reserve space in a user's storage for an upload. Users whose allowance isn't known have no limit.
+        Args:
+            storage_user_id: the owner of the storage
+            reservation_id: id to release the reservation with, such as the upload session id
+            size: declared size of the upload in bytes
+            expires_at: the reservation is released by `release_expired()` after this, unless it belongs to a live
+                upload session
+            allowance: allowance to use if none is known yet, such as the one in the uploader's token
+            allowance_as_of: when `allowance` was read, such as the issue date of the token. It replaces the known
+                allowance if that was set before then. Only used if none is known if None
+
+        Raises:
+            QuotaExceededError: if the upload doesn't fit in the allowance
+        """
+        if allowance is not None:
+            await self.set_allowance(storage_user_id, allowance, as_of=allowance_as_of or datetime.min)
+        else:
+            await UsageRepository(self.db).get(storage_user_id)
+        query = {
+            "_id": storage_user_id,
+            "$or": [
+                {"allowance": {"$exists": False}},
+                {
+                    "$expr": {
+                        "$lte": [{"$add": ["$bytes", {"$ifNull": ["$reserved", 0]}, size]}, "$allowance"],
+                    }
+                },
+            ],
+        }
+        update = {
+            "$inc": {"reserved": size},
+            "$set": {f"reservations.{reservation_id}": {"bytes": size, "expires_at": expires_at}},
+        }
+        result = await self.usage.update_one(query, update)
+        # space held by uploads that never finished is given back before giving up
+        if not result.matched_count and await self.release_expired(storage_user_id):
+            result = await self.usage.update_one(query, update)
+        if not result.matched_count:
+            raise QuotaExceededError("Storage allowance exceeded")
+
+    async def release(self, storage_user_id: str, reservation_id: str) -> bool:
+        """
+        Release a reservation once the upload has ended, whether the file was stored or not.
+        Releasing is idempotent, so a reservation is only given back once however many times it's released
+        Args:
+            storage_user_id: the owner of the storage
+            reservation_id: id the space was reserved with
+
+        Returns:
+            True if released, False if there was no such reservation
+        """
+        field = f"reservations.{reservation_id}"
+        doc = await self.usage.find_one({"_id": storage_user_id, field: {"$exists": True}}, {field: 1})
+        if not doc:
+            return False
+        size = doc["reservations"][reservation_id]["bytes"]
+        result = await self.usage.update_one(
+            {"_id": storage_user_id, f"{field}.bytes": size},
+            {"$unset": {field: ""}, "$inc": {"reserved": -size}},
+        )
+        return bool(result.modified_count)
+
+    async def release_expired(self, storage_user_id: Optional[str] = None) -> int:
+        """
+        Release the reservations of uploads that never ended, such as the ones of a worker that crashed mid-upload
+        or of abandoned upload sessions
+        Args:
+            storage_user_id: the user to check. All users with reservations if None
+
+        Returns:
+            number of released reservations
+        """
+        query = {"reserved": {"$gt": 0}}
+        if storage_user_id is not None:
+            query["_id"] = storage_user_id
+        now = datetime.utcnow()
+        released = 0
+        async for doc in self.usage.find(query, {"reservations": 1}):
+            expired = [
+                reservation_id
+                for reservation_id, reservation in doc.get("reservations", {}).items()
+                if reservation["expires_at"] < now
+            ]
+            for reservation_id in expired:
+                # upload sessions are kept alive by their parts, and hold their space for as long as they exist
+                if await self._is_live_session(reservation_id):
+                    continue
+                released += await self.release(doc["_id"], reservation_id)
+        return released
+
+    async def _is_live_session(self, reservation_id: str) -> bool:
+        try:
+            session_id = ObjectId(reservation_id)
+        except InvalidId:
+            return False
+        return bool(await self.upload_sessions.find_one({"_id": session_id}, {"_id": 1}))
@@ -0,0 +1,228 @@
+import math
+import re
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Set
+
+from pymongo import ReplaceOne
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from api.models.search_mode import SearchMode
+from config import settings
+from db.model.file_meta import FileMeta
+from db.respositories.base_repository import BaseRepository
+from utils.exceptions import SearchError
+from utils.trigram import normalize, trigrams, substring_trigrams, prefix_trigrams, similarity, is_regex
+
+# most files looked at to rank the results of a search
+MAX_CANDIDATES = 1000
+# least trigram similarity of a fuzzy match
+FUZZY_THRESHOLD = 0.3
+
+
+class SearchRepository(BaseRepository):
+    """
+    Repository for filename search.
+    Trigrams of every filename are kept in `fs.filename_grams` collection, one document per file, under a multikey
+    index within each storage. A search looks up the files having the trigrams of the pattern through the index, and
+    only those are matched and ranked, instead of running a regex over every file of the storage.
+    Storages are indexed as a whole on their first search, and kept up to date by uploads and deletes after that.
+    """
+
+    @property
+    def grams(self):
+        return self.db.client["file_service"]["fs.filename_grams"]
+
+    @property
+    def indexed_users(self):
+        return self.db.client["file_service"]["search_indexed_users"]
+
+    @property
+    def files(self):
+        return self.db.client["file_service"]["fs.files"]
+
+    @staticmethod
+    def _grams_doc(file_id: Any, storage_user_id: str, filename: str) -> dict:
+        return {
+            "_id": file_id,
+            "user_id": storage_user_id,
+            "name": normalize(filename),
+            "grams": sorted(trigrams(filename)),
+        }
+
+    async def add(self, file_id: Any, storage_user_id: str, filename: str) -> None:
+        """
+        Index the name of a file
+        Args:
+            file_id: id of the file entry
+            storage_user_id: the owner of the file
+            filename: name of the file
+        """
+        await self.grams.replace_one({"_id": file_id}, self._grams_doc(file_id, storage_user_id, filename), upsert=True)
+
+    async def remove(self, file_id: Any) -> None:
+        """
+        Remove the name of a file from the index
+        Args:
+            file_id: id of the file entry
+        """
+        await self.grams.delete_one({"_id": file_id})
+
+    async def remove_many(self, file_ids: List[Any]) -> None:
+        """
+        Remove the names of many files from the index
+        Args:
+            file_ids: ids of the file entries
+        """
+        await self.grams.delete_many({"_id": {"$in": file_ids}})
+
+    async def index_storage(self, storage_user_id: str, batch_size: int = 500) -> int:
+        """
+        Index the names of all the files of a storage, in bulk
+        Args:
+            storage_user_id: the owner of the files
+            batch_size: number of files indexed at once
+
+        Returns:
+            number of indexed files
+        """
+        indexed = 0
+        batch = []
+        cursor = self.files.find({"metadata.user_id": storage_user_id}, {"filename": 1})
+        async for doc in cursor:
+            batch.append(
+                ReplaceOne(
+                    {"_id": doc["_id"]}, self._grams_doc(doc["_id"], storage_user_id, doc["filename"]), upsert=True
+                )
+            )
+            if len(batch) == batch_size:
+                await self.grams.bulk_write(batch, ordered=False)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            await self.grams.bulk_write(batch, ordered=False)
+            indexed += len(batch)
+        await self.indexed_users.replace_one(
+            {"_id": storage_user_id}, {"_id": storage_user_id, "indexed_at": datetime.utcnow()}, upsert=True
+        )
+        return indexed
+
+    async def search(
+        self, storage_user_id: str, pattern: str, mode: SearchMode, limit: int, fields: Optional[Iterable[str]] = None
+    ) -> List[FileMeta]:
+        """
+        Search the files of a storage by name.
+        Matches are ranked with exact names first, then names starting with the pattern, then by trigram similarity.
+        Args:
+            storage_user_id: the owner of the files
+            pattern: text to search for, or a regex in regex mode
+            mode: how the pattern is matched
+            limit: maximum number of files to return
+            fields: fields of the models to read from DB. All of them if None
+
+        Raises:
+            SearchError: if a regex is invalid or takes too long
+
+        Returns:
+            metadata of the matching files, best match first
+        """
+        if mode == SearchMode.AUTO:
+            mode = SearchMode.REGEX if is_regex(pattern) else SearchMode.SUBSTRING
+        projection = FileMeta.projection(fields) if fields is not None else None
+        if mode == SearchMode.REGEX:
+            return await self._search_regex(storage_user_id, pattern, limit, projection)
+
+        if not await self.indexed_users.find_one({"_id": storage_user_id}):
+            await self.index_storage(storage_user_id)
+
+        text = normalize(pattern)
+        pattern_grams = trigrams(pattern)
+        query = {"user_id": storage_user_id}
+        if mode == SearchMode.FUZZY:
+            query["grams"] = {"$in": sorted(pattern_grams)}
+        else:
+            grams = substring_trigrams(pattern) if mode == SearchMode.SUBSTRING else prefix_trigrams(pattern)
+            if grams:
+                query["grams"] = {"$all": sorted(grams)}
+            # the names are matched in DB too, so only real matches are ranked. Patterns too short to have a trigram
+            # are still bounded by the storage
+            query["name"] = {"$regex": ("^" if mode == SearchMode.PREFIX else "") + re.escape(text)}
+
+        ranked = []
+        async for doc in self.grams.aggregate(self._ranking_pipeline(query, text, pattern_grams, mode)):
+            name = doc["name"]
+            score = similarity(set(doc["grams"]), pattern_grams)
+            if mode == SearchMode.SUBSTRING and text not in name:
+                continue
+            if mode == SearchMode.PREFIX and not name.startswith(text):
+                continue
+            if mode == SearchMode.FUZZY and score < FUZZY_THRESHOLD:
+                continue
+            ranked.append(((name == text, name.startswith(text), score), doc["_id"]))
+        ranked.sort(key=lambda match: match[0], reverse=True)
+        ids = [file_id for _, file_id in ranked[:limit]]
+
+        docs = {}
+        async for doc in self.files.find({"_id": {"$in": ids}, "metadata.user_id": storage_user_id}, projection):
+            docs[doc["_id"]] = doc
+        # files deleted meanwhile are left out
+        return [FileMeta.from_odm(docs[file_id]) for file_id in ids if file_id in docs]
+
+    @staticmethod
+    def _ranking_pipeline(query: dict, text: str, pattern_grams: Set[str], mode: SearchMode) -> List[dict]:
+        """
+        Aggregation ranking the candidates of a search in DB, the same way the results are ranked, before they're
+        cut down to `MAX_CANDIDATES`. Names sharing only common trigrams with the pattern, such as the ones of an
+        extension, can't push out the best matches however many of them there are.
+        Args:
+            query: filter of the candidates
+            text: normalized pattern
+            pattern_grams: trigrams of the pattern
+            mode: how the pattern is matched
+
+        Returns:
+            aggregation pipeline
+        """
+
+        def shared(grams: Set[str]) -> dict:
+            # stored trigrams are unique, so this is the size of the intersection
+            return {"$size": {"$filter": {"input": "$grams", "as": "gram", "cond": {"$in": ["$$gram", sorted(grams)]}}}}
+
+        prefix_grams = prefix_trigrams(text)
+        pipeline = [
+            {"$match": query},
+            {
+                "$project": {
+                    "name": 1,
+                    "grams": 1,
+                    "shared": shared(pattern_grams),
+                    # names starting with the pattern have all of its prefix trigrams. Close enough to rank by here
+                    "prefix": {"$eq": [shared(prefix_grams), len(prefix_grams)]},
+                }
+            },
+        ]
+        if mode == SearchMode.FUZZY:
+            # the similarity can't reach the threshold with fewer trigrams in common
+            least_shared = math.ceil(FUZZY_THRESHOLD * len(pattern_grams) - 1e-9)
+            pipeline.append({"$match": {"shared": {"$gte": least_shared}}})
+        union = {"$subtract": [{"$add": [{"$size": "$grams"}, len(pattern_grams)]}, "$shared"]}
+        pipeline += [
+            {"$addFields": {"exact": {"$eq": ["$name", text]}, "score": {"$divide": ["$shared", union]}}},
+            {"$sort": {"exact": -1, "prefix": -1, "score": -1, "_id": 1}},
+            {"$limit": MAX_CANDIDATES},
+        ]
+        return pipeline
+
+    async def _search_regex(
+        self, storage_user_id: str, pattern: str, limit: int, projection: Optional[dict] = None
+    ) -> List[FileMeta]:
+        cursor = (
+            self.files.find({"filename": {"$regex": pattern}, "metadata.user_id": storage_user_id}, projection)
+            .limit(limit)
+            .max_time_ms(settings.SEARCH_REGEX_MAX_TIME_MS)
+        )
+        try:
+            return [FileMeta.from_odm(doc) async for doc in cursor]
+        except ExecutionTimeout:
+            raise SearchError("Search took too long. Try a simpler pattern")
+        except OperationFailure as e:
+            raise SearchError(f"Invalid pattern: {e}")
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+import pymongo
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from db.respositories.base_repository import BaseRepository
+from db.respositories.blob_repository import BlobRepository
+
+# tombstones are left alone this long, so the delete that added one has removed the file entry by then
+TOMBSTONE_GRACE = timedelta(minutes=1)
+# tombstones claimed by a collector that didn't finish them can be claimed again after this
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class TrashRepository(BaseRepository):
+    """
+    Repository for deleted files whose data hasn't been reclaimed yet, and for chunks nothing refers to.
+    Deleting a file only moves its entry into `deleted_files` collection as a tombstone, so the delete doesn't wait for
+    the chunks to be removed. The background garbage collector releases the data of tombstones later, and also finds
+    chunks left behind by uploads that never finished.
+    """
+
+    @property
+    def trash(self):
+        return self.db.client["file_service"]["deleted_files"]
+
+    @property
+    def files(self):
+        return self.db.client["file_service"]["fs.files"]
+
+    @property
+    def chunks(self):
+        return self.db.client["file_service"]["fs.chunks"]
+
+    async def add(self, file_docs: List[dict]) -> List[Any]:
+        """
+        Add tombstones of file entries about to be deleted. Call it before the entries are deleted.
+        A tombstone is keyed by the id of the entry, so only one of concurrent deletes of a file gets to add it
+        Args:
+            file_docs: file entries to delete
+
+        Returns:
+            ids of the entries whose tombstones were added, which the caller may go on to delete
+        """
+        if not file_docs:
+            return []
+        now = datetime.utcnow()
+        tombstones = [{**doc, "deleted_at": now} for doc in file_docs]
+        try:
+            await self.trash.insert_many(tombstones, ordered=False)
+        except BulkWriteError as e:
+            # entries already being deleted by someone else
+            failed = {error["index"] for error in e.details["writeErrors"]}
+            return [doc["_id"] for i, doc in enumerate(file_docs) if i not in failed]
+        return [doc["_id"] for doc in file_docs]
+
+    async def remove(self, file_ids: List[Any]) -> None:
+        """
+        Remove tombstones of entries that turned out not to be deleted
+        Args:
+            file_ids: ids of the file entries
+        """
+        await self.trash.delete_many({"_id": {"$in": file_ids}})
+
+    async def count(self) -> int:
+        return await self.trash.count_documents({})
+
+    async def collect_deleted(self, batch_size: int) -> Tuple[int, List[Any]]:
+        """
+        Release the data of a batch of deleted files.
+        Tombstones are claimed first, so collectors of different workers never release a file twice, and removed
+        before the data is released. A collector failing in between leaks the data rather than releasing it twice.
+        Args:
+            batch_size: most tombstones handled
+
+        Returns:
+            number of tombstones handled, and ids of the blobs whose chunks are to be deleted
+        """
+        now = datetime.utcnow()
+        claimable = {
+            "deleted_at": {"$lt": now - TOMBSTONE_GRACE},
+            "$or": [{"gc_claimed_at": {"$exists": False}}, {"gc_claimed_at": {"$lt": now - CLAIM_TIMEOUT}}],
+        }
+        ids = [doc["_id"] async for doc in self.trash.find(claimable, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            return 0, []
+        claim = ObjectId()
+        await self.trash.update_many(
+            {**claimable, "_id": {"$in": ids}}, {"$set": {"gc_claim": claim, "gc_claimed_at": now}}
+        )
+        tombstones = await self.trash.find({"_id": {"$in": ids}, "gc_claim": claim}).to_list(length=None)
+        if not tombstones:
+            return 0, []
+        result = await self.trash.delete_many({"_id": {"$in": [doc["_id"] for doc in tombstones]}, "gc_claim": claim})
+        if result.deleted_count != len(tombstones):
+            # claimed again by another collector after this one stalled. Leave them to it
+            return result.deleted_count, []
+        # a delete that failed after adding its tombstone left the file in place, and its data is still in use
+        alive = {doc["_id"] async for doc in self.files.find({"_id": {"$in": ids}}, {"_id": 1})}
+        unreferenced = await BlobRepository(self.db).release_files(
+            [doc for doc in tombstones if doc["_id"] not in alive]
+        )
+        return len(tombstones), unreferenced
+
+    async def delete_chunks_batch(self, files_id: Any, batch_size: int) -> int:
+        """
+        Delete up to the given number of chunks of a blob
+        Args:
+            files_id: `files_id` of the chunks
+            batch_size: most chunks deleted
+
+        Returns:
+            number of deleted chunks. 0 once all of them are gone
+        """
+        ids = [chunk["_id"] async for chunk in self.chunks.find({"files_id": files_id}, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            return 0
+        result = await self.chunks.delete_many({"_id": {"$in": ids}})
+        return result.deleted_count
+
+    async def find_orphan_chunks(
+        self, after: Optional[Any], batch_size: int, grace: timedelta
+    ) -> Tuple[List[Any], Optional[Any]]:
+        """
+        Look through the next chunk owners for chunks nothing refers to: no blob, file entry, tombstone or upload
+        session. Such chunks are left by uploads that failed before adding their entry, or by expired upload sessions.
+        Chunks are left alone until their last chunk is older than the grace period, as an upload in progress has no
+        entry yet either.
+        Args:
+            after: `files_id` to carry on after, as returned by the previous call. None to start from the beginning
+            batch_size: number of chunk owners to look through
+            grace: how old chunks have to be
+
+        Returns:
+            `files_id` of the orphaned chunks, and where to carry on. None once all chunks have been looked through
+        """
+        owners = []
+        position = after
+        while len(owners) < batch_size:
+            query = {} if position is None else {"files_id": {"$gt": position}}
+            chunk = await self.chunks.find_one(
+                query, {"files_id": 1}, sort=[("files_id", pymongo.ASCENDING), ("n", pymongo.ASCENDING)]
+            )
+            if chunk is None:
+                position = None
+                break
+            position = chunk["files_id"]
+            owners.append(position)
+        if not owners:
+            return [], position
+
+        referenced = set()
+        for collection in ("fs.blobs", "fs.files", "deleted_files", "upload_sessions"):
+            cursor = self.db.client["file_service"][collection].find({"_id": {"$in": owners}}, {"_id": 1})
+            referenced.update([doc["_id"] async for doc in cursor])
+        cutoff = datetime.utcnow() - grace
+        orphans = []
+        for owner in owners:
+            if owner in referenced:
+                continue
+            last = await self.chunks.find_one({"files_id": owner}, {"_id": 1}, sort=[("n", pymongo.DESCENDING)])
+            if last is None or not isinstance(last["_id"], ObjectId):
+                continue
+            if last["_id"].generation_time.replace(tzinfo=None) < cutoff:
+                orphans.append(owner)
+        return orphans, position
@@ -0,0 +1,223 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs import DEFAULT_CHUNK_SIZE
+
+from config import settings
+from db.chunks import write_chunks, read_chunks, delete_chunks
+from db.model.file_meta import FileMeta
+from db.model.upload_session import UploadSession, UploadPart
+from db.respositories.base_repository import BaseRepository
+from db.respositories.file_repository import FileRepository
+from db.respositories.quota_repository import QuotaRepository
+from utils.chunk_codec import choose_codec, get_codec
+from utils.exceptions import UploadSessionError
+from utils.upload_pipeline import SNIFF_SIZE, sniff_content_type
+
+
+class UploadSessionRepository(BaseRepository):
+    """
+    Repository for resumable uploads.
+    A session collects numbered parts of a file, which are written straight into GridFS chunks of the file being
+    assembled. Completing the session adds the file entry, so the parts never have to be copied again.
+    Session state is kept in `upload_sessions` collection, and abandoned sessions expire with a TTL index.
+    The declared size of the file is reserved against the owner's allowance for as long as the session exists.
+    """
+
+    @property
+    def sessions(self):
+        return self.db.client["file_service"]["upload_sessions"]
+
+    @property
+    def chunks(self):
+        return self.db.client["file_service"]["fs.chunks"]
+
+    async def create_session(
+        self,
+        storage_user_id: str,
+        filename: str,
+        size: int,
+        allowance: Optional[int] = None,
+        allowance_as_of: Optional[datetime] = None,
+    ) -> UploadSession:
+        """
+        Start a new upload session.
+        Args:
+            storage_user_id: the owner of the file being uploaded
+            filename: filename of the file being uploaded
+            size: total size of the file in bytes
+            allowance: storage allowance of the owner to use if none is known yet
+            allowance_as_of: when `allowance` was read. It replaces the known allowance if that was set before then
+
+        Raises:
+            QuotaExceededError: if the file doesn't fit in the owner's allowance
+
+        Returns:
+            created session
+        """
+        # fail early, rather than after the whole file has been sent
+        if await FileRepository(self.db).find_file_entry(storage_user_id, filename):
+            raise FileExistsError("File with the same name exists")
+        chunk_size = DEFAULT_CHUNK_SIZE
+        doc = {
+            "_id": ObjectId(),
+            "filename": filename,
+            "length": size,
+            # parts have to be aligned with the chunks to be written directly at their chunk indices
+            "partSize": max(settings.UPLOAD_PART_SIZE // chunk_size, 1) * chunk_size,
+            "chunkSize": chunk_size,
+            # parts arrive in any order, so the codec can only be chosen by the filename
+            "codec": (await choose_codec(settings.CHUNK_CODEC, None, filename)).name,
+            "user_id": storage_user_id,
+            "parts": {},
+            "expires_at": self._expiry(),
+        }
+        quota_repo = QuotaRepository(self.db)
+        await quota_repo.reserve(
+            storage_user_id,
+            str(doc["_id"]),
+            size,
+            doc["expires_at"],
+            allowance=allowance,
+            allowance_as_of=allowance_as_of,
+        )
+        try:
+            await self.sessions.insert_one(doc)
+        except Exception:
+            await quota_repo.release(storage_user_id, str(doc["_id"]))
+            raise
+        return UploadSession.from_odm(doc)
+
+    async def get_session(self, upload_id: str) -> UploadSession:
+        """
+        Get an upload session with its received parts
+        Args:
+            upload_id: id of the session
+
+        Returns:
+            the upload session
+        """
+        try:
+            doc = await self.sessions.find_one({"_id": ObjectId(upload_id)})
+        except InvalidId:
+            doc = None
+        if not doc:
+            raise FileNotFoundError("Upload session not found")
+        return UploadSession.from_odm(doc)
+
+    async def write_part(self, session: UploadSession, part_number: int, stream: AsyncIterator[bytes]) -> UploadPart:
+        """
+        Write a part of the file. A part can be sent again, which overwrites the previously received one.
+        The part counts as missing until the new one is fully written, so a re-send that fails midway doesn't leave
+        the session completable with a mix of old and new chunks.
+        Args:
+            session: session the part belongs to
+            part_number: 0-based part number
+            stream: async stream of the part's bytes
+
+        Returns:
+            received part
+        """
+        if not 0 <= part_number < session.part_count:
+            raise UploadSessionError(f"Part number must be between 0 and {session.part_count - 1}")
+        expected_size = session.expected_part_size(part_number)
+        md5 = hashlib.md5()
+        if part_number in session.parts:
+            await self.sessions.update_one({"_id": ObjectId(session.id)}, {"$unset": {f"parts.{part_number}": ""}})
+            del session.parts[part_number]
+
+        async def hashed_stream():
+            async for data in stream:
+                md5.update(data)
+                yield data
+
+        written = await write_chunks(
+            self.chunks,
+            ObjectId(session.id),
+            hashed_stream(),
+            session.chunk_size,
+            first_n=part_number * session.part_size // session.chunk_size,
+            size_limit=expected_size,
+            encode=get_codec(session.codec).encode_async,
+        )
+        if written.length != expected_size:
+            raise UploadSessionError(f"Part {part_number} must be {expected_size} bytes, got {written.length} bytes")
+
+        part = UploadPart(size=written.length, md5=md5.hexdigest())
+        result = await self.sessions.update_one(
+            {"_id": ObjectId(session.id)},
+            {"$set": {f"parts.{part_number}": part.dict(), "expires_at": self._expiry()}},
+        )
+        if not result.matched_count:
+            raise FileNotFoundError("Upload session not found")
+        session.parts[part_number] = part
+        return part
+
+    async def complete_session(self, session: UploadSession) -> FileMeta:
+        """
+        Finish the upload by adding the file entry for the chunks written by the parts.
+        Checksums and content type are computed by reading the chunks once. Nothing is copied, and the chunks are
+        dropped instead if the same content is already stored.
+        Args:
+            session: session to complete
+
+        Returns:
+            metadata of the uploaded file
+        """
+        missing_parts = [n for n in range(session.part_count) if n not in session.parts]
+        if missing_parts:
+            raise UploadSessionError(f"Missing parts: {missing_parts}")
+
+        files_id = ObjectId(session.id)
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        codec = get_codec(session.codec)
+        head = b""
+        length = 0
+        stored_length = 0
+        async for chunk in read_chunks(self.chunks, files_id):
+            data = await codec.decode_async(chunk["data"])
+            stored_length += len(chunk["data"])
+            if chunk["n"] != length // session.chunk_size:
+                raise UploadSessionError("Upload is corrupted, please upload the missing parts again")
+            md5.update(data)
+            sha256.update(data)
+            if len(head) < SNIFF_SIZE:
+                head += data[:SNIFF_SIZE]
+            length += len(data)
+        if length != session.size:
+            raise UploadSessionError("Upload is corrupted, please upload the missing parts again")
+
+        file_meta = await FileRepository(self.db).add_file_entry(
+            storage_user_id=session.user_id,
+            filename=session.filename,
+            chunks_id=files_id,
+            length=length,
+            chunk_size=session.chunk_size,
+            md5=md5.hexdigest(),
+            sha256=sha256.hexdigest(),
+            content_type=sniff_content_type(head, session.filename),
+            codec=codec.name,
+            stored_length=stored_length,
+        )
+        await self.sessions.delete_one({"_id": files_id})
+        # the file is counted in the usage by now
+        await QuotaRepository(self.db).release(session.user_id, session.id)
+        return file_meta
+
+    async def abort_session(self, session: UploadSession) -> None:
+        """
+        Cancel the upload and remove everything received so far
+        Args:
+            session: session to abort
+        """
+        await self.sessions.delete_one({"_id": ObjectId(session.id)})
+        await QuotaRepository(self.db).release(session.user_id, session.id)
+        await delete_chunks(self.chunks, ObjectId(session.id))
+
+    @staticmethod
+    def _expiry() -> datetime:
+        return datetime.utcnow() + timedelta(minutes=settings.UPLOAD_SESSION_EXPIRE_MINUTES)
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from db.model.user_usage import UserUsage
+from db.respositories.base_repository import BaseRepository
+
+# a mismatch between the counters and the files has to last this long to be taken as drift
+DRIFT_GRACE = timedelta(minutes=1)
+
+
+class UsageRepository(BaseRepository):
+    """
+    Repository for the materialized storage usage of each user.
+    The number of files and their total size are kept per user in `user_usage` collection, and moved with `$inc` as
+    files are added and deleted, so reading them is a single lookup by id however many files the user has.
+    Drift from races with the lazy first computation, or from failures between a file write and its counter update,
+    is fixed by `reconcile()`.
+    """
+
+    @property
+    def usage(self):
+        return self.db.client["file_service"]["user_usage"]
+
+    @property
+    def files(self):
+        return self.db.client["file_service"]["fs.files"]
+
+    async def add(self, storage_user_id: str, files: int, size: int) -> None:
+        """
+        Move the counters of a user's storage.
+        Users without counters yet are left alone. Their counters are computed from the files on the first read.
+        Args:
+            storage_user_id: the owner of the storage
+            files: change in the number of files
+            size: change in the total size in bytes
+        """
+        await self.usage.update_one(
+            {"_id": storage_user_id},
+            {"$inc": {"files": files, "bytes": size}, "$set": {"updated_at": datetime.utcnow()}},
+        )
+
+    async def get(self, storage_user_id: str) -> UserUsage:
+        """
+        Get the usage of a user's storage. It's computed from the files the first time, and stored
+        Args:
+            storage_user_id: the owner of the storage
+
+        Returns:
+            usage of the storage
+        """
+        doc = await self.usage.find_one({"_id": storage_user_id})
+        if doc:
+            return UserUsage.from_odm(doc)
+        usage = await self.compute(storage_user_id)
+        # whoever stores it first wins. Files added meanwhile are counted by the next reconciliation
+        await self.usage.update_one(
+            {"_id": storage_user_id},
+            {"$setOnInsert": {"files": usage.files, "bytes": usage.bytes, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        return usage
+
+    async def compute(self, storage_user_id: str) -> UserUsage:
+        """
+        Compute the usage of a user's storage from the files
+        Args:
+            storage_user_id: the owner of the storage
+
+        Returns:
+            usage of the storage
+        """
+        cursor = self.files.aggregate(
+            [
+                {"$match": {"metadata.user_id": storage_user_id}},
+                {"$group": {"_id": None, "files": {"$sum": 1}, "bytes": {"$sum": "$length"}}},
+            ]
+        )
+        async for result in cursor:
+            return UserUsage(user_id=storage_user_id, files=result["files"], bytes=result["bytes"])
+        return UserUsage(user_id=storage_user_id, files=0, bytes=0)
+
+    async def reconcile(self, storage_user_id: Optional[str] = None) -> int:
+        """
+        Recompute the counters from the files and fix the ones that drifted.
+        A mismatch is also seen while an upload is between adding its entry and moving the counters, so it's only
+        recorded on the first run that sees it. The counters are moved by it once a later run, at least `DRIFT_GRACE`
+        afterwards, sees the very same mismatch again.
+        Args:
+            storage_user_id: the user to reconcile. All users with counters if None
+
+        Returns:
+            number of fixed counters
+        """
+        query = {} if storage_user_id is None else {"_id": storage_user_id}
+        fixed = 0
+        async for doc in self.usage.find(query):
+            usage = await self.compute(doc["_id"])
+            files, size = usage.files - doc["files"], usage.bytes - doc["bytes"]
+            seen = doc.get("drift")
+            if not files and not size:
+                if seen:
+                    await self.usage.update_one({"_id": doc["_id"]}, {"$unset": {"drift": ""}})
+                continue
+            now = datetime.utcnow()
+            if not seen or (seen["files"], seen["bytes"]) != (files, size):
+                await self.usage.update_one(
+                    {"_id": doc["_id"]}, {"$set": {"drift": {"files": files, "bytes": size, "seen_at": now}}}
+                )
+                continue
+            if seen["seen_at"] > now - DRIFT_GRACE:
+                continue
+            # moved by the drift rather than set, so files added or deleted meanwhile are still counted.
+            # Only one of the workers seeing it gets to apply it
+            result = await self.usage.update_one(
+                {"_id": doc["_id"], "drift.seen_at": seen["seen_at"]},
+                {"$inc": {"files": files, "bytes": size}, "$set": {"updated_at": now}, "$unset": {"drift": ""}},
+            )
+            fixed += result.modified_count
+        return fixed
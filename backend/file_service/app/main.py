@@ -9,6 +9,8 @@ from api.models.role import Role
 from api.router import api_router
 from config import settings
 from db.database import open_db_connection, close_db_connection
+from tasks.garbage_collector import start_garbage_collector, stop_garbage_collector
+from tasks.usage_reconciler import start_usage_reconciler, stop_usage_reconciler
 from utils.token import auth_with_jwt
 
 app = FastAPI(
@@ -23,9 +25,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # needed by browsers for range and conditional requests
+    expose_headers=["Accept-Ranges", "Content-Range", "Content-Length", "ETag", "Last-Modified"],
 )
 
 app.add_event_handler("startup", open_db_connection)
+app.add_event_handler("startup", start_usage_reconciler)
+app.add_event_handler("startup", start_garbage_collector)
+app.add_event_handler("shutdown", stop_garbage_collector)
+app.add_event_handler("shutdown", stop_usage_reconciler)
 app.add_event_handler("shutdown", close_db_connection)
 app.include_router(api_router, prefix="/api")
 
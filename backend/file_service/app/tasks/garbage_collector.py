@@ -0,0 +1,100 @@
+"""
+Background job reclaiming the data of deleted files, and chunks nothing refers to.
+Deletes only leave tombstones, so they return without waiting for the chunks to go. The chunks are removed here in
+small batches with pauses in between, so reclaiming a large file doesn't hold up the DB for the requests.
+Every worker runs its own, starting at a random point of the interval. Tombstones are claimed before they're handled,
+so the collectors of different workers never release the same file twice.
+"""
+import asyncio
+import logging
+import random
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from config import settings
+from db.database import get_db
+from db.respositories.trash_repository import TrashRepository
+
+logger = logging.getLogger(__name__)
+
+_task: Optional[asyncio.Task] = None
+# `files_id` the orphan sweep carries on after in the next run
+_orphan_position: Optional[Any] = None
+
+
+async def delete_chunks(repo: TrashRepository, files_ids: List[Any]) -> int:
+    """
+    Delete all chunks of the given blobs, a batch at a time
+    Args:
+        repo: trash repository
+        files_ids: `files_id` of the chunks
+
+    Returns:
+        number of deleted chunks
+    """
+    deleted = 0
+    for files_id in files_ids:
+        while True:
+            count = await repo.delete_chunks_batch(files_id, settings.GC_CHUNK_BATCH_SIZE)
+            if not count:
+                break
+            deleted += count
+            await asyncio.sleep(settings.GC_BATCH_DELAY_MS / 1000)
+    return deleted
+
+
+async def collect_garbage() -> None:
+    """
+    Reclaim the data of all deleted files, then look through the next batch of chunk owners for orphans
+    """
+    global _orphan_position
+    repo = TrashRepository(get_db())
+    files = chunks = 0
+    while True:
+        handled, unreferenced = await repo.collect_deleted(settings.GC_BATCH_SIZE)
+        if not handled:
+            break
+        files += handled
+        chunks += await delete_chunks(repo, unreferenced)
+        await asyncio.sleep(settings.GC_BATCH_DELAY_MS / 1000)
+
+    orphans, _orphan_position = await repo.find_orphan_chunks(
+        _orphan_position, settings.GC_BATCH_SIZE, timedelta(minutes=settings.GC_ORPHAN_GRACE_MINUTES)
+    )
+    chunks += await delete_chunks(repo, orphans)
+    if files or chunks:
+        logger.info(f"Reclaimed {files} deleted files and {chunks} chunks, {len(orphans)} of them orphaned")
+
+
+async def collect_garbage_periodically(interval_seconds: float) -> None:
+    """
+    Collect garbage every interval until cancelled
+    Args:
+        interval_seconds: time between the runs
+    """
+    await asyncio.sleep(random.uniform(0, interval_seconds))
+    while True:
+        try:
+            await collect_garbage()
+        except Exception as e:
+            logger.error(f"Garbage collection failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def start_garbage_collector() -> None:
+    """
+    Start the garbage collection job. This will be initiated as the API service starts up
+    """
+    global _task
+    if settings.GC_INTERVAL_SECONDS > 0:
+        _task = asyncio.ensure_future(collect_garbage_periodically(settings.GC_INTERVAL_SECONDS))
+
+
+async def stop_garbage_collector() -> None:
+    """
+    Stop the garbage collection job. This will be initiated as the API service shuts down
+    """
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
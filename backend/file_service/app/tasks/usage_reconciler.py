@@ -0,0 +1,58 @@
+"""
+Background job fixing drift of the materialized usage counters, and giving back the space reserved by uploads that
+never ended.
+Every worker runs its own, starting at a random point of the interval so they don't all run at once.
+Reconciliation is idempotent, so overlapping runs only cost extra queries.
+"""
+import asyncio
+import logging
+import random
+from typing import Optional
+
+from config import settings
+from db.database import get_db
+from db.respositories.quota_repository import QuotaRepository
+from db.respositories.usage_repository import UsageRepository
+
+logger = logging.getLogger(__name__)
+
+_task: Optional[asyncio.Task] = None
+
+
+async def reconcile_usage_periodically(interval_seconds: float) -> None:
+    """
+    Reconcile the usage counters of all users every interval until cancelled
+    Args:
+        interval_seconds: time between the runs
+    """
+    await asyncio.sleep(random.uniform(0, interval_seconds))
+    while True:
+        try:
+            fixed = await UsageRepository(get_db()).reconcile()
+            if fixed:
+                logger.info(f"Fixed usage counters of {fixed} users")
+            released = await QuotaRepository(get_db()).release_expired()
+            if released:
+                logger.info(f"Released {released} expired quota reservations")
+        except Exception as e:
+            logger.error(f"Usage reconciliation failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def start_usage_reconciler() -> None:
+    """
+    Start the reconciliation job. This will be initiated as the API service starts up
+    """
+    global _task
+    if settings.USAGE_RECONCILE_INTERVAL_MINUTES > 0:
+        _task = asyncio.ensure_future(reconcile_usage_periodically(settings.USAGE_RECONCILE_INTERVAL_MINUTES * 60))
+
+
+async def stop_usage_reconciler() -> None:
+    """
+    Stop the reconciliation job. This will be initiated as the API service shuts down
+    """
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -1,6 +1,7 @@
 """
 Test all endpoints against common use cases.
 """
+import json
 from datetime import datetime
 from pathlib import Path
 
@@ -86,7 +87,7 @@ async def test_upload_to_others_storage_as_admin(
     )
     # check there is an entry with the uploaded filename
     assert await test_db.client["file_service"]["fs.files"].find_one(
-        {"filename": text_file.name, "metadata": {"user_id": "some_id"}}
+        {"filename": text_file.name, "metadata.user_id": "some_id"}
     )
 
 
@@ -109,6 +110,28 @@ async def test_upload_file_limit(
     assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
 
 
+@pytest.mark.asyncio
+async def test_upload_over_allowance(test_client: AsyncClient, test_db: MockDatabase, text_file: Path):
+    # the allowance in the uploader's token is used until the user service pushes one
+    payload = JWTPayload(
+        sub="uploader_id",
+        role=Role.UPLOADER,
+        exp=datetime(2077, 1, 1),
+        username="pollo",
+        email="hola@world.com",
+        storage_allowance=text_file.stat().st_size - 1,
+    )
+    headers = {
+        "Authorization": f"Bearer {jwt.encode(payload.dict(), key=settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)}"
+    }
+    response = await test_client.post("/api/files/upload", files={"file": text_file.open(mode="rb")}, headers=headers)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert not await test_db.client["file_service"]["fs.files"].find_one({"filename": text_file.name})
+    # nothing is held once the upload has ended
+    usage = await test_db.client["file_service"]["user_usage"].find_one({"_id": "uploader_id"})
+    assert usage.get("reserved", 0) == 0
+
+
 @pytest.mark.asyncio
 async def test_upload_duplicate_filename(
     test_client: AsyncClient,
@@ -124,6 +147,7 @@ async def test_upload_duplicate_filename(
     )
     # check there is an entry with the uploaded filename
     assert await test_db.client["file_service"]["fs.files"].find_one({"filename": response.json()["filename"]})
+    chunks = await test_db.client["file_service"]["fs.chunks"].count_documents({})
     # upload the same file again
     files = {"file": text_file.open(mode="rb")}
     response = await test_client.post(
@@ -132,6 +156,8 @@ async def test_upload_duplicate_filename(
         headers=admin_token_header,
     )
     assert response.status_code == status.HTTP_400_BAD_REQUEST
+    # turned away before anything is stored
+    assert await test_db.client["file_service"]["fs.chunks"].count_documents({}) == chunks
 
 
 @pytest.mark.asyncio
@@ -222,6 +248,177 @@ async def test_download_as_admin(
         assert f.read() == response.content
 
 
+@pytest.mark.asyncio
+async def test_download_streamed(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    image_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": image_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    response = await test_client.get(
+        "/api/files/download",
+        params={"filename": image_file.name},
+        headers=admin_token_header,
+    )
+    assert response.headers["content-length"] == str(image_file.stat().st_size)
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content == image_file.read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_download_recorded_content_type(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    image_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": image_file.open(mode="rb")}
+    response = await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    assert response.json()["content_type"] == "image/jpeg"
+    response = await test_client.get("/api/files", params={"filename": image_file.name}, headers=admin_token_header)
+    assert response.json()["content_type"] == "image/jpeg"
+    # content type isn't detected from the data anymore
+    await test_db.client["file_service"]["fs.chunks"].update_many(
+        {}, {"$set": {"data": bytes(image_file.stat().st_size)}}
+    )
+    response = await test_client.get(
+        "/api/files/download", params={"filename": image_file.name}, headers=admin_token_header
+    )
+    assert response.headers["content-type"] == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_download_range(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    image_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": image_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    content = image_file.read_bytes()
+    response = await test_client.get(
+        "/api/files/download",
+        params={"filename": image_file.name},
+        headers={**admin_token_header, "Range": "bytes=100-299"},
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-range"] == f"bytes 100-299/{len(content)}"
+    assert response.headers["content-length"] == "200"
+    assert response.content == content[100:300]
+
+
+@pytest.mark.asyncio
+async def test_download_multiple_ranges(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    image_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": image_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    content = image_file.read_bytes()
+    response = await test_client.get(
+        "/api/files/download",
+        params={"filename": image_file.name},
+        headers={**admin_token_header, "Range": "bytes=0-9,-10"},
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert response.headers["content-length"] == str(len(response.content))
+    boundary = response.headers["content-type"].split("boundary=")[1]
+    parts = response.content.split(f"--{boundary}".encode())
+    # preamble, two parts and the closing delimiter
+    assert len(parts) == 4
+    assert parts[1].endswith(b"Content-Range: bytes 0-9/%d\r\n\r\n" % len(content) + content[:10] + b"\r\n")
+    assert parts[2].endswith(
+        b"Content-Range: bytes %d-%d/%d\r\n\r\n" % (len(content) - 10, len(content) - 1, len(content))
+        + content[-10:]
+        + b"\r\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_download_range_not_satisfiable(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    admin_token_header: str,
+):
+    with text_file.open("rb") as f:
+        await test_db.grid_client.upload_from_stream(filename="text.txt", source=f, metadata={"user_id": "admin_id"})
+    response = await test_client.get(
+        "/api/files/download",
+        params={"filename": "text.txt"},
+        headers={**admin_token_header, "Range": f"bytes={text_file.stat().st_size}-"},
+    )
+    assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    assert response.headers["content-range"] == f"bytes */{text_file.stat().st_size}"
+
+
+@pytest.mark.asyncio
+async def test_download_not_modified(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": text_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    params = {"filename": text_file.name}
+    response = await test_client.get("/api/files/download", params=params, headers=admin_token_header)
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    # the file data is not needed to answer conditional requests
+    await test_db.client["file_service"]["fs.chunks"].delete_many({})
+    for conditional_headers in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        response = await test_client.get(
+            "/api/files/download", params=params, headers={**admin_token_header, **conditional_headers}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+
+@pytest.mark.asyncio
+async def test_download_modified(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": text_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    response = await test_client.get(
+        "/api/files/download",
+        params={"filename": text_file.name},
+        headers={**admin_token_header, "If-None-Match": '"outdated"'},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == text_file.read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_download_range_outdated(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": text_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    # the partial copy the client has is from another version of the file, so the whole file is sent
+    response = await test_client.get(
+        "/api/files/download",
+        params={"filename": text_file.name},
+        headers={**admin_token_header, "Range": "bytes=10-", "If-Range": '"outdated"'},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == text_file.read_bytes()
+
+
 @pytest.mark.asyncio
 async def test_download_from_others_storage_as_admin(
     test_client: AsyncClient,
@@ -327,6 +524,29 @@ async def test_read_file_info_as_admin(
     assert "user_id" not in response.json()
 
 
+@pytest.mark.asyncio
+async def test_read_file_info_not_modified(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    admin_token_header: str,
+):
+    files = {"file": text_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    params = {"filename": text_file.name}
+    response = await test_client.get("/api/files", params=params, headers=admin_token_header)
+    etag = response.headers["etag"]
+    assert etag.startswith(f'"{response.json()["md5"]}-')
+    response = await test_client.get("/api/files", params=params, headers={**admin_token_header, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    # the same content uploaded again is another file, with another id and upload date
+    await test_client.delete("/api/files", params=params, headers=admin_token_header)
+    files = {"file": text_file.open(mode="rb")}
+    await test_client.post("/api/files/upload", files=files, headers=admin_token_header)
+    response = await test_client.get("/api/files", params=params, headers={**admin_token_header, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+
+
 @pytest.mark.asyncio
 async def test_read_file_info_from_others_storage_as_admin(
     test_client: AsyncClient,
@@ -591,6 +811,100 @@ async def test_read_file_info_list_offset_limit(
     assert len(response.json()["files"]) == 2
 
 
+@pytest.mark.asyncio
+async def test_read_file_info_list_cursor(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    image_file: Path,
+    audio_file: Path,
+    viewer_token_header: str,
+):
+    for file in (text_file, image_file, audio_file):
+        with file.open("rb") as f:
+            await test_db.grid_client.upload_from_stream(
+                filename=file.name, source=f, metadata={"user_id": "viewer_id"}
+            )
+    params = {"limit": 2, "sort_by": "filename", "desc": False}
+    response = await test_client.get("/api/files/list", params=params, headers=viewer_token_header)
+    assert [f["filename"] for f in response.json()["files"]] == [image_file.name, audio_file.name]
+    # sorting follows the cursor
+    params = {"limit": 2, "cursor": response.json()["next_cursor"]}
+    response = await test_client.get("/api/files/list", params=params, headers=viewer_token_header)
+    assert [f["filename"] for f in response.json()["files"]] == [text_file.name]
+    assert response.json()["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_read_file_info_list_totals(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    image_file: Path,
+    audio_file: Path,
+    viewer_token_header: str,
+):
+    for file in (text_file, image_file, audio_file):
+        with file.open("rb") as f:
+            await test_db.grid_client.upload_from_stream(
+                filename=file.name, source=f, metadata={"user_id": "viewer_id"}
+            )
+    total_bytes = sum(file.stat().st_size for file in (text_file, image_file, audio_file))
+    response = await test_client.get("/api/files/list", params={"limit": 1}, headers=viewer_token_header)
+    assert len(response.json()["files"]) == 1
+    assert response.json()["total_count"] == 3
+    assert response.json()["total_bytes"] == total_bytes
+
+    params = {"limit": 1, "with_totals": False}
+    response = await test_client.get("/api/files/list", params=params, headers=viewer_token_header)
+    assert len(response.json()["files"]) == 1
+    assert response.json()["total_count"] is None
+    assert response.json()["total_bytes"] is None
+
+
+@pytest.mark.asyncio
+async def test_read_file_info_list_fields(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    image_file: Path,
+    viewer_token_header: str,
+):
+    for file in (text_file, image_file):
+        with file.open("rb") as f:
+            await test_db.grid_client.upload_from_stream(
+                filename=file.name, source=f, metadata={"user_id": "viewer_id"}
+            )
+    params = {"limit": 1, "sort_by": "size", "desc": False, "fields": "size,filename"}
+    response = await test_client.get("/api/files/list", params=params, headers=viewer_token_header)
+    assert response.json()["files"] == [{"filename": text_file.name, "size": text_file.stat().st_size}]
+    # the sort field is read even if left out, so the page still has a cursor
+    params = {"limit": 1, "cursor": response.json()["next_cursor"], "fields": "filename"}
+    response = await test_client.get("/api/files/list", params=params, headers=viewer_token_header)
+    assert response.json()["files"] == [{"filename": image_file.name}]
+
+
+@pytest.mark.asyncio
+async def test_read_file_info_list_invalid_fields(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    viewer_token_header: str,
+):
+    params = {"fields": "filename,user_id"}
+    response = await test_client.get("/api/files/list", params=params, headers=viewer_token_header)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_read_file_info_list_invalid_cursor(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    viewer_token_header: str,
+):
+    response = await test_client.get("/api/files/list", params={"cursor": "invalid"}, headers=viewer_token_header)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 @pytest.mark.asyncio
 async def test_list_file_info_sort_by_conversion(
     test_client: AsyncClient,
@@ -737,6 +1051,93 @@ async def test_search_file_info_as_viewer(
     assert len(response.json()["files"]) == 1
 
 
+@pytest.mark.asyncio
+async def test_search_file_info_fields(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    viewer_token_header: str,
+):
+    with text_file.open("rb") as f:
+        await test_db.grid_client.upload_from_stream(
+            filename=text_file.name, source=f, metadata={"user_id": "viewer_id"}
+        )
+    params = {"pattern": "text", "fields": "filename"}
+    response = await test_client.get("/api/files/search", params=params, headers=viewer_token_header)
+    assert response.json()["files"] == [{"filename": text_file.name}]
+
+
+@pytest.mark.asyncio
+async def test_lookup_files(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    image_file: Path,
+    viewer_token_header: str,
+):
+    for file in (text_file, image_file):
+        with file.open("rb") as f:
+            await test_db.grid_client.upload_from_stream(
+                filename=file.name, source=f, metadata={"user_id": "viewer_id"}
+            )
+    body = {"filenames": [image_file.name, "missing.txt", text_file.name]}
+    response = await test_client.post("/api/files/lookup", json=body, headers=viewer_token_header)
+    assert response.status_code == status.HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["filename"] for line in lines] == body["filenames"]
+    assert [line["exists"] for line in lines] == [True, False, True]
+    assert lines[0]["size"] == image_file.stat().st_size
+    assert lines[1] == {"filename": "missing.txt", "exists": False}
+
+
+@pytest.mark.asyncio
+async def test_lookup_files_ndjson(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    viewer_token_header: str,
+    monkeypatch,
+):
+    with text_file.open("rb") as f:
+        await test_db.grid_client.upload_from_stream(
+            filename=text_file.name, source=f, metadata={"user_id": "viewer_id"}
+        )
+    # more names than a batch, so they're looked up with several queries
+    monkeypatch.setattr(settings, "LOOKUP_BATCH_SIZE", 2)
+    filenames = ["a.txt", "b.txt", text_file.name, "c.txt", text_file.name]
+    body = "".join(json.dumps({"filename": filename}) + "\n" for filename in filenames)
+    headers = {**viewer_token_header, "Content-Type": "application/x-ndjson"}
+    response = await test_client.post("/api/files/lookup", content=body, headers=headers)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["filename"] for line in lines] == filenames
+    assert [line["exists"] for line in lines] == [False, False, True, False, True]
+
+
+@pytest.mark.asyncio
+async def test_lookup_files_invalid(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    viewer_token_header: str,
+):
+    response = await test_client.post("/api/files/lookup", json={"filenames": []}, headers=viewer_token_header)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    headers = {**viewer_token_header, "Content-Type": "application/x-ndjson"}
+    response = await test_client.post("/api/files/lookup", content='"a.txt"\n', headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_lookup_files_from_others_storage_as_viewer(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    viewer_token_header: str,
+):
+    response = await test_client.post(
+        "/api/files/lookup", params={"user_id": "some_id"}, json={"filenames": ["a.txt"]}, headers=viewer_token_header
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
 @pytest.mark.asyncio
 async def test_search_file_from_others_storage_as_viewer(
     test_client: AsyncClient,
@@ -872,6 +1273,54 @@ async def test_delete_file_from_others_storage_as_uploader(
     assert response.status_code == status.HTTP_403_FORBIDDEN
 
 
+@pytest.mark.asyncio
+async def test_delete_files_as_uploader(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    image_file: Path,
+    audio_file: Path,
+    uploader_token_header: str,
+):
+    for file in (text_file, image_file, audio_file):
+        with file.open("rb") as f:
+            await test_db.grid_client.upload_from_stream(
+                filename=file.name, source=f, metadata={"user_id": "uploader_id"}
+            )
+    body = {"filenames": [audio_file.name, "missing.txt", text_file.name]}
+    response = await test_client.post("/api/files/delete", json=body, headers=uploader_token_header)
+    assert response.json()["deleted_count"] == 2
+    assert response.json()["files"] == [
+        {"filename": audio_file.name, "deleted": True},
+        {"filename": "missing.txt", "deleted": False},
+        {"filename": text_file.name, "deleted": True},
+    ]
+    # confirm only the rest is left
+    files = test_db.client["file_service"]["fs.files"]
+    assert [doc["filename"] async for doc in files.find()] == [image_file.name]
+
+
+@pytest.mark.asyncio
+async def test_delete_files_from_others_storage_as_uploader(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    uploader_token_header: str,
+):
+    body = {"filenames": ["some_file"], "user_id": "some_id"}
+    response = await test_client.post("/api/files/delete", json=body, headers=uploader_token_header)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_delete_files_as_viewer(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    viewer_token_header: str,
+):
+    response = await test_client.post("/api/files/delete", json={"filenames": ["a"]}, headers=viewer_token_header)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
 @pytest.mark.asyncio
 async def test_delete_file_as_viewer(
     test_client: AsyncClient,
@@ -1067,3 +1516,45 @@ async def test_get_usage_as_admin(
         )
     response = await test_client.get("/api/files/usage", params={"user_id": "some_id"}, headers=admin_token_header)
     assert response.json()["storage_used"] == text_file.stat().st_size + image_file.stat().st_size
+
+
+@pytest.mark.asyncio
+async def test_get_storage_stats_as_admin(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    text_file: Path,
+    admin_token_header: str,
+    uploader_token_header: str,
+):
+    # upload the same file to two storages
+    for headers in (admin_token_header, uploader_token_header):
+        files = {"file": text_file.open(mode="rb")}
+        await test_client.post("/api/files/upload", files=files, headers=headers)
+    response = await test_client.get("/api/files/stats", headers=admin_token_header)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["files"] == 2
+    assert response.json()["logical_bytes"] == text_file.stat().st_size * 2
+    assert response.json()["dedup_saved_bytes"] == text_file.stat().st_size
+    assert "hits" in response.json()["content_cache"]
+    assert "hits" in response.json()["metadata_cache"]
+    assert "hit_ratio" in response.json()["token_cache"]
+
+
+@pytest.mark.asyncio
+async def test_set_allowance_as_uploader(test_client: AsyncClient, test_db: MockDatabase, uploader_token_header: str):
+    response = await test_client.put(
+        "/api/files/allowance",
+        json={"user_id": "uploader_id", "storage_allowance": 10**12},
+        headers=uploader_token_header,
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_get_storage_stats_as_uploader(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    uploader_token_header: str,
+):
+    response = await test_client.get("/api/files/stats", headers=uploader_token_header)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
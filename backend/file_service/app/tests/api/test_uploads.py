@@ -0,0 +1,155 @@
+"""
+Test resumable upload endpoints against common use cases.
+"""
+from pathlib import Path
+
+import pytest
+from gridfs import DEFAULT_CHUNK_SIZE
+from httpx import AsyncClient
+from starlette import status
+
+from config import settings
+from tests.db.mock_database import MockDatabase
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_as_uploader(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    image_file: Path,
+    uploader_token_header: str,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "UPLOAD_PART_SIZE", DEFAULT_CHUNK_SIZE)
+    content = image_file.read_bytes()
+    response = await test_client.post(
+        "/api/files/uploads",
+        json={"filename": image_file.name, "size": len(content)},
+        headers=uploader_token_header,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    session = response.json()
+    part_size = session["part_size"]
+    part_count = -(-len(content) // part_size)
+    for n in range(part_count):
+        response = await test_client.put(
+            f"/api/files/uploads/{session['upload_id']}/parts/{n}",
+            content=content[n * part_size : (n + 1) * part_size],
+            headers=uploader_token_header,
+        )
+        assert response.status_code == status.HTTP_200_OK
+    # check received offsets
+    response = await test_client.get(f"/api/files/uploads/{session['upload_id']}", headers=uploader_token_header)
+    assert [part["offset"] for part in response.json()["received_parts"]] == [n * part_size for n in range(part_count)]
+    response = await test_client.post(
+        f"/api/files/uploads/{session['upload_id']}/complete", headers=uploader_token_header
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["size"] == len(content)
+    # the uploaded file can be downloaded as usual
+    response = await test_client.get(
+        "/api/files/download", params={"filename": image_file.name}, headers=uploader_token_header
+    )
+    assert response.content == content
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_too_big(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    uploader_token_header: str,
+):
+    response = await test_client.post(
+        "/api/files/uploads",
+        json={"filename": "huge.txt", "size": settings.FILE_SIZE_LIMIT + 1},
+        headers=uploader_token_header,
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_to_others_storage_as_uploader(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    uploader_token_header: str,
+):
+    response = await test_client.post(
+        "/api/files/uploads",
+        json={"filename": "text.txt", "size": 100, "user_id": "some_id"},
+        headers=uploader_token_header,
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_others_session_as_uploader(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    admin_token_header: str,
+    uploader_token_header: str,
+):
+    response = await test_client.post(
+        "/api/files/uploads",
+        json={"filename": "text.txt", "size": 100},
+        headers=admin_token_header,
+    )
+    response = await test_client.put(
+        f"/api/files/uploads/{response.json()['upload_id']}/parts/0",
+        content=b"a" * 100,
+        headers=uploader_token_header,
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_as_viewer(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    viewer_token_header: str,
+):
+    response = await test_client.post(
+        "/api/files/uploads",
+        json={"filename": "text.txt", "size": 100},
+        headers=viewer_token_header,
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_abort_resumable_upload(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    uploader_token_header: str,
+):
+    response = await test_client.post(
+        "/api/files/uploads",
+        json={"filename": "text.txt", "size": 100},
+        headers=uploader_token_header,
+    )
+    upload_id = response.json()["upload_id"]
+    response = await test_client.delete(f"/api/files/uploads/{upload_id}", headers=uploader_token_header)
+    assert response.status_code == status.HTTP_200_OK
+    response = await test_client.get(f"/api/files/uploads/{upload_id}", headers=uploader_token_header)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload_over_allowance(
+    test_client: AsyncClient,
+    test_db: MockDatabase,
+    uploader_token_header: str,
+    admin_token_header: str,
+):
+    response = await test_client.put(
+        "/api/files/allowance", json={"user_id": "uploader_id", "storage_allowance": 100}, headers=admin_token_header
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response = await test_client.post(
+        "/api/files/uploads", json={"filename": "a.txt", "size": 60}, headers=uploader_token_header
+    )
+    assert response.status_code == status.HTTP_200_OK
+    # the first session holds its space until it ends
+    response = await test_client.post(
+        "/api/files/uploads", json={"filename": "b.txt", "size": 60}, headers=uploader_token_header
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
@@ -13,21 +13,31 @@ from config import settings
 from db.database import get_db
 from main import app
 from tests.db.mock_database import MockDatabase
+from utils.metadata_cache import metadata_cache
 
 
 @pytest.fixture(scope="function")
 async def test_client(event_loop):
     app.dependency_overrides[get_db] = lambda: MockDatabase(event_loop)
+    # the service refuses to start without its indexes, which deploys create before it starts
+    await MockDatabase(event_loop).create_index()
     async with AsyncClient(app=app, base_url="http://localhost") as client, LifespanManager(app):
         yield client
 
 
 @pytest.fixture(scope="function")
 async def test_db(event_loop) -> MockDatabase:
-    db = MockDatabase(event_loop)
+    db = MockDatabase(event_loop, check_plans=settings.QUERY_PLAN_CHECK)
     await db.create_index()
+    # versions start over with the database, so entries cached by a previous test could be taken as current
+    metadata_cache.clear()
     yield db
     await db.client.drop_database("file_service")
+    if db.plan_checker:
+        db.plan_checker.close()
+        assert not db.plan_checker.violations, "Queries not served by an index:\n" + "\n".join(
+            db.plan_checker.violations
+        )
 
 
 @pytest.fixture(scope="session")
@@ -1,17 +1,23 @@
-import pymongo
+from typing import Optional
+
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 
 from config import settings
+from db.indexes import sync_indexes
+from db.query_plan import QueryPlanChecker
 
 
 class MockDatabase:
-    def __init__(self, loop):
-        self.client: AsyncIOMotorClient = AsyncIOMotorClient(settings.MONGODB_URL, io_loop=loop)
+    def __init__(self, loop, check_plans: bool = False):
+        self.plan_checker: Optional[QueryPlanChecker] = None
+        if check_plans:
+            self.plan_checker = QueryPlanChecker(settings.MONGODB_URL)
+            self.client: AsyncIOMotorClient = AsyncIOMotorClient(
+                settings.MONGODB_URL, io_loop=loop, event_listeners=[self.plan_checker]
+            )
+        else:
+            self.client: AsyncIOMotorClient = AsyncIOMotorClient(settings.MONGODB_URL, io_loop=loop)
         self.grid_client: AsyncIOMotorGridFSBucket = AsyncIOMotorGridFSBucket(self.client["file_service"])
 
     async def create_index(self):
-        # create index
-        await self.client["file_service"]["fs.files"].create_index([("metadata.user_id", pymongo.TEXT)])
-        await self.client["file_service"]["fs.files"].create_index([("uploadDate", pymongo.DESCENDING)])
-        await self.client["file_service"]["fs.files"].create_index([("length", pymongo.DESCENDING)])
-        await self.client["file_service"]["fs.files"].create_index([("filename", pymongo.DESCENDING)])
+        await sync_indexes(self.client)
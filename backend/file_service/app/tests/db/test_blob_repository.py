@@ -0,0 +1,73 @@
+import pytest
+from bson import ObjectId
+
+from db.chunks import write_chunks
+from db.database import Database
+from db.respositories.blob_repository import BlobRepository
+
+
+async def as_stream(data: bytes):
+    yield data
+
+
+@pytest.mark.asyncio
+async def test_add_blob(test_db: Database):
+    repo = BlobRepository(test_db)
+    chunks_id = ObjectId()
+    blob = await repo.add_blob(chunks_id, sha256="abc", length=100, chunk_size=1000)
+    assert blob["_id"] == chunks_id
+    assert blob["refcount"] == 1
+    # the same content refers to the existing blob
+    blob = await repo.add_blob(ObjectId(), sha256="abc", length=100, chunk_size=1000)
+    assert blob["_id"] == chunks_id
+    assert blob["refcount"] == 2
+
+
+@pytest.mark.asyncio
+async def test_release_blob(test_db: Database):
+    repo = BlobRepository(test_db)
+    chunks_id = ObjectId()
+    await write_chunks(repo.chunks, chunks_id, as_stream(b"a" * 100), chunk_size=1000)
+    await repo.add_blob(chunks_id, sha256="abc", length=100, chunk_size=1000)
+    await repo.add_blob(ObjectId(), sha256="abc", length=100, chunk_size=1000)
+
+    await repo.release_blob(chunks_id)
+    assert await repo.chunks.find_one({"files_id": chunks_id})
+    await repo.release_blob(chunks_id)
+    assert not await repo.blobs.find_one({"_id": chunks_id})
+    assert not await repo.chunks.find_one({"files_id": chunks_id})
+
+
+@pytest.mark.asyncio
+async def test_release_unregistered_chunks(test_db: Database):
+    repo = BlobRepository(test_db)
+    # files stored before deduplication own their chunks
+    file_id = await test_db.grid_client.upload_from_stream(filename="a.txt", source=b"abc", metadata={"user_id": "1"})
+    await repo.release_file({"_id": file_id, "metadata": {"user_id": "1"}})
+    assert not await repo.chunks.find_one({"files_id": file_id})
+
+
+@pytest.mark.asyncio
+async def test_release_files(test_db: Database):
+    repo = BlobRepository(test_db)
+    shared_id, single_id = ObjectId(), ObjectId()
+    await write_chunks(repo.chunks, shared_id, as_stream(b"a" * 100), chunk_size=1000)
+    await write_chunks(repo.chunks, single_id, as_stream(b"b" * 100), chunk_size=1000)
+    for _ in range(3):
+        await repo.add_blob(shared_id, sha256="shared", length=100, chunk_size=1000)
+    await repo.add_blob(single_id, sha256="single", length=100, chunk_size=1000)
+    # files stored before deduplication own their chunks
+    legacy_id = await test_db.grid_client.upload_from_stream(filename="a.txt", source=b"abc", metadata={"user_id": "1"})
+
+    docs = [
+        {"_id": ObjectId(), "metadata": {"blob_id": shared_id}},
+        {"_id": ObjectId(), "metadata": {"blob_id": shared_id}},
+        {"_id": ObjectId(), "metadata": {"blob_id": single_id}},
+        {"_id": legacy_id, "metadata": {"user_id": "1"}},
+    ]
+    unreferenced = await repo.release_files(docs)
+    assert (await repo.blobs.find_one({"_id": shared_id}))["refcount"] == 1
+    assert not await repo.blobs.find_one({"_id": single_id})
+    # chunks are left to the caller to delete
+    assert set(unreferenced) == {single_id, legacy_id}
+    assert await repo.chunks.find_one({"files_id": single_id})
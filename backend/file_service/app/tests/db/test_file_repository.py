@@ -1,14 +1,32 @@
+import hashlib
+import os
+import time
 from datetime import datetime
-from io import FileIO
+from io import FileIO, BytesIO
 from pathlib import Path
 
 import pytest
 from bson import ObjectId
 from fastapi import UploadFile
+from gridfs import DEFAULT_CHUNK_SIZE
 
+from config import settings
 from db.database import Database
+from db.file_download import FileDownload
 from db.model.file_meta import FileMeta
 from db.respositories.file_repository import FileRepository
+from db.respositories.metadata_version_repository import MetadataVersionRepository
+from db.respositories.trash_repository import TrashRepository
+from tests.utils.counting_reader import CountingReader
+from tests.utils.tombstones import age_tombstones
+from utils.content_cache import content_cache
+from utils.metadata_cache import metadata_cache
+from utils.page_cursor import PageCursor
+from utils.exceptions import FileTooLargeError
+
+
+async def read_all(download: FileDownload) -> bytes:
+    return b"".join([chunk async for chunk in download.stream()])
 
 
 @pytest.mark.asyncio
@@ -81,13 +99,214 @@ async def test_add_file_audio(test_db: Database, audio_file: Path):
         assert await grid_out.read() == f.read()
 
 
+@pytest.mark.asyncio
+async def test_add_file_multiple_chunks(test_db: Database):
+    repo = FileRepository(test_db)
+    # content spanning several GridFS chunks with a partial last chunk
+    content = os.urandom(DEFAULT_CHUNK_SIZE * 3 + 17)
+    file_meta = await repo.add_file(
+        storage_user_id="12345",
+        file=UploadFile(filename="large.txt", file=BytesIO(content)),
+    )
+    # returned metadata is built from the upload stream and should match the stored document
+    doc = await test_db.client["file_service"]["fs.files"].find_one({"_id": ObjectId(file_meta.id)})
+    assert file_meta.size == doc["length"] == len(content)
+    assert file_meta.md5 == doc["md5"] == hashlib.md5(content).hexdigest()
+    assert await test_db.client["file_service"]["fs.chunks"].count_documents({"files_id": doc["_id"]}) == 4
+    grid_out = await test_db.grid_client.open_download_stream(ObjectId(file_meta.id))
+    assert await grid_out.read() == content
+
+
+@pytest.mark.asyncio
+async def test_add_file_single_pass(test_db: Database, image_file: Path):
+    repo = FileRepository(test_db)
+    content = image_file.read_bytes()
+    reader = CountingReader(content)
+    file_meta = await repo.add_file(storage_user_id="12345", file=UploadFile(filename=image_file.name, file=reader))
+    # every byte of the upload is read exactly once
+    assert reader.bytes_served == len(content)
+    # checksums and content type are computed in the same pass
+    doc = await test_db.client["file_service"]["fs.files"].find_one({"_id": ObjectId(file_meta.id)})
+    assert doc["md5"] == hashlib.md5(content).hexdigest()
+    assert doc["metadata"]["sha256"] == hashlib.sha256(content).hexdigest()
+    assert doc["metadata"]["content_type"] == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_add_file_too_large(test_db: Database, text_file: Path):
+    repo = FileRepository(test_db)
+    with pytest.raises(FileTooLargeError):
+        await repo.add_file(
+            storage_user_id="12345",
+            file=UploadFile(filename=text_file.name, file=FileIO(text_file)),
+            size_limit=text_file.stat().st_size - 1,
+        )
+    # nothing should be left behind
+    assert not await test_db.client["file_service"]["fs.files"].find_one({"filename": text_file.name})
+    assert not await test_db.client["file_service"]["fs.chunks"].find_one()
+
+
+@pytest.mark.asyncio
+async def test_add_file_deduplicated(test_db: Database):
+    repo = FileRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE * 2 + 17)
+    first = await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.bin", file=BytesIO(content)))
+    second = await repo.add_file(storage_user_id="67890", file=UploadFile(filename="b.bin", file=BytesIO(content)))
+    # the content is stored only once and shared by both files
+    blob = await test_db.client["file_service"]["fs.blobs"].find_one({"sha256": hashlib.sha256(content).hexdigest()})
+    assert blob["_id"] == ObjectId(first.id)
+    assert blob["refcount"] == 2
+    assert await test_db.client["file_service"]["fs.chunks"].count_documents({}) == 3
+    doc = await test_db.client["file_service"]["fs.files"].find_one({"_id": ObjectId(second.id)})
+    assert doc["metadata"]["blob_id"] == blob["_id"]
+    assert await read_all(await repo.download_file(storage_user_id="67890", filename="b.bin")) == content
+    # each user is still charged for the whole file
+    assert await repo.get_storage_usage("12345") == len(content)
+    assert await repo.get_storage_usage("67890") == len(content)
+
+
+@pytest.mark.asyncio
+async def test_add_file_compressed(test_db: Database, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CODEC", "zlib")
+    repo = FileRepository(test_db)
+    content = b"id,name,value\n" + b"1,some name,12345\n" * 50_000
+    file_meta = await repo.add_file(
+        storage_user_id="12345", file=UploadFile(filename="data.csv", file=BytesIO(content))
+    )
+    # the logical size is kept
+    assert file_meta.size == len(content)
+    doc = await test_db.client["file_service"]["fs.files"].find_one({"_id": ObjectId(file_meta.id)})
+    assert doc["length"] == len(content)
+    assert doc["metadata"]["codec"] == "zlib"
+    # every chunk holds a whole chunk of the file, compressed
+    chunks = await test_db.client["file_service"]["fs.chunks"].find({"files_id": doc["_id"]}).to_list(None)
+    assert len(chunks) == -(-len(content) // DEFAULT_CHUNK_SIZE)
+    assert all(len(chunk["data"]) < DEFAULT_CHUNK_SIZE for chunk in chunks)
+    assert await read_all(await repo.download_file(storage_user_id="12345", filename="data.csv")) == content
+    blob = await test_db.client["file_service"]["fs.blobs"].find_one({"_id": doc["_id"]})
+    assert blob["storedLength"] == sum(len(chunk["data"]) for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_add_file_compression_skipped(test_db: Database, image_file: Path, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CODEC", "zlib")
+    repo = FileRepository(test_db)
+    file_meta = await repo.add_file(
+        storage_user_id="12345", file=UploadFile(filename=image_file.name, file=FileIO(image_file))
+    )
+    doc = await test_db.client["file_service"]["fs.files"].find_one({"_id": ObjectId(file_meta.id)})
+    assert doc["metadata"]["codec"] == "none"
+
+
 @pytest.mark.asyncio
 async def test_download_file(test_db: Database, text_file: Path):
     with text_file.open("rb") as f:
         await test_db.grid_client.upload_from_stream(filename=text_file.name, source=f, metadata={"user_id": "12345"})
-    file = await FileRepository(test_db).download_file(storage_user_id="12345", filename=text_file.name)
+    download = await FileRepository(test_db).download_file(storage_user_id="12345", filename=text_file.name)
+    assert download.length == text_file.stat().st_size
+    # content type of files stored without one is guessed from the filename
+    assert download.content_type == "text/plain"
     with text_file.open("rb") as f:
-        assert file == f.read()
+        assert await read_all(download) == f.read()
+
+
+@pytest.mark.asyncio
+async def test_download_file_streamed(test_db: Database):
+    repo = FileRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE * 3 + 17)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="large.bin", file=BytesIO(content)))
+    download = await repo.download_file(storage_user_id="12345", filename="large.bin")
+    # the data comes out one chunk at a time
+    chunks = [chunk async for chunk in download.stream()]
+    assert [len(chunk) for chunk in chunks] == [DEFAULT_CHUNK_SIZE] * 3 + [17]
+    assert b"".join(chunks) == content
+
+
+@pytest.mark.asyncio
+async def test_download_file_range(test_db: Database, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CODEC", "zlib")
+    repo = FileRepository(test_db)
+    content = b"".join(b"%08d\n" % i for i in range(200_000))
+    file_meta = await repo.add_file(
+        storage_user_id="12345", file=UploadFile(filename="rows.txt", file=BytesIO(content))
+    )
+    download = await repo.download_file(storage_user_id="12345", filename="rows.txt")
+    # a range spanning a chunk boundary
+    start, end = DEFAULT_CHUNK_SIZE * 2 - 10, DEFAULT_CHUNK_SIZE * 3 + 10
+    assert b"".join([data async for data in download.stream(start, end)]) == content[start : end + 1]
+    # chunks before the range are never read, so a missing one doesn't matter
+    await test_db.client["file_service"]["fs.chunks"].delete_one({"files_id": ObjectId(file_meta.id), "n": 0})
+    assert b"".join([data async for data in download.stream(start, end)]) == content[start : end + 1]
+
+
+@pytest.mark.asyncio
+async def test_download_file_missing_chunk(test_db: Database):
+    repo = FileRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE * 3)
+    file_meta = await repo.add_file(
+        storage_user_id="12345", file=UploadFile(filename="large.bin", file=BytesIO(content))
+    )
+    await test_db.client["file_service"]["fs.chunks"].delete_one({"files_id": ObjectId(file_meta.id), "n": 1})
+    download = await repo.download_file(storage_user_id="12345", filename="large.bin")
+    with pytest.raises(IOError):
+        await read_all(download)
+
+
+@pytest.mark.asyncio
+async def test_download_file_content_type_recorded(test_db: Database, image_file: Path):
+    repo = FileRepository(test_db)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="doge", file=FileIO(image_file)))
+    download = await repo.download_file(storage_user_id="12345", filename="doge")
+    # detected at upload, even without an extension
+    assert download.content_type == "image/jpeg"
+    assert download.meta.content_type == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_download_file_cached(test_db: Database):
+    repo = FileRepository(test_db)
+    chunks = test_db.client["file_service"]["fs.chunks"]
+    content = os.urandom(1000)
+    file_meta = await repo.add_file(
+        storage_user_id="12345", file=UploadFile(filename="logo.txt", file=BytesIO(content))
+    )
+    download = await repo.download_file(storage_user_id="12345", filename="logo.txt")
+    assert await read_all(download) == content
+    hits = content_cache.hits
+    # served from memory, without the chunks
+    await chunks.update_many({"files_id": ObjectId(file_meta.id)}, {"$set": {"files_id": "moved"}})
+    download = await repo.download_file(storage_user_id="12345", filename="logo.txt")
+    assert await read_all(download) == content
+    assert b"".join([data async for data in download.stream(10, 19)]) == content[10:20]
+    assert content_cache.hits == hits + 2
+    # deleting the file drops it from the cache
+    await chunks.update_many({"files_id": "moved"}, {"$set": {"files_id": ObjectId(file_meta.id)}})
+    await repo.delete_file(storage_user_id="12345", filename="logo.txt")
+    assert content_cache.get(file_meta.id, file_meta.md5) is None
+
+
+@pytest.mark.asyncio
+async def test_backfill_metadata(test_db: Database, image_file: Path, text_file: Path):
+    repo = FileRepository(test_db)
+    files = test_db.client["file_service"]["fs.files"]
+    # files stored before content type was recorded
+    with image_file.open("rb") as f:
+        await test_db.grid_client.upload_from_stream(filename="doge", source=f, metadata={"user_id": "12345"})
+    with text_file.open("rb") as f:
+        await test_db.grid_client.upload_from_stream(filename=text_file.name, source=f, metadata={"user_id": "12345"})
+    await files.update_many({}, {"$unset": {"md5": ""}})
+    # and one that already has both
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="new.txt", file=BytesIO(b"new")))
+
+    assert await repo.backfill_metadata(batch_size=1) == 2
+    doge = await repo.read_file_info(storage_user_id="12345", filename="doge")
+    assert doge.content_type == "image/jpeg"
+    assert doge.md5 == hashlib.md5(image_file.read_bytes()).hexdigest()
+    text = await repo.read_file_info(storage_user_id="12345", filename=text_file.name)
+    assert text.content_type == "text/plain"
+    assert text.md5 == hashlib.md5(text_file.read_bytes()).hexdigest()
+    # nothing left to fill in
+    assert await repo.backfill_metadata() == 0
 
 
 @pytest.mark.asyncio
@@ -102,6 +321,71 @@ async def test_read_file_info(test_db: Database, text_file: Path):
     assert info.uploaded_at.min == datetime.utcnow().min
 
 
+@pytest.mark.asyncio
+async def test_read_file_info_cached(test_db: Database, monkeypatch):
+    monkeypatch.setattr(metadata_cache, "version_ttl_seconds", 0.05)
+    repo = FileRepository(test_db)
+    files = test_db.client["file_service"]["fs.files"]
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+    # the miss is cached, so a file written behind the repository's back isn't seen
+    await files.insert_one(
+        {"filename": "a.txt", "length": 1, "uploadDate": datetime.utcnow(), "metadata": {"user_id": "12345"}}
+    )
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+    # another worker moves the storage version after writing, which is seen once the cached version expires
+    await test_db.client["file_service"]["metadata_versions"].update_one(
+        {"_id": "12345"}, {"$inc": {"version": 1}}, upsert=True
+    )
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+    time.sleep(0.1)
+    assert (await repo.read_file_info(storage_user_id="12345", filename="a.txt")).filename == "a.txt"
+
+
+@pytest.mark.asyncio
+async def test_read_file_info_own_write(test_db: Database):
+    repo = FileRepository(test_db)
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+    # a write of this worker moves the cached version, so the miss isn't served
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"a")))
+    assert (await repo.read_file_info(storage_user_id="12345", filename="a.txt")).size == 1
+
+
+@pytest.mark.asyncio
+async def test_read_file_info_cache_invalidation(test_db: Database):
+    repo = FileRepository(test_db)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"a")))
+    assert (await repo.read_file_info(storage_user_id="12345", filename="a.txt")).size == 1
+    assert await repo.delete_file(storage_user_id="12345", filename="a.txt")
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+    # a worker that cached the file before the delete sees the new version
+    metadata_cache.put("12345", "a.txt", 1, {"filename": "a.txt"})
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"ab")))
+    assert (await repo.read_file_info(storage_user_id="12345", filename="a.txt")).size == 2
+
+
+@pytest.mark.asyncio
+async def test_lookup_files(test_db: Database):
+    repo = FileRepository(test_db)
+    for filename in ("a.txt", "b.txt"):
+        await repo.add_file(storage_user_id="12345", file=UploadFile(filename=filename, file=BytesIO(b"a")))
+    await repo.add_file(storage_user_id="other", file=UploadFile(filename="c.txt", file=BytesIO(b"a")))
+    # results follow the order of the filenames, duplicates included
+    infos = await repo.lookup_files("12345", ["b.txt", "c.txt", "a.txt", "b.txt"])
+    assert [info.filename if info else None for info in infos] == ["b.txt", None, "a.txt", "b.txt"]
+    # looked up names are cached, found or not
+    assert metadata_cache.get("12345", "c.txt", await MetadataVersionRepository(test_db).get("12345")) == (True, None)
+    hits = metadata_cache.hits
+    assert (await repo.read_file_info(storage_user_id="12345", filename="a.txt")).filename == "a.txt"
+    assert metadata_cache.hits == hits + 1
+
+
 @pytest.mark.asyncio
 async def test_list_file_info_filename_desc(test_db: Database, text_file: Path, image_file: Path, audio_file: Path):
     # add 3 files with different names, sizes and types
@@ -144,6 +428,50 @@ async def test_list_file_info_filename_asc(test_db: Database, text_file: Path, i
     assert info_list[1].filename > info_list[0].filename
 
 
+@pytest.mark.parametrize("sort_by", ["filename", "length", "uploadDate"])
+@pytest.mark.parametrize("desc", [True, False])
+@pytest.mark.asyncio
+async def test_list_file_info_cursor(test_db: Database, sort_by: str, desc: bool):
+    repo = FileRepository(test_db)
+    # sizes tie, so pages must break ties by id
+    for i in range(7):
+        content = BytesIO(b"x" * (i % 2))
+        await repo.add_file(storage_user_id="12345", file=UploadFile(filename=f"{i}.txt", file=content))
+    everything = [
+        i.id async for i in repo.list_files_info(storage_user_id="12345", offset=0, limit=7, sort_by=sort_by, desc=desc)
+    ]
+    paged, after = [], None
+    while True:
+        page = [
+            i
+            async for i in repo.list_files_info(
+                storage_user_id="12345", offset=0, limit=3, sort_by=sort_by, desc=desc, after=after
+            )
+        ]
+        paged += [i.id for i in page]
+        if len(page) < 3:
+            break
+        last = FileMeta.to_odm(page[-1])
+        after = PageCursor(sort_by, desc, last[sort_by], last["_id"])
+    assert paged == everything
+    assert len(set(paged)) == 7
+
+
+@pytest.mark.asyncio
+async def test_list_file_info_fields(test_db: Database):
+    repo = FileRepository(test_db)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"abc")))
+    info_gen = repo.list_files_info(
+        storage_user_id="12345", offset=0, limit=10, sort_by="length", desc=False, fields=["filename"]
+    )
+    infos = [i async for i in info_gen]
+    assert infos[0].filename == "a.txt"
+    # the sort field is read along with the requested ones, and fields left out are empty
+    assert infos[0].size == 3
+    assert infos[0].md5 is None
+    assert infos[0].user_id is None
+
+
 @pytest.mark.asyncio
 async def test_list_file_info_date_desc(test_db: Database, text_file: Path, image_file: Path, audio_file: Path):
     # add 3 files with different names, sizes and types
@@ -327,6 +655,67 @@ async def test_delete_non_existent_file(test_db: Database, text_file: Path):
     assert result is False
 
 
+@pytest.mark.asyncio
+async def test_delete_files(test_db: Database):
+    repo = FileRepository(test_db)
+    for filename in ("a.txt", "b.txt", "c.txt"):
+        await repo.add_file(storage_user_id="12345", file=UploadFile(filename=filename, file=BytesIO(b"abc")))
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="d.txt", file=BytesIO(b"d")))
+    assert (await repo.get_usage("12345")).files == 4
+    await repo.search_files("12345", "txt")
+
+    outcomes = await repo.delete_files("12345", ["c.txt", "missing.txt", "a.txt", "d.txt"], batch_size=2)
+    assert outcomes == [True, False, True, True]
+    files = test_db.client["file_service"]["fs.files"]
+    assert [doc["filename"] async for doc in files.find()] == ["b.txt"]
+    usage = await repo.get_usage("12345")
+    assert (usage.files, usage.bytes) == (1, 3)
+    # the data is reclaimed later, from the tombstones
+    assert await TrashRepository(test_db).count() == 3
+    assert [meta.filename for meta in await repo.search_files("12345", "txt")] == ["b.txt"]
+    with pytest.raises(FileNotFoundError):
+        await repo.read_file_info(storage_user_id="12345", filename="a.txt")
+
+
+@pytest.mark.asyncio
+async def test_delete_deduplicated_file(test_db: Database):
+    repo = FileRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE + 17)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.bin", file=BytesIO(content)))
+    await repo.add_file(storage_user_id="67890", file=UploadFile(filename="b.bin", file=BytesIO(content)))
+    # the first uploader's delete keeps the content that is still referred to by the other file
+    assert await repo.delete_file(storage_user_id="12345", filename="a.bin")
+    await age_tombstones(test_db)
+    assert await TrashRepository(test_db).collect_deleted(batch_size=10) == (1, [])
+    blob = await test_db.client["file_service"]["fs.blobs"].find_one()
+    assert blob["refcount"] == 1
+    assert await read_all(await repo.download_file(storage_user_id="67890", filename="b.bin")) == content
+    # deleting the last reference leaves the content to be collected
+    assert await repo.delete_file(storage_user_id="67890", filename="b.bin")
+    await age_tombstones(test_db)
+    assert await TrashRepository(test_db).collect_deleted(batch_size=10) == (1, [blob["_id"]])
+    assert not await test_db.client["file_service"]["fs.blobs"].find_one()
+
+
+@pytest.mark.asyncio
+async def test_get_storage_stats(test_db: Database, text_file: Path, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CODEC", "zlib")
+    repo = FileRepository(test_db)
+    # legacy file without a blob
+    with text_file.open("rb") as f:
+        await test_db.grid_client.upload_from_stream(filename=text_file.name, source=f, metadata={"user_id": "12345"})
+    content = b"1,some name,12345\n" * 10_000
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.csv", file=BytesIO(content)))
+    await repo.add_file(storage_user_id="67890", file=UploadFile(filename="b.csv", file=BytesIO(content)))
+
+    stats = await repo.get_storage_stats()
+    assert stats.files == 3
+    assert stats.logical_bytes == text_file.stat().st_size + len(content) * 2
+    assert stats.unique_bytes == text_file.stat().st_size + len(content)
+    assert stats.dedup_saved_bytes == len(content)
+    assert stats.compression_saved_bytes > 0
+
+
 @pytest.mark.asyncio
 async def test_get_storage_usage(test_db: Database, text_file: Path, audio_file: Path, image_file: Path):
     with text_file.open("rb") as f:
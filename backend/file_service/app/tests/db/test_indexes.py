@@ -0,0 +1,52 @@
+import pymongo
+import pytest
+
+from db.database import Database
+from db.indexes import INDEXES, IndexSpec, sync_indexes, check_indexes
+from utils.exceptions import MissingIndexError
+
+
+@pytest.mark.asyncio
+async def test_sync_indexes(test_db: Database):
+    files = test_db.client["file_service"]["fs.files"]
+    # in sync after the fixture
+    assert await sync_indexes(test_db.client) == ([], [])
+    for spec in INDEXES:
+        info = await test_db.client["file_service"][spec.collection].index_information()
+        assert spec.matches(info[spec.name])
+    # indexes no query uses are dropped
+    await files.create_index([("length", pymongo.DESCENDING)])
+    changes = await sync_indexes(test_db.client)
+    assert changes.dropped == ["fs.files.length_-1"]
+    assert "length_-1" not in await files.index_information()
+
+
+@pytest.mark.asyncio
+async def test_sync_indexes_keep_unknown(test_db: Database):
+    files = test_db.client["file_service"]["fs.files"]
+    await files.create_index([("length", pymongo.DESCENDING)])
+    assert await sync_indexes(test_db.client, drop_unknown=False) == ([], [])
+    assert "length_-1" in await files.index_information()
+
+
+@pytest.mark.asyncio
+async def test_sync_indexes_changed(test_db: Database):
+    blobs = test_db.client["file_service"]["fs.blobs"]
+    # the same keys, but not unique anymore
+    changed = [IndexSpec("fs.blobs", [("sha256", pymongo.ASCENDING)])]
+    changes = await sync_indexes(test_db.client, indexes=changed)
+    assert changes == (["fs.blobs.sha256_1"], ["fs.blobs.sha256_1"])
+    assert not (await blobs.index_information())["sha256_1"].get("unique", False)
+
+
+@pytest.mark.asyncio
+async def test_check_indexes(test_db: Database):
+    files = test_db.client["file_service"]["fs.files"]
+    await check_indexes(test_db.client)
+    await files.drop_index("metadata.user_id_1_filename_1")
+    with pytest.raises(MissingIndexError):
+        await check_indexes(test_db.client)
+    # without unique, duplicate filenames would get in
+    await files.create_index([("metadata.user_id", pymongo.ASCENDING), ("filename", pymongo.ASCENDING)])
+    with pytest.raises(MissingIndexError):
+        await check_indexes(test_db.client)
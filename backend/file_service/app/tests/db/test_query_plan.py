@@ -0,0 +1,29 @@
+from db.query_plan import plan_stages, query_filter
+
+
+def test_plan_stages():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "LIMIT",
+                "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "sha256_1"}},
+            },
+            "rejectedPlans": [{"stage": "COLLSCAN"}],
+        }
+    }
+    # rejected plans don't matter
+    assert sorted(plan_stages(explain)) == ["FETCH", "IXSCAN", "LIMIT"]
+    # aggregate puts the plan of the query under its first stage
+    explain = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}}, {"$group": {}}]}
+    assert list(plan_stages(explain)) == ["COLLSCAN"]
+
+
+def test_query_filter():
+    assert query_filter("find", {"find": "fs.files", "filter": {"filename": "a"}}) == {"filename": "a"}
+    assert query_filter("aggregate", {"aggregate": "fs.files", "pipeline": [{"$match": {"a": 1}}]}) == {"a": 1}
+    assert query_filter("aggregate", {"aggregate": "fs.files", "pipeline": [{"$group": {"_id": None}}]}) == {}
+    assert query_filter("delete", {"delete": "fs.chunks", "deletes": [{"q": {"files_id": 1}, "limit": 0}]}) == {
+        "files_id": 1
+    }
+    # writes that don't query anything
+    assert query_filter("insert", {"insert": "fs.files", "documents": []}) is None
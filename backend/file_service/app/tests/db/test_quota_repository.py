@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+
+from db.database import Database
+from db.respositories.file_repository import FileRepository
+from db.respositories.quota_repository import QuotaRepository
+from db.respositories.upload_session_repository import UploadSessionRepository
+from db.respositories.usage_repository import UsageRepository
+from utils.exceptions import QuotaExceededError
+
+
+def later() -> datetime:
+    return datetime.utcnow() + timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+async def test_reserve(test_db: Database):
+    repo = QuotaRepository(test_db)
+    await FileRepository(test_db).add_file(
+        storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"a" * 40))
+    )
+    await repo.set_allowance("12345", 100)
+
+    await repo.reserve("12345", "first", 50, later())
+    # the space of files and uploads in progress both count
+    with pytest.raises(QuotaExceededError):
+        await repo.reserve("12345", "second", 11, later())
+    await repo.reserve("12345", "second", 10, later())
+    assert (await UsageRepository(test_db).get("12345")).reserved == 60
+
+    assert await repo.release("12345", "first")
+    # given back only once
+    assert not await repo.release("12345", "first")
+    assert (await UsageRepository(test_db).get("12345")).reserved == 10
+
+
+@pytest.mark.asyncio
+async def test_reserve_allowance(test_db: Database):
+    repo = QuotaRepository(test_db)
+    # no limit until the allowance is known
+    await repo.reserve("12345", "first", 1000, later())
+    await repo.release("12345", "first")
+    # the one from the uploader's token is only taken if none has been pushed
+    with pytest.raises(QuotaExceededError):
+        await repo.reserve("12345", "second", 1000, later(), allowance=100)
+    await repo.set_allowance("12345", 2000)
+    await repo.reserve("12345", "second", 1000, later(), allowance=100)
+    assert (await UsageRepository(test_db).get("12345")).allowance == 2000
+
+
+@pytest.mark.asyncio
+async def test_reserve_allowance_newer_token(test_db: Database):
+    repo = QuotaRepository(test_db)
+    issued_before = datetime.utcnow() - timedelta(minutes=1)
+    await repo.set_allowance("12345", 100)
+    # a token issued before the push has the older allowance
+    with pytest.raises(QuotaExceededError):
+        await repo.reserve("12345", "first", 1000, later(), allowance=2000, allowance_as_of=issued_before)
+    # one issued after it stands in for a push that failed
+    issued_after = datetime.utcnow() + timedelta(seconds=1)
+    await repo.reserve("12345", "first", 1000, later(), allowance=2000, allowance_as_of=issued_after)
+    assert (await UsageRepository(test_db).get("12345")).allowance == 2000
+
+
+@pytest.mark.asyncio
+async def test_release_expired(test_db: Database):
+    repo = QuotaRepository(test_db)
+    await repo.set_allowance("12345", 100)
+    await repo.reserve("12345", "crashed", 60, datetime.utcnow() - timedelta(minutes=1))
+    session = await UploadSessionRepository(test_db).create_session("12345", "large.txt", 30)
+    await test_db.client["file_service"]["user_usage"].update_one(
+        {"_id": "12345"}, {"$set": {f"reservations.{session.id}.expires_at": datetime.utcnow() - timedelta(minutes=1)}}
+    )
+    # space of expired reservations is taken back when running out
+    await repo.reserve("12345", "next", 70, later())
+    # the upload session still holds its space
+    assert (await UsageRepository(test_db).get("12345")).reserved == 100
+    assert await repo.release_expired() == 0
+
+    await UploadSessionRepository(test_db).abort_session(session)
+    assert (await UsageRepository(test_db).get("12345")).reserved == 70
@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+
+from api.models.search_mode import SearchMode
+from db.database import Database
+from db.respositories import search_repository
+from db.respositories.file_repository import FileRepository
+from utils.exceptions import SearchError
+
+FILENAMES = ["Report.pdf", "annual_report_2020.pdf", "report_draft.docx", "reprot.txt", "invoice.xlsx"]
+
+
+async def add_files(test_db: Database):
+    repo = FileRepository(test_db)
+    for filename in FILENAMES:
+        await repo.add_file(storage_user_id="12345", file=UploadFile(filename=filename, file=BytesIO(b"x")))
+    await repo.add_file(storage_user_id="67890", file=UploadFile(filename="report.pdf", file=BytesIO(b"x")))
+    return repo
+
+
+async def search(repo: FileRepository, pattern: str, mode: SearchMode, limit: int = 10):
+    return [meta.filename for meta in await repo.search_files("12345", pattern, mode, limit)]
+
+
+@pytest.mark.asyncio
+async def test_search_substring(test_db: Database):
+    repo = await add_files(test_db)
+    # case insensitive, names starting with the pattern first
+    found = await search(repo, "REPORT", SearchMode.SUBSTRING)
+    assert found[:2] == ["Report.pdf", "report_draft.docx"]
+    assert set(found) == {"Report.pdf", "report_draft.docx", "annual_report_2020.pdf"}
+    # shorter than a trigram
+    assert set(await search(repo, "x", SearchMode.SUBSTRING)) == {"report_draft.docx", "reprot.txt", "invoice.xlsx"}
+    assert await search(repo, "report", SearchMode.SUBSTRING, limit=1) == ["Report.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_search_prefix(test_db: Database):
+    repo = await add_files(test_db)
+    assert set(await search(repo, "rep", SearchMode.PREFIX)) == {"Report.pdf", "report_draft.docx", "reprot.txt"}
+    assert await search(repo, "an", SearchMode.PREFIX) == ["annual_report_2020.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_search_fuzzy(test_db: Database):
+    repo = await add_files(test_db)
+    found = await search(repo, "reprot.pdf", SearchMode.FUZZY)
+    assert found[0] == "Report.pdf"
+    assert "invoice.xlsx" not in found
+
+
+@pytest.mark.asyncio
+async def test_search_best_matches_kept(test_db: Database, monkeypatch):
+    monkeypatch.setattr(search_repository, "MAX_CANDIDATES", 2)
+    repo = FileRepository(test_db)
+    # many names sharing the trigrams of the extension only, stored before the best matches
+    for n in range(5):
+        await repo.add_file(storage_user_id="12345", file=UploadFile(filename=f"{n}.pdf", file=BytesIO(b"x")))
+    for filename in ["old_report.pdf", "report.pdf"]:
+        await repo.add_file(storage_user_id="12345", file=UploadFile(filename=filename, file=BytesIO(b"x")))
+    assert (await search(repo, "reprt.pdf", SearchMode.FUZZY))[0] == "report.pdf"
+    assert await search(repo, "report.pdf", SearchMode.SUBSTRING) == ["report.pdf", "old_report.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_search_auto(test_db: Database):
+    repo = await add_files(test_db)
+    # plain text is a substring, dots included
+    assert await search(repo, "report.pdf", SearchMode.AUTO) == ["Report.pdf"]
+    assert await search(repo, r"\d", SearchMode.AUTO) == ["annual_report_2020.pdf"]
+    with pytest.raises(SearchError):
+        await search(repo, "(", SearchMode.REGEX)
+
+
+@pytest.mark.asyncio
+async def test_search_follows_files(test_db: Database):
+    repo = FileRepository(test_db)
+    # files stored before the index are indexed on the first search
+    await test_db.grid_client.upload_from_stream(filename="old_report.txt", source=b"x", metadata={"user_id": "12345"})
+    assert await search(repo, "report", SearchMode.SUBSTRING) == ["old_report.txt"]
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="new_report.txt", file=BytesIO(b"x")))
+    assert set(await search(repo, "report", SearchMode.SUBSTRING)) == {"old_report.txt", "new_report.txt"}
+    await repo.delete_file(storage_user_id="12345", filename="old_report.txt")
+    assert await search(repo, "report", SearchMode.SUBSTRING) == ["new_report.txt"]
+    assert not await test_db.client["file_service"]["fs.filename_grams"].find_one(
+        {"user_id": "12345", "name": "old_report.txt"}
+    )
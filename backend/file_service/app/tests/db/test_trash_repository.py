@@ -0,0 +1,72 @@
+from datetime import timedelta
+from io import BytesIO
+
+import pytest
+from bson import ObjectId
+from fastapi import UploadFile
+
+from db.chunks import write_chunks
+from db.database import Database
+from db.respositories.blob_repository import BlobRepository
+from db.respositories.file_repository import FileRepository
+from db.respositories.trash_repository import TrashRepository
+from tests.utils.tombstones import age_tombstones
+
+
+async def as_stream(data: bytes):
+    yield data
+
+
+@pytest.mark.asyncio
+async def test_collect_deleted(test_db: Database):
+    repo = TrashRepository(test_db)
+    file_meta = await FileRepository(test_db).add_file(
+        storage_user_id="12345", file=UploadFile(filename="a.bin", file=BytesIO(b"a" * 1000))
+    )
+    assert await FileRepository(test_db).delete_file(storage_user_id="12345", filename="a.bin")
+    # fresh tombstones are left alone
+    assert await repo.collect_deleted(batch_size=10) == (0, [])
+
+    await age_tombstones(test_db)
+    assert await repo.collect_deleted(batch_size=10) == (1, [ObjectId(file_meta.id)])
+    assert await repo.count() == 0
+    assert await repo.chunks.find_one({"files_id": ObjectId(file_meta.id)})
+    assert await repo.delete_chunks_batch(ObjectId(file_meta.id), batch_size=10) == 1
+    assert await repo.delete_chunks_batch(ObjectId(file_meta.id), batch_size=10) == 0
+    # handled only once
+    assert await repo.collect_deleted(batch_size=10) == (0, [])
+
+
+@pytest.mark.asyncio
+async def test_collect_deleted_file_still_alive(test_db: Database):
+    repo = TrashRepository(test_db)
+    file_meta = await FileRepository(test_db).add_file(
+        storage_user_id="12345", file=UploadFile(filename="a.bin", file=BytesIO(b"a" * 1000))
+    )
+    # a delete that failed after adding its tombstone
+    doc = await repo.files.find_one({"_id": ObjectId(file_meta.id)})
+    assert await repo.add([doc]) == [doc["_id"]]
+    # only one tombstone per file
+    assert await repo.add([doc]) == []
+
+    await age_tombstones(test_db)
+    assert await repo.collect_deleted(batch_size=10) == (1, [])
+    assert (await BlobRepository(test_db).blobs.find_one({"_id": doc["_id"]}))["refcount"] == 1
+
+
+@pytest.mark.asyncio
+async def test_find_orphan_chunks(test_db: Database):
+    repo = TrashRepository(test_db)
+    blob_id, orphan_id = ObjectId(), ObjectId()
+    for files_id in (blob_id, orphan_id):
+        await write_chunks(repo.chunks, files_id, as_stream(b"a" * 100), chunk_size=10)
+    await BlobRepository(test_db).add_blob(blob_id, sha256="abc", length=100, chunk_size=10)
+
+    # too recent, as the upload may still be going on
+    assert await repo.find_orphan_chunks(None, batch_size=10, grace=timedelta(hours=1)) == ([], None)
+    # looked through a few owners at a time
+    orphans, position = await repo.find_orphan_chunks(None, batch_size=1, grace=timedelta(0))
+    assert position == min(blob_id, orphan_id)
+    orphans += (await repo.find_orphan_chunks(position, batch_size=1, grace=timedelta(0)))[0]
+    assert orphans == [orphan_id]
+    assert await repo.find_orphan_chunks(max(blob_id, orphan_id), batch_size=1, grace=timedelta(0)) == ([], None)
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from bson import ObjectId
+from gridfs import DEFAULT_CHUNK_SIZE
+
+from config import settings
+from db.database import Database
+from db.respositories.upload_session_repository import UploadSessionRepository
+from utils.exceptions import UploadSessionError, FileTooLargeError
+
+
+async def as_stream(data: bytes, piece_size: int = 1000):
+    for i in range(0, len(data), piece_size):
+        yield data[i : i + piece_size]
+
+
+@pytest.fixture(scope="function")
+def small_parts(monkeypatch):
+    # make parts as small as a single chunk so that a small file spans several parts
+    monkeypatch.setattr(settings, "UPLOAD_PART_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+@pytest.mark.asyncio
+async def test_create_session(test_db: Database):
+    session = await UploadSessionRepository(test_db).create_session("12345", "large.txt", 1000)
+    doc = await test_db.client["file_service"]["upload_sessions"].find_one({"_id": ObjectId(session.id)})
+    assert doc["filename"] == "large.txt"
+    assert doc["length"] == 1000
+    # parts are aligned to the chunks
+    assert session.part_size % session.chunk_size == 0
+
+
+@pytest.mark.asyncio
+async def test_create_session_existing_file(test_db: Database):
+    await test_db.grid_client.upload_from_stream(filename="large.txt", source=b"abc", metadata={"user_id": "12345"})
+    with pytest.raises(FileExistsError):
+        await UploadSessionRepository(test_db).create_session("12345", "large.txt", 1000)
+
+
+@pytest.mark.asyncio
+async def test_get_session_not_found(test_db: Database):
+    with pytest.raises(FileNotFoundError):
+        await UploadSessionRepository(test_db).get_session(str(ObjectId()))
+    with pytest.raises(FileNotFoundError):
+        await UploadSessionRepository(test_db).get_session("not_an_id")
+
+
+@pytest.mark.asyncio
+async def test_upload_parts_out_of_order_and_complete(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE * 2 + 100)
+    session = await repo.create_session("12345", "large.txt", len(content))
+    assert session.part_count == 3
+    # send the parts in reverse order
+    for n in reversed(range(session.part_count)):
+        part = content[n * session.part_size : (n + 1) * session.part_size]
+        received = await repo.write_part(session, n, as_stream(part))
+        assert received.md5 == hashlib.md5(part).hexdigest()
+
+    received_session = await repo.get_session(session.id)
+    assert sorted(received_session.parts) == [0, 1, 2]
+
+    file_meta = await repo.complete_session(received_session)
+    assert file_meta.size == len(content)
+    assert file_meta.md5 == hashlib.md5(content).hexdigest()
+    # the assembled file is a regular GridFS file
+    grid_out = await test_db.grid_client.open_download_stream(ObjectId(file_meta.id))
+    assert await grid_out.read() == content
+    # the session is gone once completed
+    assert not await test_db.client["file_service"]["upload_sessions"].find_one({"_id": ObjectId(session.id)})
+
+
+@pytest.mark.asyncio
+async def test_upload_parts_concurrently(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE * 7 + 100)
+    session = await repo.create_session("12345", "large.txt", len(content))
+    # all parts are in flight at the same time, like parallel part uploads from a client
+    await asyncio.gather(
+        *[
+            repo.write_part(session, n, as_stream(content[n * session.part_size : (n + 1) * session.part_size]))
+            for n in range(session.part_count)
+        ]
+    )
+    file_meta = await repo.complete_session(await repo.get_session(session.id))
+    assert file_meta.md5 == hashlib.md5(content).hexdigest()
+    grid_out = await test_db.grid_client.open_download_stream(ObjectId(file_meta.id))
+    assert await grid_out.read() == content
+
+
+@pytest.mark.asyncio
+async def test_upload_part_again(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE + 100)
+    session = await repo.create_session("12345", "large.txt", len(content))
+    # a broken part is rejected and can be sent again
+    with pytest.raises(UploadSessionError):
+        await repo.write_part(session, 0, as_stream(content[:1000]))
+    await repo.write_part(session, 0, as_stream(content[: session.part_size]))
+    await repo.write_part(session, 1, as_stream(content[session.part_size :]))
+    file_meta = await repo.complete_session(await repo.get_session(session.id))
+    grid_out = await test_db.grid_client.open_download_stream(ObjectId(file_meta.id))
+    assert await grid_out.read() == content
+
+
+@pytest.mark.asyncio
+async def test_upload_part_again_broken(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE + 100)
+    session = await repo.create_session("12345", "large.txt", len(content))
+    await repo.write_part(session, 0, as_stream(content[: session.part_size]))
+    await repo.write_part(session, 1, as_stream(content[session.part_size :]))
+    # a re-send that breaks off has already overwritten some chunks, so the old part can't be used anymore
+    with pytest.raises(UploadSessionError):
+        await repo.write_part(session, 0, as_stream(os.urandom(1000)))
+    session = await repo.get_session(session.id)
+    assert 0 not in session.parts
+    with pytest.raises(UploadSessionError, match=r"Missing parts: \[0\]"):
+        await repo.complete_session(session)
+
+
+@pytest.mark.asyncio
+async def test_upload_part_too_big(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    session = await repo.create_session("12345", "large.txt", DEFAULT_CHUNK_SIZE + 100)
+    with pytest.raises(FileTooLargeError):
+        await repo.write_part(session, 1, as_stream(b"a" * 101))
+
+
+@pytest.mark.asyncio
+async def test_upload_part_invalid_number(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    session = await repo.create_session("12345", "large.txt", 100)
+    with pytest.raises(UploadSessionError):
+        await repo.write_part(session, 1, as_stream(b"a" * 100))
+
+
+@pytest.mark.asyncio
+async def test_complete_session_missing_parts(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE + 100)
+    session = await repo.create_session("12345", "large.txt", len(content))
+    await repo.write_part(session, 1, as_stream(content[session.part_size :]))
+    with pytest.raises(UploadSessionError):
+        await repo.complete_session(await repo.get_session(session.id))
+
+
+@pytest.mark.asyncio
+async def test_abort_session(test_db: Database, small_parts):
+    repo = UploadSessionRepository(test_db)
+    content = os.urandom(DEFAULT_CHUNK_SIZE + 100)
+    session = await repo.create_session("12345", "large.txt", len(content))
+    await repo.write_part(session, 0, as_stream(content[: session.part_size]))
+    await repo.abort_session(session)
+    assert not await test_db.client["file_service"]["upload_sessions"].find_one({"_id": ObjectId(session.id)})
+    assert not await test_db.client["file_service"]["fs.chunks"].find_one({"files_id": ObjectId(session.id)})
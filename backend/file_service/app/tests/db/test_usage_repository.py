@@ -0,0 +1,91 @@
+from datetime import timedelta
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+
+from db.database import Database
+from db.respositories import usage_repository
+from db.respositories.file_repository import FileRepository
+from db.respositories.usage_repository import UsageRepository
+
+
+@pytest.mark.asyncio
+async def test_usage_follows_files(test_db: Database):
+    repo = FileRepository(test_db)
+    usage_repo = UsageRepository(test_db)
+    # computed from the files on the first read
+    await test_db.grid_client.upload_from_stream(filename="old.txt", source=b"12345", metadata={"user_id": "12345"})
+    usage = await usage_repo.get("12345")
+    assert (usage.files, usage.bytes) == (1, 5)
+
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"abc")))
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="b.txt", file=BytesIO(b"de")))
+    await repo.delete_file(storage_user_id="12345", filename="old.txt")
+    usage = await usage_repo.get("12345")
+    assert (usage.files, usage.bytes) == (2, 5)
+    assert await repo.get_files_count("12345") == 2
+    assert await repo.get_storage_usage("12345") == 5
+    # other users aren't touched
+    assert await repo.get_files_count("67890") == 0
+
+
+@pytest.mark.asyncio
+async def test_usage_counted_once(test_db: Database):
+    repo = FileRepository(test_db)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"abc")))
+    # counters are created on the first read, including the files added before
+    assert await repo.get_storage_usage("12345") == 3
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="b.txt", file=BytesIO(b"de")))
+    assert await repo.get_storage_usage("12345") == 5
+
+
+@pytest.mark.asyncio
+async def test_reconcile(test_db: Database, monkeypatch):
+    monkeypatch.setattr(usage_repository, "DRIFT_GRACE", timedelta(0))
+    repo = FileRepository(test_db)
+    usage_repo = UsageRepository(test_db)
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="a.txt", file=BytesIO(b"abc")))
+    await repo.add_file(storage_user_id="67890", file=UploadFile(filename="a.txt", file=BytesIO(b"abc")))
+    await usage_repo.get("12345")
+    await usage_repo.get("67890")
+    assert await usage_repo.reconcile() == 0
+    # drift, eg. from a file added without going through the repository
+    await test_db.grid_client.upload_from_stream(filename="b.txt", source=b"de", metadata={"user_id": "12345"})
+    assert await repo.get_files_count("12345") == 1
+    # only recorded the first time it's seen
+    assert await usage_repo.reconcile() == 0
+    assert await repo.get_files_count("12345") == 1
+    # files added meanwhile are counted as usual
+    await repo.add_file(storage_user_id="12345", file=UploadFile(filename="c.txt", file=BytesIO(b"f")))
+    assert await usage_repo.reconcile() == 1
+    usage = await usage_repo.get("12345")
+    assert (usage.files, usage.bytes) == (3, 6)
+    assert await usage_repo.reconcile() == 0
+
+
+@pytest.mark.asyncio
+async def test_reconcile_upload_in_progress(test_db: Database, monkeypatch):
+    monkeypatch.setattr(usage_repository, "DRIFT_GRACE", timedelta(0))
+    usage_repo = UsageRepository(test_db)
+    await usage_repo.get("12345")
+    # an upload that has added its entry but not moved the counters yet
+    await test_db.grid_client.upload_from_stream(filename="a.txt", source=b"abc", metadata={"user_id": "12345"})
+    assert await usage_repo.reconcile() == 0
+    await usage_repo.add("12345", files=1, size=3)
+    # the mismatch is gone by the next run, and the counters are left as they are
+    assert await usage_repo.reconcile() == 0
+    usage = await usage_repo.get("12345")
+    assert (usage.files, usage.bytes) == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_drift_too_recent(test_db: Database):
+    repo = FileRepository(test_db)
+    usage_repo = UsageRepository(test_db)
+    await usage_repo.get("12345")
+    await test_db.grid_client.upload_from_stream(filename="a.txt", source=b"abc", metadata={"user_id": "12345"})
+    # seen twice in a row, but not long enough apart
+    assert await usage_repo.reconcile() == 0
+    assert await usage_repo.reconcile() == 0
+    assert await repo.get_files_count("12345") == 0
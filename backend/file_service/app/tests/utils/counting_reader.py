@@ -0,0 +1,16 @@
+from io import BytesIO
+
+
+class CountingReader(BytesIO):
+    """
+    In-memory file that keeps track of how many bytes have been read out of it
+    """
+
+    def __init__(self, content: bytes):
+        super().__init__(content)
+        self.bytes_served = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        self.bytes_served += len(data)
+        return data
@@ -0,0 +1,48 @@
+import pytest
+
+from utils.byte_range import ByteRange, parse_range_header, multipart_length, multipart_part_header, multipart_end
+from utils.exceptions import RangeNotSatisfiableError
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-499", [ByteRange(0, 499)]),
+        ("bytes=500-", [ByteRange(500, 999)]),
+        ("bytes=-200", [ByteRange(800, 999)]),
+        ("bytes=-2000", [ByteRange(0, 999)]),
+        # the end is clamped to the file
+        ("bytes=900-1999", [ByteRange(900, 999)]),
+        ("bytes=0-0, 10-19,-1", [ByteRange(0, 0), ByteRange(10, 19), ByteRange(999, 999)]),
+        # unsatisfiable ranges are dropped as long as one of them is satisfiable
+        ("bytes=0-9, 5000-6000", [ByteRange(0, 9)]),
+    ],
+)
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    [None, "", "bytes=", "items=0-10", "bytes=abc", "bytes=10-5", "bytes=1-2-3", "bytes=-", "bytes=" + "0-1," * 17],
+)
+def test_parse_range_header_ignored(header):
+    # invalid range requests are served with the whole file
+    assert parse_range_header(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_parse_range_header_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiableError) as e:
+        parse_range_header(header, 1000)
+    assert str(e.value) == "bytes */1000"
+
+
+def test_multipart_length():
+    ranges = [ByteRange(0, 9), ByteRange(100, 149)]
+    body = b""
+    for r in ranges:
+        body += multipart_part_header("boundary", "text/plain", r, 1000) + b"a" * r.size + b"\r\n"
+    body += multipart_end("boundary")
+    assert multipart_length("boundary", "text/plain", ranges, 1000) == len(body)
+    assert b"Content-Range: bytes 100-149/1000\r\n" in body
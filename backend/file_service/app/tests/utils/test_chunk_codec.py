@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from utils.chunk_codec import get_codec, choose_codec, ZlibCodec, ChunkCodec
+
+
+def test_zlib_round_trip():
+    codec = get_codec("zlib")
+    data = b"This is a test file" * 1000
+    encoded = codec.encode(data)
+    assert len(encoded) < len(data)
+    assert codec.decode(encoded) == data
+
+
+@pytest.mark.asyncio
+async def test_zlib_round_trip_off_loop():
+    codec = get_codec("zlib")
+    data = b"This is a test file" * 1000
+    encoded = await codec.encode_async(data)
+    assert encoded == codec.encode(data)
+    assert await codec.decode_async(encoded) == data
+    # raw chunks are passed through without going to the executor
+    assert await get_codec(None).encode_async(data) is data
+
+
+def test_no_codec():
+    # files stored before chunk codecs don't have any codec recorded
+    assert get_codec(None).name == "none"
+    assert get_codec(None).decode(b"abc") == b"abc"
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("lzma")
+
+
+@pytest.mark.asyncio
+async def test_choose_codec_text():
+    assert isinstance(await choose_codec("zlib", "text/plain", "text.txt", b"a,b,c\n" * 100), ZlibCodec)
+
+
+@pytest.mark.asyncio
+async def test_choose_codec_disabled():
+    assert (await choose_codec("none", "text/plain", "text.txt", b"a,b,c\n" * 100)).name == "none"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "content_type,filename",
+    [
+        ("image/jpeg", "doge.jpg"),
+        ("audio/x-wav", "meow.wav"),
+        ("video/mp4", "clip.mp4"),
+        (None, "archive.zip"),
+        (None, "report.docx"),
+    ],
+)
+async def test_choose_codec_already_compressed(content_type, filename):
+    assert type(await choose_codec("zlib", content_type, filename, b"a" * 1000)) is ChunkCodec
+
+
+@pytest.mark.asyncio
+async def test_choose_codec_incompressible_sample():
+    # random bytes don't compress, whatever the file says it is
+    assert (await choose_codec("zlib", "text/plain", "text.txt", os.urandom(10_000))).name == "none"
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+from utils.conditional_request import make_etag, make_info_etag, http_date, is_not_modified, if_range_matches
+
+LAST_MODIFIED = datetime(2021, 3, 4, 5, 6, 7, 890000)
+ETAG = make_etag("0123456789abcdef")
+
+
+def test_http_date():
+    assert http_date(LAST_MODIFIED) == "Thu, 04 Mar 2021 05:06:07 GMT"
+
+
+def test_not_modified_etag():
+    assert is_not_modified(ETAG, None, ETAG, LAST_MODIFIED)
+    assert is_not_modified(f'"other", W/{ETAG}', None, ETAG, LAST_MODIFIED)
+    assert is_not_modified("*", None, ETAG, LAST_MODIFIED)
+    assert not is_not_modified('"other"', None, ETAG, LAST_MODIFIED)
+
+
+def test_not_modified_since():
+    assert is_not_modified(None, http_date(LAST_MODIFIED), ETAG, LAST_MODIFIED)
+    assert is_not_modified(None, http_date(LAST_MODIFIED + timedelta(days=1)), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(None, http_date(LAST_MODIFIED - timedelta(seconds=1)), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(None, "not a date", ETAG, LAST_MODIFIED)
+
+
+def test_etag_takes_precedence():
+    # a matching date doesn't matter once the entity tag doesn't match
+    assert not is_not_modified('"other"', http_date(LAST_MODIFIED), ETAG, LAST_MODIFIED)
+
+
+def test_if_range():
+    assert if_range_matches(None, ETAG, LAST_MODIFIED)
+    assert if_range_matches(ETAG, ETAG, LAST_MODIFIED)
+    assert if_range_matches(http_date(LAST_MODIFIED), ETAG, LAST_MODIFIED)
+    assert not if_range_matches('"other"', ETAG, LAST_MODIFIED)
+    # weak tags never match
+    assert not if_range_matches(f"W/{ETAG}", ETAG, LAST_MODIFIED)
+    assert not if_range_matches(http_date(LAST_MODIFIED + timedelta(days=1)), ETAG, LAST_MODIFIED)
+
+
+def test_make_info_etag():
+    assert make_info_etag("0123456789abcdef", LAST_MODIFIED) == '"0123456789abcdef-1614834367890"'
+    # the same content uploaded again
+    assert make_info_etag("0123456789abcdef", LAST_MODIFIED + timedelta(seconds=1)) != make_info_etag(
+        "0123456789abcdef", LAST_MODIFIED
+    )
@@ -0,0 +1,50 @@
+from utils.content_cache import ContentCache
+
+
+def test_get_put():
+    cache = ContentCache(max_bytes=100, max_entry_bytes=50)
+    assert cache.get("a", "md5") is None
+    cache.put("a", "md5", b"data")
+    assert cache.get("a", "md5") == b"data"
+    # a different md5 is a different content
+    assert cache.get("a", "other") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.current_bytes == 4
+
+
+def test_entry_size_limit():
+    cache = ContentCache(max_bytes=100, max_entry_bytes=10)
+    cache.put("a", "md5", bytes(11))
+    assert len(cache) == 0
+    assert cache.current_bytes == 0
+
+
+def test_lru_eviction():
+    cache = ContentCache(max_bytes=30, max_entry_bytes=10)
+    for file_id in "abc":
+        cache.put(file_id, "md5", bytes(10))
+    # "a" is used, so "b" is the least recently used
+    cache.get("a", "md5")
+    cache.put("d", "md5", bytes(10))
+    assert cache.get("b", "md5") is None
+    assert cache.get("a", "md5") is not None
+    assert cache.evictions == 1
+    assert cache.current_bytes == 30
+
+
+def test_invalidate():
+    cache = ContentCache(max_bytes=100, max_entry_bytes=50)
+    cache.put("a", "md5", b"data")
+    cache.put("a", "new", b"new data")
+    assert len(cache) == 1
+    assert cache.current_bytes == 8
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a", "new") is None
+    assert cache.current_bytes == 0
+
+
+def test_disabled():
+    cache = ContentCache(max_bytes=0, max_entry_bytes=1024)
+    cache.put("a", "md5", b"data")
+    assert cache.get("a", "md5") is None
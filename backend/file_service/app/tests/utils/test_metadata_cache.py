@@ -0,0 +1,75 @@
+import time
+
+from utils.metadata_cache import MetadataCache
+
+
+def test_get_put():
+    cache = MetadataCache(max_entries=10, ttl_seconds=60)
+    assert cache.get("user", "a.txt", 1) == (False, None)
+    cache.put("user", "a.txt", 1, {"filename": "a.txt"})
+    assert cache.get("user", "a.txt", 1) == (True, {"filename": "a.txt"})
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_missing_file():
+    cache = MetadataCache(max_entries=10, ttl_seconds=60)
+    cache.put("user", "a.txt", 1, None)
+    assert cache.get("user", "a.txt", 1) == (True, None)
+
+
+def test_version_change():
+    cache = MetadataCache(max_entries=10, ttl_seconds=60)
+    cache.put("user", "a.txt", 1, {"filename": "a.txt"})
+    # the storage was changed by someone else
+    assert cache.get("user", "a.txt", 2) == (False, None)
+    assert len(cache) == 0
+
+
+def test_expiry():
+    cache = MetadataCache(max_entries=10, ttl_seconds=0.01)
+    cache.put("user", "a.txt", 1, {"filename": "a.txt"})
+    time.sleep(0.02)
+    assert cache.get("user", "a.txt", 1) == (False, None)
+
+
+def test_lru_eviction():
+    cache = MetadataCache(max_entries=3, ttl_seconds=60)
+    for filename in "abc":
+        cache.put("user", filename, 1, None)
+    # "a" is used, so "b" is the least recently used
+    cache.get("user", "a", 1)
+    cache.put("user", "d", 1, None)
+    assert cache.get("user", "b", 1) == (False, None)
+    assert cache.get("user", "a", 1) == (True, None)
+    assert cache.evictions == 1
+    assert len(cache) == 3
+
+
+def test_invalidate():
+    cache = MetadataCache(max_entries=10, ttl_seconds=60)
+    cache.put("user", "a.txt", 1, None)
+    cache.invalidate("user", "a.txt")
+    assert len(cache) == 0
+
+
+def test_disabled():
+    cache = MetadataCache(max_entries=0, ttl_seconds=60)
+    cache.put("user", "a.txt", 1, None)
+    assert len(cache) == 0
+
+
+def test_version():
+    cache = MetadataCache(max_entries=10, ttl_seconds=60, version_ttl_seconds=0.01)
+    assert cache.get_version("user") is None
+    cache.put_version("user", 2)
+    # a version read before a later write doesn't replace the newer one
+    cache.put_version("user", 1)
+    assert cache.get_version("user") == 2
+    time.sleep(0.02)
+    assert cache.get_version("user") is None
+
+
+def test_version_disabled():
+    cache = MetadataCache(max_entries=10, ttl_seconds=60)
+    cache.put_version("user", 1)
+    assert cache.get_version("user") is None
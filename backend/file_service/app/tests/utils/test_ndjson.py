@@ -0,0 +1,37 @@
+from typing import AsyncIterator, List
+
+import pytest
+
+from utils.ndjson import read_lines, dump_line
+
+
+async def stream(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(items) -> List:
+    return [item async for item in items]
+
+
+@pytest.mark.asyncio
+async def test_read_lines_across_chunks():
+    chunks = (b'{"filename": "a.t', b'xt"}\n\n{"filename"', b': "b.txt"}\n{"filename": "c.txt"}')
+    lines = await collect(read_lines(stream(*chunks)))
+    assert lines == [{"filename": "a.txt"}, {"filename": "b.txt"}, {"filename": "c.txt"}]
+
+
+@pytest.mark.asyncio
+async def test_read_lines_invalid():
+    with pytest.raises(ValueError):
+        await collect(read_lines(stream(b'{"filename": "a.txt"}\nnot json\n')))
+
+
+@pytest.mark.asyncio
+async def test_read_lines_too_long():
+    with pytest.raises(ValueError):
+        await collect(read_lines(stream(b"x" * 100, b"x" * 100), max_line_size=150))
+
+
+def test_dump_line():
+    assert dump_line({"filename": "a.txt", "exists": False}) == b'{"filename":"a.txt","exists":false}\n'
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from utils.exceptions import InvalidCursorError
+from utils.page_cursor import PageCursor, sort_keys
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        PageCursor("filename", True, "text.txt", ObjectId()),
+        PageCursor("length", False, 1234, ObjectId()),
+        PageCursor("uploadDate", True, datetime(2021, 5, 1, 12, 30, 15, 123000), ObjectId()),
+    ],
+)
+def test_encode_decode(cursor):
+    token = cursor.encode()
+    # tokens go into query strings as they are
+    assert all(c.isalnum() or c in "-_" for c in token)
+    assert PageCursor.decode(token) == cursor
+
+
+@pytest.mark.parametrize(
+    "token", ["", "not a cursor", "AAAA", PageCursor("metadata.user_id", True, "someone", ObjectId()).encode()]
+)
+def test_decode_invalid(token):
+    with pytest.raises(InvalidCursorError):
+        PageCursor.decode(token)
+
+
+def test_query():
+    file_id = ObjectId()
+    assert PageCursor("length", True, 10, file_id).query() == {
+        "length": {"$lte": 10},
+        "$or": [{"length": {"$lt": 10}}, {"_id": {"$lt": file_id}}],
+    }
+    # filenames are unique within a storage
+    assert PageCursor("filename", False, "a.txt", file_id).query() == {"filename": {"$gt": "a.txt"}}
+
+
+def test_sort_keys():
+    assert sort_keys("length", True) == [("length", -1), ("_id", -1)]
+    assert sort_keys("filename", False) == [("filename", 1)]
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt
+
+from api.models.jwt_payload import JWTPayload
+from api.models.role import Role
+from config import settings
+from utils.token import auth_with_jwt
+from utils.token_cache import TokenCache, token_cache
+
+
+def make_payload(exp: datetime) -> JWTPayload:
+    return JWTPayload(sub="user_id", exp=exp, role=Role.VIEWER, username="guy", email="halla@world.com")
+
+
+def test_get_put():
+    cache = TokenCache(max_entries=10)
+    payload = make_payload(datetime.now(timezone.utc) + timedelta(hours=1))
+    assert cache.get("token") is None
+    cache.put("token", payload)
+    assert cache.get("token") is payload
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_ratio == 0.5
+
+
+def test_expiry():
+    cache = TokenCache(max_entries=10)
+    cache.put("token", make_payload(datetime.now(timezone.utc) - timedelta(seconds=1)))
+    # expired tokens are never served, and have to be verified again
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TokenCache(max_entries=2)
+    payload = make_payload(datetime.now(timezone.utc) + timedelta(hours=1))
+    cache.put("a", payload)
+    cache.put("b", payload)
+    # "a" is used, so "b" is the least recently used
+    cache.get("a")
+    cache.put("c", payload)
+    assert cache.get("b") is None
+    assert cache.get("a") is payload
+    assert cache.evictions == 1
+
+
+def test_disabled():
+    cache = TokenCache(max_entries=0)
+    cache.put("token", make_payload(datetime.now(timezone.utc) + timedelta(hours=1)))
+    assert cache.get("token") is None
+
+
+def test_saved_seconds():
+    cache = TokenCache(max_entries=10)
+    cache.misses, cache.miss_seconds = 2, 0.002
+    cache.hits, cache.hit_seconds = 10, 0.001
+    assert abs(cache.saved_seconds - 0.009) < 1e-9
+
+
+def test_auth_with_jwt_cached():
+    payload = make_payload(datetime(2077, 1, 1))
+    token = jwt.encode(payload.dict(), key=settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    hits = token_cache.hits
+    first = auth_with_jwt(token)
+    # the second request with the token skips verification
+    assert auth_with_jwt(token) is first
+    assert token_cache.hits == hits + 1
+    assert first.sub == "user_id"
@@ -0,0 +1,27 @@
+import pytest
+
+from utils.trigram import trigrams, substring_trigrams, prefix_trigrams, similarity, is_regex
+
+
+def test_trigrams():
+    assert trigrams("Ab") == {"  a", " ab", "ab "}
+    assert substring_trigrams("ab") == set()
+    assert substring_trigrams("Abcd") == {"abc", "bcd"}
+    assert prefix_trigrams("ab") == {"  a", " ab"}
+    # a name has every trigram of its prefixes and substrings
+    assert prefix_trigrams("repo") <= trigrams("Report.pdf")
+    assert substring_trigrams("port") <= trigrams("Report.pdf")
+
+
+def test_similarity():
+    assert similarity(trigrams("report"), trigrams("report")) == 1
+    assert similarity(trigrams("report"), trigrams("reprot")) > similarity(trigrams("report"), trigrams("invoice"))
+    assert similarity(set(), trigrams("report")) == 0
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [("report", False), ("report.pdf", False), ("my file 1", False), (r"\d", True), ("^rep", True), ("a|b", True)],
+)
+def test_is_regex(pattern, expected):
+    assert is_regex(pattern) == expected
@@ -0,0 +1,79 @@
+import hashlib
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from fastapi import UploadFile
+
+from tests.utils.counting_reader import CountingReader
+from utils.exceptions import FileTooLargeError
+from utils.upload_pipeline import UploadPipeline
+
+
+async def consume(pipeline: UploadPipeline) -> bytes:
+    return b"".join([chunk async for chunk in pipeline.chunks()])
+
+
+@pytest.mark.asyncio
+async def test_every_byte_read_once():
+    content = bytes(range(256)) * 1000
+    reader = CountingReader(content)
+    pipeline = UploadPipeline(UploadFile(filename="bytes.txt", file=reader), size_limit=len(content), chunk_size=1000)
+    assert await consume(pipeline) == content
+    # the source is read exactly once, in a single pass
+    assert reader.bytes_served == len(content)
+    assert pipeline.bytes_read == len(content)
+    assert pipeline.md5 == hashlib.md5(content).hexdigest()
+    assert pipeline.sha256 == hashlib.sha256(content).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_size_limit():
+    content = b"a" * 2000
+    pipeline = UploadPipeline(UploadFile(filename="a.txt", file=BytesIO(content)), size_limit=1050, chunk_size=100)
+    with pytest.raises(FileTooLargeError):
+        await consume(pipeline)
+    # reading stops at the chunk that crosses the limit
+    assert pipeline.bytes_read == 1100
+
+
+@pytest.mark.asyncio
+async def test_sniff_content_type(image_file: Path):
+    with image_file.open("rb") as f:
+        # use a chunk size smaller than the sniffing window to make sure the head is assembled across chunks
+        pipeline = UploadPipeline(UploadFile(filename="no_extension", file=f), size_limit=10_000_000, chunk_size=100)
+        await consume(pipeline)
+    assert pipeline.content_type == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_sniff_content_type_fallback(text_file: Path):
+    with text_file.open("rb") as f:
+        pipeline = UploadPipeline(UploadFile(filename=text_file.name, file=f), size_limit=10_000_000)
+        await consume(pipeline)
+    # plain text has no magic number, so the type is guessed from the filename
+    assert pipeline.content_type == "text/plain"
+
+
+@pytest.mark.asyncio
+async def test_sniff_content_type_empty_file():
+    pipeline = UploadPipeline(UploadFile(filename="empty", file=BytesIO()), size_limit=100)
+    assert await consume(pipeline) == b""
+    assert pipeline.content_type == "application/octet-stream"
+
+
+@pytest.mark.asyncio
+async def test_choose_codec(text_file: Path, image_file: Path):
+    with text_file.open("rb") as f:
+        pipeline = UploadPipeline(
+            UploadFile(filename=text_file.name, file=f), size_limit=10_000_000, preferred_codec="zlib"
+        )
+        await consume(pipeline)
+    assert pipeline.codec.name == "zlib"
+    # images are already compressed
+    with image_file.open("rb") as f:
+        pipeline = UploadPipeline(
+            UploadFile(filename=image_file.name, file=f), size_limit=10_000_000, preferred_codec="zlib"
+        )
+        await consume(pipeline)
+    assert pipeline.codec.name == "none"
@@ -0,0 +1,12 @@
+from datetime import timedelta
+
+from db.database import Database
+
+
+async def age_tombstones(db: Database, age: timedelta = timedelta(hours=1)) -> None:
+    """
+    Move the deletion time of all tombstones back, so the garbage collector takes them
+    """
+    trash = db.client["file_service"]["deleted_files"]
+    async for doc in trash.find({}, {"deleted_at": 1}):
+        await trash.update_one({"_id": doc["_id"]}, {"$set": {"deleted_at": doc["deleted_at"] - age}})
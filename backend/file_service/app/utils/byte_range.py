@@ -0,0 +1,113 @@
+"""
+HTTP byte range requests as specified in RFC 7233.
+"""
+import secrets
+from typing import List, NamedTuple, Optional
+
+from utils.exceptions import RangeNotSatisfiableError
+
+# requests with more ranges than this are served in full, as allowed by the RFC
+MAX_RANGES = 16
+
+
+class ByteRange(NamedTuple):
+    start: int  # first byte position
+    end: int  # last byte position, inclusive
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    def content_range(self, length: int) -> str:
+        return f"bytes {self.start}-{self.end}/{length}"
+
+
+def parse_range_header(header: Optional[str], length: int) -> Optional[List[ByteRange]]:
+    """
+    Parse the value of a Range header.
+    Ranges that can't be satisfied are dropped, and the rest are clamped to the length of the file.
+    Args:
+        header: value of the Range header
+        length: size of the file in bytes
+
+    Raises:
+        RangeNotSatisfiableError: if none of the ranges overlap the file
+
+    Returns:
+        requested ranges in the requested order, or None if the whole file should be sent
+    """
+    if not header:
+        return None
+    unit, _, range_set = header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        # unsupported or invalid range requests are ignored
+        return None
+    specs = [spec.strip() for spec in range_set.split(",") if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = (part.strip() for part in spec.partition("-"))
+        if not dash or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            # suffix range for the last n bytes
+            suffix = int(last)
+            if suffix == 0 or length == 0:
+                continue
+            ranges.append(ByteRange(max(length - suffix, 0), length - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= length:
+            continue
+        ranges.append(ByteRange(start, min(int(last), length - 1) if last else length - 1))
+    if not ranges:
+        raise RangeNotSatisfiableError(f"bytes */{length}")
+    return ranges
+
+
+def new_boundary() -> str:
+    return secrets.token_hex(16)
+
+
+def multipart_part_header(boundary: str, content_type: Optional[str], byte_range: ByteRange, length: int) -> bytes:
+    """
+    Headers of a body part in a multipart/byteranges response, including the preceding boundary
+    Args:
+        boundary: multipart boundary
+        content_type: content type of the file
+        byte_range: range the part holds
+        length: size of the file in bytes
+
+    Returns:
+        encoded part headers
+    """
+    header = f"--{boundary}\r\n"
+    if content_type:
+        header += f"Content-Type: {content_type}\r\n"
+    header += f"Content-Range: {byte_range.content_range(length)}\r\n\r\n"
+    return header.encode()
+
+
+def multipart_end(boundary: str) -> bytes:
+    return f"--{boundary}--\r\n".encode()
+
+
+def multipart_length(boundary: str, content_type: Optional[str], ranges: List[ByteRange], length: int) -> int:
+    """
+    Size of the whole multipart/byteranges body, so Content-Length can be sent before the body
+    Args:
+        boundary: multipart boundary
+        content_type: content type of the file
+        ranges: ranges in the body
+        length: size of the file in bytes
+
+    Returns:
+        size of the body in bytes
+    """
+    return sum(
+        len(multipart_part_header(boundary, content_type, r, length)) + r.size + len(b"\r\n") for r in ranges
+    ) + len(multipart_end(boundary))
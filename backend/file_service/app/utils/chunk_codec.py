@@ -0,0 +1,150 @@
+"""
+Codecs for the data stored in GridFS chunks.
+Each chunk is encoded on its own, so a stored chunk always holds exactly `chunkSize` bytes of the file once decoded.
+This keeps the chunk index of any byte of the file the same as with raw chunks.
+zstd is available only when `zstandard` package is installed.
+"""
+import asyncio
+import mimetypes
+import zlib
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# encoded sample has to be smaller than this ratio of the original to be worth compressing
+MIN_COMPRESSION_RATIO = 0.9
+# media types that are already compressed
+COMPRESSED_MEDIA_TYPES = {"image", "audio", "video"}
+COMPRESSED_CONTENT_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.rar",
+    "application/zstd",
+    # office open xml documents are zip containers
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+class ChunkCodec:
+    """
+    Stores chunks as they are
+    """
+
+    name = "none"
+
+    def encode(self, data: bytes) -> bytes:
+        return data
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+    async def encode_async(self, data: bytes) -> bytes:
+        """
+        Encode a chunk in the default executor, so compressing it doesn't block the event loop
+        """
+        if type(self).encode is ChunkCodec.encode:
+            return data
+        return await asyncio.get_running_loop().run_in_executor(None, self.encode, data)
+
+    async def decode_async(self, data: bytes) -> bytes:
+        """
+        Decode a chunk in the default executor, so decompressing it doesn't block the event loop
+        """
+        if type(self).decode is ChunkCodec.decode:
+            return data
+        return await asyncio.get_running_loop().run_in_executor(None, self.decode, data)
+
+
+class ZlibCodec(ChunkCodec):
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def encode(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decode(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec(ChunkCodec):
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        self.level = level
+
+    def encode(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decode(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+CODECS: Dict[str, ChunkCodec] = {codec.name: codec for codec in (ChunkCodec(), ZlibCodec())}
+if zstandard is not None:
+    CODECS[ZstdCodec.name] = ZstdCodec()
+
+
+def get_codec(name: Optional[str]) -> ChunkCodec:
+    """
+    Get a codec by its name
+    Args:
+        name: name of the codec recorded with the file. No codec if None
+
+    Returns:
+        the codec
+    """
+    try:
+        return CODECS[name or ChunkCodec.name]
+    except KeyError:
+        raise ValueError(f"Unsupported chunk codec: {name}")
+
+
+def is_compressed(content_type: Optional[str], filename: Optional[str]) -> bool:
+    """
+    Check whether the file is very likely to be compressed already
+    Args:
+        content_type: sniffed content type of the file, if known
+        filename: name of the file
+
+    Returns:
+        True if compressing it again is not worth it
+    """
+    content_type = content_type or mimetypes.guess_type(filename or "")[0]
+    if not content_type:
+        return False
+    return content_type.split("/")[0] in COMPRESSED_MEDIA_TYPES or content_type in COMPRESSED_CONTENT_TYPES
+
+
+async def choose_codec(
+    preferred: str, content_type: Optional[str], filename: Optional[str], sample: Optional[bytes] = None
+) -> ChunkCodec:
+    """
+    Choose the codec to store a file with.
+    Files that are already compressed are stored as they are. If a sample of the file is given, it's also checked
+    whether the sample actually compresses well enough, off the event loop as any other compression.
+    Args:
+        preferred: name of the codec to use if the file is worth compressing
+        content_type: sniffed content type of the file, if known
+        filename: name of the file
+        sample: leading bytes of the file, such as its first chunk
+
+    Returns:
+        the codec to use
+    """
+    codec = get_codec(preferred)
+    if codec.name == ChunkCodec.name or is_compressed(content_type, filename):
+        return CODECS[ChunkCodec.name]
+    if sample and len(await codec.encode_async(sample)) > len(sample) * MIN_COMPRESSION_RATIO:
+        return CODECS[ChunkCodec.name]
+    return codec
@@ -0,0 +1,149 @@
+"""
+HTTP conditional requests as specified in RFC 7232.
+Validators of a stored file are its md5 hashing for the entity tag and its upload date for the modification date.
+The info of a file is tagged with both, as a file uploaded again with the same content has the same md5.
+Both can be read from the file entry alone, so a conditional request is answered without reading any file data.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Dict
+
+
+def make_etag(md5: str) -> str:
+    """
+    Strong entity tag of a file from its md5 hashing
+    Args:
+        md5: md5 hashing of the file
+
+    Returns:
+        quoted entity tag
+    """
+    return f'"{md5}"'
+
+
+def make_info_etag(md5: str, uploaded_at: datetime) -> str:
+    """
+    Strong entity tag of the info of a file. The info of a file deleted and uploaded again with the same content has
+    another upload date and id, so the md5 hashing alone isn't enough to tell it apart
+    Args:
+        md5: md5 hashing of the file
+        uploaded_at: upload date of the file
+
+    Returns:
+        quoted entity tag
+    """
+    return f'"{md5}-{int(_to_utc(uploaded_at).timestamp() * 1000)}"'
+
+
+def _to_utc(value: datetime) -> datetime:
+    # dates from DB are naive UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def http_date(value: datetime) -> str:
+    """
+    Format a date in HTTP date format. Dates from DB are naive UTC.
+    Args:
+        value: date to format
+
+    Returns:
+        formatted date, eg. 'Wed, 21 Oct 2015 07:28:00 GMT'
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a date in HTTP date format
+    Args:
+        value: date to parse
+
+    Returns:
+        timezone-aware date, or None if it can't be parsed
+    """
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _to_seconds(value: datetime) -> datetime:
+    # HTTP dates don't have sub-second precision
+    return _to_utc(value).replace(microsecond=0)
+
+
+def _opaque_tags(header: str):
+    return [tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip() for tag in header.split(",")]
+
+
+def validator_headers(etag: Optional[str], last_modified: datetime) -> Dict[str, str]:
+    """
+    Response headers carrying the validators of a file
+    Args:
+        etag: entity tag of the file. None if the file doesn't have one
+        last_modified: upload date of the file
+
+    Returns:
+        headers to add to the response
+    """
+    # responses are specific to the authorized user, and have to be revalidated every time
+    headers = {"Last-Modified": http_date(last_modified), "Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def is_not_modified(
+    if_none_match: Optional[str], if_modified_since: Optional[str], etag: Optional[str], last_modified: datetime
+) -> bool:
+    """
+    Evaluate If-None-Match and If-Modified-Since preconditions of a GET request.
+    If-Modified-Since is ignored when If-None-Match is present.
+    Args:
+        if_none_match: value of If-None-Match header
+        if_modified_since: value of If-Modified-Since header
+        etag: current entity tag of the file. None if the file doesn't have one
+        last_modified: upload date of the file
+
+    Returns:
+        True if the client's copy is up to date and 304 should be sent
+    """
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        # weak comparison
+        return etag in _opaque_tags(if_none_match)
+    since = parse_http_date(if_modified_since)
+    if since is None:
+        return False
+    return _to_seconds(last_modified) <= since
+
+
+def if_range_matches(if_range: Optional[str], etag: Optional[str], last_modified: datetime) -> bool:
+    """
+    Evaluate If-Range precondition of a range request
+    Args:
+        if_range: value of If-Range header
+        etag: current entity tag of the file. None if the file doesn't have one
+        last_modified: upload date of the file
+
+    Returns:
+        True if the range request can be served, False if the whole file has to be sent instead
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # strong comparison. Weak tags never match
+        return etag is not None and if_range == etag
+    since = parse_http_date(if_range)
+    return since is not None and _to_seconds(last_modified) == since
@@ -0,0 +1,99 @@
+"""
+In-process cache of small file contents.
+Hot small files are served from memory instead of reading their chunks from DB on every download.
+Entries are keyed by file id and md5 hashing, so a cached content can never be served for a different file data.
+The cache is per process, and each worker of the service keeps its own.
+"""
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from config import settings
+
+
+class ContentCache:
+    """
+    LRU cache bounded by the total size of the cached contents.
+    Only used from the event loop, so there's no locking.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        """
+        Args:
+            max_bytes: total size of the cached contents in bytes. Nothing is cached if 0
+            max_entry_bytes: contents larger than this are never cached
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # file id -> (md5, content)
+        self._entries: "OrderedDict[Any, Tuple[str, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def accepts(self, size: int) -> bool:
+        """
+        Check if a content of the given size can be cached
+        Args:
+            size: size of the content in bytes
+
+        Returns:
+            True if it fits in a single entry
+        """
+        return size <= self.max_entry_bytes
+
+    def get(self, file_id: Any, md5: str) -> Optional[bytes]:
+        """
+        Get the cached content of a file, marking it as recently used
+        Args:
+            file_id: id of the file
+            md5: md5 hashing of the file
+
+        Returns:
+            cached content, or None if it's not cached
+        """
+        entry = self._entries.get(file_id)
+        if entry is None or entry[0] != md5:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(file_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, file_id: Any, md5: str, data: bytes) -> None:
+        """
+        Cache the content of a file, evicting least recently used contents to stay within the budget
+        Args:
+            file_id: id of the file
+            md5: md5 hashing of the file
+            data: content of the file
+        """
+        if not self.accepts(len(data)):
+            return
+        self.invalidate(file_id)
+        while self._entries and self.current_bytes + len(data) > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+        self._entries[file_id] = (md5, data)
+        self.current_bytes += len(data)
+
+    def invalidate(self, file_id: Any) -> None:
+        """
+        Remove the cached content of a file
+        Args:
+            file_id: id of the file
+        """
+        entry = self._entries.pop(file_id, None)
+        if entry is not None:
+            self.current_bytes -= len(entry[1])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+
+content_cache = ContentCache(settings.CONTENT_CACHE_SIZE, settings.CONTENT_CACHE_ENTRY_SIZE)
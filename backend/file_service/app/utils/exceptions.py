@@ -1,2 +1,34 @@
 class FileValidationError(Exception):
     pass
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class UploadSessionError(Exception):
+    pass
+
+
+class RangeNotSatisfiableError(Exception):
+    pass
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+class SearchError(Exception):
+    pass
+
+
+class InvalidFieldError(Exception):
+    pass
+
+
+class QuotaExceededError(Exception):
+    pass
+
+
+class MissingIndexError(Exception):
+    pass
@@ -16,12 +16,24 @@ def check_file(file: UploadFile) -> bool:
     Returns:
         True if the file passes all validations, False if any fails
     """
+    return check_filename(file.filename)
+
+
+def check_filename(filename: str) -> bool:
+    """
+    Check filename to see if it's allowed to be stored.
+    Args:
+        filename: filename to check
+
+    Returns:
+        True if the filename passes all validations, False if any fails
+    """
     # accept all image, video and audio types
-    mimetype = mimetypes.guess_type(file.filename)[0]
+    mimetype = mimetypes.guess_type(filename)[0]
     if mimetype is not None and mimetype.split("/")[0] in {"image", "audio", "video"}:
         return True
     # if not, only accept whitelisted file extensions
-    ext = os.path.splitext(file.filename)[1]
+    ext = os.path.splitext(filename)[1]
     if ext not in settings.FILE_EXTENSION_WHITELIST:
-        raise FileValidationError(f"{file.filename} is an invalid file type")
+        raise FileValidationError(f"{filename} is an invalid file type")
     return True
@@ -0,0 +1,135 @@
+"""
+In-process cache of file entries looked up by owner and filename.
+Entries are stamped with the metadata version of the owner's storage, which every write to the storage moves in DB.
+The versions are cached too, for a short while, so a hit costs no round trip at all. A worker sees its own writes right
+away, and the ones of other workers once the cached version expires.
+Files that don't exist are cached as well, as uploads look up names that are mostly not taken.
+The cache is per process, and each worker of the service keeps its own.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import settings
+
+
+class MetadataCache:
+    """
+    LRU cache of file entries bounded by the number of entries, whose entries also expire after a while.
+    Only used from the event loop, so there's no locking.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, version_ttl_seconds: float = 0):
+        """
+        Args:
+            max_entries: maximum number of cached entries, and of cached storage versions. Nothing is cached if 0
+            ttl_seconds: cached entries are dropped this long after they're cached
+            version_ttl_seconds: storage versions are read from DB again this long after they're cached
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_ttl_seconds = version_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (owner id, filename) -> (storage version, expiry, file entry or None if the file doesn't exist)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, Optional[dict]]]" = OrderedDict()
+        # owner id -> (storage version, expiry)
+        self._versions: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, storage_user_id: str, filename: str, version: int) -> Tuple[bool, Optional[dict]]:
+        """
+        Get the cached entry of a file, marking it as recently used
+        Args:
+            storage_user_id: the owner of the file
+            filename: filename of the file
+            version: current metadata version of the owner's storage
+
+        Returns:
+            whether it's cached, and the cached file entry, which is None if the file is cached as missing
+        """
+        key = (storage_user_id, filename)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[2]
+
+    def put(self, storage_user_id: str, filename: str, version: int, doc: Optional[dict]) -> None:
+        """
+        Cache the entry of a file, evicting the least recently used one if full
+        Args:
+            storage_user_id: the owner of the file
+            filename: filename of the file
+            version: metadata version of the owner's storage, read before the entry was
+            doc: file entry read from DB, or None if the file doesn't exist. Must not be changed afterwards
+        """
+        if not self.enabled:
+            return
+        key = (storage_user_id, filename)
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._entries[key] = (version, time.monotonic() + self.ttl_seconds, doc)
+
+    def invalidate(self, storage_user_id: str, filename: str) -> None:
+        """
+        Remove the cached entry of a file
+        Args:
+            storage_user_id: the owner of the file
+            filename: filename of the file
+        """
+        self._entries.pop((storage_user_id, filename), None)
+
+    def get_version(self, storage_user_id: str) -> Optional[int]:
+        """
+        Get the cached metadata version of a user's storage
+        Args:
+            storage_user_id: the owner of the storage
+
+        Returns:
+            the version, or None if it isn't cached or has expired
+        """
+        version = self._versions.get(storage_user_id)
+        if version is None or version[1] < time.monotonic():
+            return None
+        self._versions.move_to_end(storage_user_id)
+        return version[0]
+
+    def put_version(self, storage_user_id: str, version: int) -> None:
+        """
+        Cache the metadata version of a user's storage.
+        Versions only move forward, so a version read before a write of this worker never replaces the one after it
+        Args:
+            storage_user_id: the owner of the storage
+            version: the version read from DB
+        """
+        if not self.enabled or self.version_ttl_seconds <= 0:
+            return
+        cached = self._versions.pop(storage_user_id, None)
+        if cached is not None:
+            version = max(version, cached[0])
+        while len(self._versions) >= self.max_entries:
+            self._versions.popitem(last=False)
+        self._versions[storage_user_id] = (version, time.monotonic() + self.version_ttl_seconds)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+
+
+metadata_cache = MetadataCache(
+    settings.METADATA_CACHE_SIZE, settings.METADATA_CACHE_TTL_SECONDS, settings.METADATA_VERSION_TTL_SECONDS
+)
@@ -0,0 +1,38 @@
+"""
+Newline delimited JSON streams, read and written one line at a time.
+"""
+from typing import Any, AsyncIterable, AsyncIterator
+
+import orjson
+
+MEDIA_TYPE = "application/x-ndjson"
+
+
+async def read_lines(chunks: AsyncIterable[bytes], max_line_size: int = 64 * 1024) -> AsyncIterator[Any]:
+    """
+    Parse a stream of NDJSON, however the lines are split into chunks. Blank lines are skipped
+    Args:
+        chunks: stream of raw bytes, such as a request body
+        max_line_size: longest line accepted in bytes
+
+    Raises:
+        ValueError: if a line isn't valid JSON or is too long
+
+    Returns:
+        async stream of parsed lines
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > max_line_size:
+            raise ValueError("Line too long")
+        for line in lines:
+            if line.strip():
+                yield orjson.loads(line)
+    if buffer.strip():
+        yield orjson.loads(buffer)
+
+
+def dump_line(obj: Any) -> bytes:
+    return orjson.dumps(obj) + b"\n"
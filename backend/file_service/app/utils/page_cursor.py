@@ -0,0 +1,87 @@
+"""
+Opaque cursors for keyset pagination of file listings.
+A cursor holds the sort key and the id of the last file of a page, so the next page starts with an index seek right
+after it instead of skipping over all the previous pages.
+"""
+import base64
+from typing import Any, NamedTuple
+
+import bson
+import pymongo
+from bson.errors import BSONError
+
+from utils.exceptions import InvalidCursorError
+
+# DB fields file listings can be sorted by
+SORT_FIELDS = ("filename", "length", "uploadDate")
+# sort fields that are unique within a storage don't need the id to break ties
+UNIQUE_SORT_FIELDS = {"filename"}
+
+
+class PageCursor(NamedTuple):
+    sort_by: str  # DB field the list is sorted by
+    desc: bool  # sorting direction
+    value: Any  # value of the sort field of the last file of the page
+    id: Any  # id of the last file of the page
+
+    def encode(self) -> str:
+        """
+        Encode the cursor into a URL safe token
+        Returns:
+            cursor token
+        """
+        data = bson.encode({"s": self.sort_by, "d": self.desc, "v": self.value, "i": self.id})
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "PageCursor":
+        """
+        Decode a cursor token
+        Args:
+            token: cursor token made by `encode()`
+
+        Raises:
+            InvalidCursorError: if the token isn't a valid cursor
+
+        Returns:
+            the cursor
+        """
+        try:
+            doc = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            cursor = cls(sort_by=doc["s"], desc=bool(doc["d"]), value=doc["v"], id=doc["i"])
+        except (ValueError, TypeError, KeyError, BSONError):
+            raise InvalidCursorError("Invalid cursor")
+        if cursor.sort_by not in SORT_FIELDS:
+            raise InvalidCursorError("Invalid cursor")
+        return cursor
+
+    def query(self) -> dict:
+        """
+        Filter for the files that come after the cursor
+        Returns:
+            query filter
+        """
+        op = "$lt" if self.desc else "$gt"
+        if self.sort_by in UNIQUE_SORT_FIELDS:
+            return {self.sort_by: {op: self.value}}
+        # the range on the sort field alone bounds the index scan. The id only breaks ties at its start
+        return {
+            self.sort_by: {op + "e": self.value},
+            "$or": [{self.sort_by: {op: self.value}}, {"_id": {op: self.id}}],
+        }
+
+
+def sort_keys(sort_by: str, desc: bool) -> list:
+    """
+    Sort specification matching the order cursors follow
+    Args:
+        sort_by: DB field to sort by
+        desc: sorting direction
+
+    Returns:
+        list of (key, direction) pairs
+    """
+    direction = pymongo.DESCENDING if desc else pymongo.ASCENDING
+    if sort_by in UNIQUE_SORT_FIELDS:
+        return [(sort_by, direction)]
+    return [(sort_by, direction), ("_id", direction)]
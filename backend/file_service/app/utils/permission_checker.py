@@ -32,3 +32,15 @@ def check_delete_permission(jwt_data: JWTPayload = Depends(auth_with_jwt)):
     if jwt_data.role not in settings.ROLE_FOR_DELETE:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permission")
     return jwt_data
+
+
+def check_stats_permission(jwt_data: JWTPayload = Depends(auth_with_jwt)):
+    if jwt_data.role not in settings.ROLE_FOR_STATS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permission")
+    return jwt_data
+
+
+def check_allowance_permission(jwt_data: JWTPayload = Depends(auth_with_jwt)):
+    if jwt_data.role not in settings.ROLE_FOR_ALLOWANCE:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permission")
+    return jwt_data
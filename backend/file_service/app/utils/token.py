@@ -1,3 +1,4 @@
+import time
 from typing import Optional
 
 from fastapi import Depends, HTTPException
@@ -8,6 +9,7 @@ from starlette import status
 
 from api.models.jwt_payload import JWTPayload
 from config import settings
+from utils.token_cache import token_cache
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
@@ -15,17 +17,27 @@ reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 def auth_with_jwt(token: str = Depends(reusable_oauth2)) -> Optional[JWTPayload]:
     """
     Check if the JWT token is valid.
+    Tokens that have been verified are cached until they expire, so reusing one skips the signature check.
     Args:
         token: token to check
 
     Returns:
         Decoded JWT with all the claims
     """
+    started = time.perf_counter()
+    payload = token_cache.get(token)
+    if payload is not None:
+        token_cache.record_time(hit=True, seconds=time.perf_counter() - started)
+        return payload
     try:
         decoded_jwt = jwt.decode(token, settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM)
+        payload = JWTPayload(**decoded_jwt)
     except (jwt.JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Credential validation failed.",
         )
-    return JWTPayload(**decoded_jwt)
+    finally:
+        token_cache.record_time(hit=False, seconds=time.perf_counter() - started)
+    token_cache.put(token, payload)
+    return payload
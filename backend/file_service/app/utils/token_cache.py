@@ -0,0 +1,123 @@
+"""
+In-process cache of verified JWTs.
+Clients reuse the same token for many calls, so the signature check and the claims model of a token are kept until it
+expires, and later requests with the token skip both. Entries are keyed by the digest of the token, so the tokens
+themselves aren't kept in memory.
+The cache is per process, and each worker of the service keeps its own.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from api.models.jwt_payload import JWTPayload
+from config import settings
+
+
+class TokenCache:
+    """
+    LRU cache of decoded JWT claims bounded by the number of entries, whose entries expire with their tokens.
+    Auth dependencies run in the thread pool, so it's guarded by a lock.
+    """
+
+    def __init__(self, max_entries: int):
+        """
+        Args:
+            max_entries: maximum number of cached tokens. Nothing is cached if 0
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # time spent on auth by the requests whose token was cached, and by the ones whose token was verified
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self._lock = threading.Lock()
+        # token digest -> (expiry as a timestamp, decoded claims)
+        self._entries: "OrderedDict[bytes, Tuple[float, JWTPayload]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def hit_avg_seconds(self) -> float:
+        return self.hit_seconds / self.hits if self.hits else 0.0
+
+    @property
+    def miss_avg_seconds(self) -> float:
+        return self.miss_seconds / self.misses if self.misses else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        """
+        Auth time saved by the cache: what the hits would have cost at the average cost of a miss, less what they cost
+        """
+        return max(self.hits * self.miss_avg_seconds - self.hit_seconds, 0.0)
+
+    def get(self, token: str) -> Optional[JWTPayload]:
+        """
+        Get the claims of a verified token, marking it as recently used
+        Args:
+            token: encoded JWT
+
+        Returns:
+            the decoded claims, or None if the token isn't cached or has expired. Must not be changed
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, payload: JWTPayload) -> None:
+        """
+        Cache the claims of a verified token until it expires, evicting the least recently used one if full
+        Args:
+            token: encoded JWT
+            payload: the decoded claims. Must not be changed afterwards
+        """
+        if not self.enabled:
+            return
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (payload.exp.timestamp(), payload)
+
+    def record_time(self, hit: bool, seconds: float) -> None:
+        """
+        Record the time auth took for a request
+        Args:
+            hit: whether the token was cached
+            seconds: time taken
+        """
+        with self._lock:
+            if hit:
+                self.hit_seconds += seconds
+            else:
+                self.miss_seconds += seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
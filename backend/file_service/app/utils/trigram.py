@@ -0,0 +1,80 @@
+"""
+Trigrams of filenames for indexed search.
+Names are lowercased and padded like pg_trgm does, two spaces in front and one at the back, so prefixes and short
+names have trigrams of their own.
+"""
+import re
+from typing import Set
+
+# characters that only mean something in a regex. A dot is taken literally, as filenames are full of them
+REGEX_CHARS = re.compile(r"[\^$*+?()\[\]{}|\\]")
+
+
+def normalize(text: str) -> str:
+    return text.lower()
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Trigrams of a whole filename, or of a fuzzy search query
+    Args:
+        text: filename or query
+
+    Returns:
+        set of trigrams
+    """
+    padded = f"  {normalize(text)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def substring_trigrams(text: str) -> Set[str]:
+    """
+    Trigrams every filename containing the text has. Empty if the text is shorter than a trigram
+    Args:
+        text: query
+
+    Returns:
+        set of trigrams
+    """
+    text = normalize(text)
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def prefix_trigrams(text: str) -> Set[str]:
+    """
+    Trigrams every filename starting with the text has
+    Args:
+        text: query
+
+    Returns:
+        set of trigrams
+    """
+    padded = f"  {normalize(text)}"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """
+    Trigram similarity of two texts, the share of the trigrams they have in common
+    Args:
+        a: trigrams of a text
+        b: trigrams of the other text
+
+    Returns:
+        similarity from 0 to 1
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def is_regex(pattern: str) -> bool:
+    """
+    Check if a search pattern needs a regex to be matched
+    Args:
+        pattern: search pattern
+
+    Returns:
+        True if the pattern has regex syntax in it
+    """
+    return REGEX_CHARS.search(pattern) is not None
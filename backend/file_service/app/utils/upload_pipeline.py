@@ -0,0 +1,125 @@
+"""
+Single-pass pipeline for incoming uploads.
+Every byte of an upload is read from the source exactly once. The size limit, the checksums, the file type
+sniffing and the choice of the chunk codec are all done on that one read before the chunk is handed over to the storage.
+"""
+import hashlib
+import mimetypes
+from typing import AsyncIterator, Optional
+
+from fastapi import UploadFile
+from filetype import filetype
+from gridfs import DEFAULT_CHUNK_SIZE
+
+from utils.chunk_codec import ChunkCodec, choose_codec
+from utils.exceptions import FileTooLargeError
+
+# number of leading bytes that filetype needs to detect every type it supports
+SNIFF_SIZE = 261
+
+
+def sniff_content_type(head: bytes, filename: Optional[str]) -> str:
+    """
+    Detect the content type from the leading bytes of a file.
+    Fall back to the filename for types that don't have magic numbers, such as text files.
+    Args:
+        head: leading bytes of the file. Only the first `SNIFF_SIZE` bytes are used
+        filename: name of the file
+
+    Returns:
+        mime type of the file
+    """
+    return filetype.guess_mime(head[:SNIFF_SIZE]) or guess_content_type(filename)
+
+
+def guess_content_type(filename: Optional[str]) -> str:
+    """
+    Guess the content type from the filename only
+    Args:
+        filename: name of the file
+
+    Returns:
+        mime type of the file
+    """
+    return mimetypes.guess_type(filename or "")[0] or "application/octet-stream"
+
+
+class UploadPipeline:
+    """
+    Wraps an uploaded file and computes everything that is needed to store it while the file is read.
+    Iterate over `chunks()` to consume the file. The computed values are available once the iteration is done.
+    """
+
+    def __init__(
+        self,
+        file: UploadFile,
+        size_limit: int,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        preferred_codec: str = ChunkCodec.name,
+    ):
+        self.file = file
+        self.size_limit = size_limit
+        self.chunk_size = chunk_size
+        self.preferred_codec = preferred_codec
+        # number of bytes read from the source so far
+        self.bytes_read = 0
+        self.content_type: Optional[str] = None
+        # chosen on the first chunk, before it's handed over to the storage
+        self.codec: Optional[ChunkCodec] = None
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+        self._head = b""
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """
+        Read the file chunk by chunk.
+        Raises:
+            FileTooLargeError: if the file turns out to be bigger than the size limit
+
+        Returns:
+            async stream of chunks of the file
+        """
+        while True:
+            chunk = await self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            self.bytes_read += len(chunk)
+            if self.bytes_read > self.size_limit:
+                raise FileTooLargeError("File too big")
+            self._md5.update(chunk)
+            self._sha256.update(chunk)
+            if self.content_type is None:
+                self._head += chunk[: SNIFF_SIZE - len(self._head)]
+                if len(self._head) >= SNIFF_SIZE:
+                    self._sniff()
+            if self.codec is None:
+                self.codec = await choose_codec(self.preferred_codec, self.content_type, self.file.filename, chunk)
+            yield chunk
+        # the file was smaller than the sniffing window
+        if self.content_type is None:
+            self._sniff()
+        if self.codec is None:
+            self.codec = ChunkCodec()
+
+    async def encode(self, chunk: bytes) -> bytes:
+        """
+        Encode a chunk of the file with the chosen codec for storing, off the event loop
+        Args:
+            chunk: chunk yielded by `chunks()`
+
+        Returns:
+            encoded chunk
+        """
+        return await self.codec.encode_async(chunk)
+
+    def _sniff(self) -> None:
+        self.content_type = sniff_content_type(self._head, self.file.filename)
+        self._head = b""
@@ -0,0 +1,93 @@
+"""
+Benchmark for parallel multi-part uploads.
+Uploads a file through resumable upload sessions with an increasing number of concurrent parts and prints the
+throughput of each run. Every run uploads content of its own, as identical content would be deduplicated. Needs a running MongoDB, which is taken from MONGODB_URL environment variable.
+
+Usage:
+    $ PYTHONPATH=./app python benchmarks/parallel_upload.py --size-mb 256 --parallel 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import AsyncIterator, List
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+
+from config import settings
+from db.database import Database
+from db.respositories.file_repository import FileRepository
+from db.respositories.upload_session_repository import UploadSessionRepository
+
+# size of the pieces a part is received in, similar to what a request body stream yields
+RECEIVE_SIZE = 64 * 1024
+# storage owner of the uploaded files, which are removed after the benchmark
+BENCHMARK_USER_ID = "benchmark_user_id"
+
+
+async def part_stream(data: memoryview) -> AsyncIterator[bytes]:
+    for offset in range(0, len(data), RECEIVE_SIZE):
+        yield bytes(data[offset : offset + RECEIVE_SIZE])
+
+
+async def upload(repo: UploadSessionRepository, content: bytes, parallel: int) -> float:
+    """
+    Upload the content with the given number of concurrent parts
+    Args:
+        repo: upload session repository to use
+        content: content of the file
+        parallel: number of parts sent concurrently
+
+    Returns:
+        elapsed time in seconds
+    """
+    start = time.perf_counter()
+    session = await repo.create_session(
+        storage_user_id=BENCHMARK_USER_ID, filename=f"bench-{parallel}", size=len(content)
+    )
+    queue: asyncio.Queue = asyncio.Queue()
+    for n in range(session.part_count):
+        queue.put_nowait(n)
+    view = memoryview(content)
+
+    async def worker():
+        while not queue.empty():
+            n = queue.get_nowait()
+            data = view[n * session.part_size : (n + 1) * session.part_size]
+            await repo.write_part(session, n, part_stream(data))
+
+    await asyncio.gather(*[worker() for _ in range(parallel)])
+    await repo.complete_session(session)
+    return time.perf_counter() - start
+
+
+async def main(size_mb: int, parallel_runs: List[int]):
+    db = Database()
+    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db.grid_client = AsyncIOMotorGridFSBucket(db.client["file_service"])
+    repo = UploadSessionRepository(db)
+
+    print(f"file size: {size_mb}MB, part size: {settings.UPLOAD_PART_SIZE / 1024 / 1024:.2f}MB")
+    try:
+        for parallel in parallel_runs:
+            # fresh content, so no run finds the data of an earlier one already stored
+            content = os.urandom(size_mb * 1024 * 1024)
+            elapsed = await upload(repo, content, parallel)
+            print(f"parallel={parallel:<3} {elapsed:8.2f}s {size_mb / elapsed:10.1f}MB/s")
+    finally:
+        # remove the files uploaded by the benchmark user the way the service does, so blob references, usage
+        # counters and the search index stay in step. The data is reclaimed by the garbage collector of the service
+        filenames = [f"bench-{parallel}" for parallel in parallel_runs]
+        await FileRepository(db).delete_files(BENCHMARK_USER_ID, filenames)
+        db.client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256, help="size of the uploaded file in MB")
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of concurrent parts")
+    args = parser.parse_args()
+    if len(set(args.parallel)) != len(args.parallel):
+        # every run uploads a file named after its number of concurrent parts
+        parser.error("--parallel values must be unique")
+    asyncio.run(main(args.size_mb, args.parallel))
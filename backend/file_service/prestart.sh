@@ -0,0 +1,7 @@
+#! /usr/bin/env bash
+
+# This script will run first when a container is created
+set -e
+
+# Bring indexes in line with the declared ones. The service doesn't start if they can't be
+python scripts/sync_indexes.py
@@ -0,0 +1,33 @@
+"""
+Backfill content type and md5 hashing of files stored before they were recorded at upload.
+Only files missing them are touched, so it's safe to run again. Takes MongoDB from MONGODB_URL environment variable.
+
+Usage:
+    $ PYTHONPATH=./app python scripts/backfill_metadata.py --batch-size 500
+"""
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+
+from config import settings
+from db.database import Database
+from db.respositories.file_repository import FileRepository
+
+
+async def main(batch_size: int):
+    db = Database()
+    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db.grid_client = AsyncIOMotorGridFSBucket(db.client["file_service"])
+    try:
+        updated = await FileRepository(db).backfill_metadata(batch_size=batch_size)
+        print(f"updated {updated} files")
+    finally:
+        db.client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="number of files updated at once")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,34 @@
+"""
+Create and drop indexes so DB has exactly the indexes declared in db/indexes.py.
+Run at deploy time, before the service starts. Takes MongoDB from MONGODB_URL environment variable.
+
+Usage:
+    $ PYTHONPATH=./app python scripts/sync_indexes.py
+"""
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import settings
+from db.indexes import sync_indexes
+
+
+async def main(keep_unknown: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    try:
+        changes = await sync_indexes(client, drop_unknown=not keep_unknown)
+        for name in changes.dropped:
+            print(f"dropped {name}")
+        for name in changes.created:
+            print(f"created {name}")
+        print(f"{len(changes.created)} created, {len(changes.dropped)} dropped")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-unknown", action="store_true", help="don't drop indexes that aren't declared")
+    args = parser.parse_args()
+    asyncio.run(main(args.keep_unknown))
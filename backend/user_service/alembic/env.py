@@ -3,6 +3,7 @@ from logging.config import fileConfig
 
 from alembic import context
 from app.db.models.user import Base
+from app.db.models import refresh_token  # noqa: F401  registers the table in Base.metadata
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
@@ -1,35 +1,112 @@
 """
 API endpoint for authorization/authentication
 """
-from api.models.token import Token
+from api.models.jwt_payload import JWTPayload
+from api.models.role import Role
+from api.models.token import Token, TokenCacheStatsResponse, RefreshTokenRequest, RevokeTokenResponse
+from db.repositories.refresh_token_repository import RefreshTokenRepository
 from db.repositories.user_repository import UserRepository
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.logger import logger
 from sqlalchemy.orm import Session
 from starlette import status
-from utils.password import verify_hash
+from starlette.concurrency import run_in_threadpool
 
 from db.database import get_db
 from utils import token
+from utils.hashing_pool import hashing_pool, HashingPoolBusyError
+from utils.token_cache import token_cache
 
 auth_router = APIRouter()
 
 
 @auth_router.post("/token", response_model=Token)
-def get_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def get_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Check given credentials against DB and issue a JWT if they match.<br>
+    The password is verified in the hashing pool, so logins never take up the thread pool of the other endpoints.
+    Logins beyond what the pool can queue get 503.<br>
+    A refresh token is issued along, which gets new tokens from /refresh once the JWT expires.<br>
     - **username**: email of the user
     - **password**: password of the user
     """
     repo = UserRepository(db)
-    user = repo.get_user_by_email(email=form_data.username)
-    if user and user.is_active == 1 and verify_hash(form_data.password, user.hashed_password):
-        logger.info(f"Login by user: {form_data.username}")
-        return token.generate_jwt(user)
-    else:
+    user = await run_in_threadpool(repo.get_user_by_email, email=form_data.username)
+    if user and user.is_active == 1:
+        try:
+            verified, new_hash = await hashing_pool.verify(form_data.password, user.hashed_password)
+        except HashingPoolBusyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"}
+            )
+        if verified:
+            logger.info(f"Login by user: {form_data.username}")
+            issued = token.generate_jwt(user)
+            issued.refresh_token = await run_in_threadpool(RefreshTokenRepository(db).issue, user.user_id)
+            # the hash was made with a stale cost, and is replaced while the password is at hand
+            if new_hash:
+                await run_in_threadpool(repo.update_password_hash, user.user_id, new_hash)
+            return issued
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Incorrect email or password",
+    )
+
+
+@auth_router.post("/refresh", response_model=Token)
+def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Issue a new JWT using a refresh token, without the password.<br>
+    A refresh token can be used only once, and a new one is issued along with the JWT.
+    Using a refresh token again revokes all the tokens issued from the same login.<br>
+    - **refresh_token**: refresh token issued with the previous JWT
+    """
+    repo = RefreshTokenRepository(db)
+    rotated = repo.rotate(request.refresh_token)
+    if rotated:
+        user_id, new_refresh_token = rotated
+        user = UserRepository(db).get_user_by_user_id(user_id)
+        if user and user.is_active == 1:
+            issued = token.generate_jwt(user)
+            issued.refresh_token = new_refresh_token
+            return issued
+        # the user has been deactivated or deleted since the login
+        repo.revoke(new_refresh_token)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid refresh token",
+    )
+
+
+@auth_router.post("/revoke", response_model=RevokeTokenResponse)
+def revoke_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Revoke a refresh token with all the tokens issued from the same login, such as on logout.<br>
+    JWTs already issued stay valid until they expire.<br>
+    - **refresh_token**: refresh token to revoke
+    """
+    return RevokeTokenResponse(revoked=RefreshTokenRepository(db).revoke(request.refresh_token))
+
+
+@auth_router.get("/stats", response_model=TokenCacheStatsResponse)
+def get_token_cache_stats(jwt_data: JWTPayload = Depends(token.auth_with_jwt)):
+    """
+    Get the counters of the verified token cache of the worker serving the request.<br>
+    Only an admin can get the counters.
+    """
+    if jwt_data.role != Role.ADMIN:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Incorrect email or password",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to perform the action",
         )
+    return TokenCacheStatsResponse(
+        entries=len(token_cache),
+        hits=token_cache.hits,
+        misses=token_cache.misses,
+        evictions=token_cache.evictions,
+        hit_ratio=token_cache.hit_ratio,
+        saved_ms=token_cache.saved_seconds * 1000,
+        hit_avg_us=token_cache.hit_avg_seconds * 1e6,
+        miss_avg_us=token_cache.miss_avg_seconds * 1e6,
+    )
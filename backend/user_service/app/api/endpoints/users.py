@@ -15,14 +15,18 @@ from api.models.user_response import (
     UpdateUserResponse,
     ListUsersResponse,
 )
+from db.repositories.refresh_token_repository import RefreshTokenRepository
 from db.repositories.user_repository import UserRepository
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 
 from api.models.jwt_payload import JWTPayload
 from api.models.role import Role
 from db.database import get_db
+from utils.file_service import push_storage_allowance
+from utils.hashing_pool import hashing_pool, HashingPoolBusyError
 from utils.token import auth_with_jwt
 
 from fastapi.logger import logger
@@ -75,22 +79,30 @@ def get_users(
 
 
 @user_router.post("", response_model=CreateUserResponse)
-def create_user(request: CreateUserRequest, db: Session = Depends(get_db)) -> CreateUserResponse:
+async def create_user(request: CreateUserRequest, db: Session = Depends(get_db)) -> CreateUserResponse:
     """
     Create a user with the provided credentials.<br>
     Email and username must be unique.<br>
+    The password is hashed in the hashing pool, so sign-ups never take up the thread pool of the other endpoints.
+    Sign-ups beyond what the pool can queue get 503.<br>
     - **username**: username of the creating user
     - **email**: email of the creating user
     - **password**: password for the account
     """
     repo = UserRepository(db)
-    if repo.get_user_by_email(request.email):
+    if await run_in_threadpool(repo.get_user_by_email, request.email):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already in use.")
 
-    if repo.get_user_by_username(request.username):
+    if await run_in_threadpool(repo.get_user_by_username, request.username):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already in use.")
 
-    added_user = repo.add_user(**request.dict())
+    try:
+        hashed_password = await hashing_pool.hash(request.password)
+    except HashingPoolBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"}
+        )
+    added_user = await run_in_threadpool(repo.add_user, **request.dict(), hashed_password=hashed_password)
     logger.info(f"Created user {added_user.user_id}, {added_user.email}, {added_user.username}")
     return CreateUserResponse(**added_user.__dict__)
 
@@ -98,6 +110,7 @@ def create_user(request: CreateUserRequest, db: Session = Depends(get_db)) -> Cr
 @user_router.put("", response_model=UpdateUserResponse)
 def update_user(
     request: UpdateUserRequest,
+    background_tasks: BackgroundTasks,
     jwt_data: JWTPayload = Depends(auth_with_jwt),
     db: Session = Depends(get_db),
 ):
@@ -129,7 +142,14 @@ def update_user(
             f"{request.role} {request.storage_allowance} {request.is_active}"
         )
         updated_user = repo.update_user(**request.dict())
-        return UpdateUserResponse(**updated_user.__dict__)
+        # the file service checks uploads against its own copy of the allowance
+        if request.storage_allowance is not None:
+            background_tasks.add_task(push_storage_allowance, updated_user.user_id, updated_user.storage_allowance)
+        response = UpdateUserResponse(**updated_user.__dict__)
+        # a deactivated user can't get new tokens, but the ones issued already last until they expire
+        if request.is_active is False:
+            RefreshTokenRepository(db).revoke_user(updated_user.user_id)
+        return response
     else:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
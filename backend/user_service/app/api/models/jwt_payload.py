@@ -1,6 +1,7 @@
 from datetime import datetime
+from typing import Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 from api.models.role import Role
 
@@ -15,3 +16,5 @@ class JWTPayload(BaseModel):
     role: Role  # subject's permission level
     username: str  # subject's username
     email: EmailStr  # subject's email
+    storage_allowance: Optional[int] = None  # subject's storage allowance in bytes, checked by the file service
+    iat: datetime = Field(default_factory=datetime.utcnow)  # JWT issue date
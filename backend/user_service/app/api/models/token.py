@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -8,3 +10,36 @@ class Token(BaseModel):
 
     token_type: str
     access_token: str
+    # long-lived token that gets a new pair of tokens from /refresh without the password
+    refresh_token: Optional[str] = None
+
+
+class RefreshTokenRequest(BaseModel):
+    """
+    A model to represent a request to renew or revoke a refresh token
+    """
+
+    refresh_token: str
+
+
+class RevokeTokenResponse(BaseModel):
+    """
+    A model to represent the result of revoking a refresh token
+    """
+
+    revoked: bool
+
+
+class TokenCacheStatsResponse(BaseModel):
+    """
+    A model to represent the counters of the verified token cache of a worker
+    """
+
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+    saved_ms: float  # auth time saved by the cache
+    hit_avg_us: float  # average auth time of a request with a cached token
+    miss_avg_us: float  # average auth time of a request whose token is verified
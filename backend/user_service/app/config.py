@@ -1,17 +1,32 @@
+import os
 import secrets
 
 from pydantic import BaseSettings
 
+# the image runs a web worker per core unless WEB_CONCURRENCY is set, and each one has a hashing pool of its own
+_web_workers = int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
 
 class Settings(BaseSettings):
     JWT_SECRET_KEY: str = secrets.token_urlsafe(64)
     JWT_ALGORITHM: str = "HS256"
-    TOKEN_EXPIRE_MINUTES: int = 60 * 24
+    TOKEN_EXPIRE_MINUTES: int = 15  # access tokens are short-lived, and renewed with a refresh token
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    TOKEN_CACHE_SIZE: int = 10000  # number of verified JWTs cached per worker. 0 to disable
+
+    # processes hashing passwords per web worker, so the cores are shared out. 0 to hash in the request thread pool
+    HASHING_WORKERS: int = max(1, (os.cpu_count() or 1) // _web_workers)
+    HASHING_MAX_PENDING: int = 64  # logins and sign-ups queued or being hashed before more are turned away with 503
+    BCRYPT_ROUNDS: int = 12  # bcrypt cost of new hashes. benchmarks/login_throughput.py tunes it to a machine
 
     SQLALCHEMY_DATABASE_URI: str = "sqlite:///./user_db.db"
     ADMIN_USER_EMAIL: str = "overwhelming@power.com"
     ADMIN_USER_USERNAME: str = "chuck-norris"
     ADMIN_USER_PASSWORD: str = "youshallnotpass"
 
+    # storage allowances are pushed to the file service here when they change. Empty to disable
+    FILE_SERVICE_URL: str = "http://file-service"
+    FILE_SERVICE_TIMEOUT_SECONDS: float = 5
+
 
 settings = Settings()
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from db.models.base import Base
+from db.models.user import generate_uuid
+from sqlalchemy import Column, String, DateTime, ForeignKey
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_token"
+
+    token_id = Column(String(36), primary_key=True, default=generate_uuid)
+    # sha256 of the token. The token itself is only known to the client
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    user_id = Column(String(36), ForeignKey("user.user_id", ondelete="CASCADE"), index=True, nullable=False)
+    # tokens rotated from the same login share a family, which is revoked as a whole if a rotated token is reused
+    family_id = Column(String(36), index=True, nullable=False)
+    issued_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    # set once the token has been rotated or revoked
+    revoked_at = Column(DateTime, nullable=True)
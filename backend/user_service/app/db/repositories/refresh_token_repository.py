@@ -0,0 +1,111 @@
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from db.models.refresh_token import RefreshToken
+from db.models.user import generate_uuid
+from db.repositories.base_repository import BaseRepository
+
+from config import settings
+
+
+def hash_token(token: str) -> str:
+    # refresh tokens are random and long, so a plain digest is enough to keep them from being usable if leaked
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RefreshTokenRepository(BaseRepository):
+    """
+    Repository that contains all DB operations on refresh_token table.
+    A refresh token can be used only once. Using it revokes it and issues the next one of its family, so a token that
+    is used again must have been stolen, and the whole family is revoked.
+    """
+
+    def issue(self, user_id: str, family_id: Optional[str] = None) -> str:
+        """
+        Issue a new refresh token for a user
+        Args:
+            user_id: user id of the owner
+            family_id: family of the token being rotated. A new family is started if None
+
+        Returns:
+            the refresh token, which isn't stored anywhere else
+        """
+        if family_id is None:
+            # a new login. Expired tokens of the user are cleaned up on the way
+            self.db.query(RefreshToken).filter(
+                RefreshToken.user_id == user_id, RefreshToken.expires_at <= datetime.utcnow()
+            ).delete()
+        token = secrets.token_urlsafe(32)
+        self.db.add(
+            RefreshToken(
+                token_hash=hash_token(token),
+                user_id=user_id,
+                family_id=family_id or generate_uuid(),
+                expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+            )
+        )
+        self.db.commit()
+        return token
+
+    def rotate(self, token: str) -> Optional[Tuple[str, str]]:
+        """
+        Use a refresh token, revoking it and issuing the next one of its family
+        Args:
+            token: refresh token to use
+
+        Returns:
+            user id of the owner and the next refresh token, or None if the token isn't valid
+        """
+        row: RefreshToken = self.db.query(RefreshToken).filter(RefreshToken.token_hash == hash_token(token)).first()
+        if not row or row.expires_at <= datetime.utcnow():
+            return None
+        # revoked only if it still isn't, so concurrent uses of a token can't both get through
+        revoked = (
+            self.db.query(RefreshToken)
+            .filter(RefreshToken.token_id == row.token_id, RefreshToken.revoked_at.is_(None))
+            .update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+        )
+        if not revoked:
+            # already rotated, so either the owner or someone who stole it is replaying it
+            self.revoke_family(row.family_id)
+            return None
+        return row.user_id, self.issue(row.user_id, row.family_id)
+
+    def revoke(self, token: str) -> bool:
+        """
+        Revoke a refresh token with the rest of its family, such as on logout
+        Args:
+            token: refresh token to revoke
+
+        Returns:
+            True if revoked, False if there was no such token
+        """
+        row: RefreshToken = self.db.query(RefreshToken).filter(RefreshToken.token_hash == hash_token(token)).first()
+        if not row:
+            return False
+        self.revoke_family(row.family_id)
+        return True
+
+    def revoke_family(self, family_id: str) -> None:
+        """
+        Revoke all tokens of a family
+        Args:
+            family_id: family of the tokens
+        """
+        self.db.query(RefreshToken).filter(
+            RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None)
+        ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+        self.db.commit()
+
+    def revoke_user(self, user_id: str) -> None:
+        """
+        Revoke all tokens of a user, such as when the user is deactivated
+        Args:
+            user_id: user id of the owner
+        """
+        self.db.query(RefreshToken).filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)).update(
+            {RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False
+        )
+        self.db.commit()
@@ -99,19 +99,22 @@ class UserRepository(BaseRepository):
             count,
         )
 
-    def add_user(self, username: str, email: str, password: str) -> Optional[User]:
+    def add_user(
+        self, username: str, email: str, password: str, hashed_password: Optional[str] = None
+    ) -> Optional[User]:
         """
-        Add a user row into the table. Given password will be hashed before inserting.
+        Add a user row into the table. Given password will be hashed before inserting, unless it's hashed already.
         Args:
             username: username of the user to be created
             email: email of the user to be created
             password: password to be used for creation
+            hashed_password: hash of the password, such as one made in the hashing pool
 
         Returns:
             Added user model, or None if failed
         """
         user_to_add = User(username=username, email=email)
-        user_to_add.hashed_password = get_hash(password)
+        user_to_add.hashed_password = hashed_password or get_hash(password)
         try:
             self.db.add(user_to_add)
             self.db.commit()
@@ -121,6 +124,16 @@ class UserRepository(BaseRepository):
             self.db.rollback()
             return None
 
+    def update_password_hash(self, user_id: str, hashed_password: str) -> None:
+        """
+        Replace the stored password hash of a user, such as one made with a stale bcrypt cost
+        Args:
+            user_id: user id of target user
+            hashed_password: new hash of the same password
+        """
+        self.db.query(User).filter(User.user_id == user_id).update({User.hashed_password: hashed_password})
+        self.db.commit()
+
     def delete_user(self, user_id) -> bool:
         """
         Soft delete a user row with the given user id
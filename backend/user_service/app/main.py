@@ -4,6 +4,7 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from api.router import api_router
+from utils.hashing_pool import stop_hashing_pool
 
 app = FastAPI(
     title="User Service API",
@@ -19,6 +20,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_event_handler("shutdown", stop_hashing_pool)
 app.include_router(api_router, prefix="/api")
 
 
@@ -5,6 +5,8 @@ from sqlalchemy.orm import Session
 from starlette import status
 from starlette.testclient import TestClient
 from tests.mock_factories import UserFactory
+from utils import password
+from utils.hashing_pool import hashing_pool
 
 
 def test_get_token(test_client: TestClient, test_db: Session):
@@ -20,6 +22,36 @@ def test_get_token(test_client: TestClient, test_db: Session):
     assert token.token_type == "bearer"
     # JWT has 3 parts
     assert len(token.access_token.split(".")) == 3
+    assert token.refresh_token
+
+
+def test_get_token_rehash_stale_cost(test_client: TestClient, test_db: Session):
+    """
+    Test the case where a user logs in with a password hashed with another bcrypt cost, which is hashed again
+    """
+    mock_user: User = UserFactory()
+    repo = UserRepository(test_db)
+    added_user = repo.add_user(mock_user.username, mock_user.email, password="some_password")
+    repo.update_password_hash(added_user.user_id, password.hash_with("some_password", rounds=4))
+    data = {"username": mock_user.email, "password": "some_password"}
+    response = test_client.post("/api/auth/token", data=data)
+    assert response.status_code == status.HTTP_200_OK
+    test_db.refresh(added_user)
+    assert added_user.hashed_password.startswith(f"$2b${hashing_pool.rounds:02d}$")
+    assert password.verify_hash("some_password", added_user.hashed_password)
+
+
+def test_get_token_busy(test_client: TestClient, test_db: Session, monkeypatch):
+    """
+    Test the case where a user fails to get a token as too many logins are being verified
+    """
+    mock_user: User = UserFactory()
+    UserRepository(test_db).add_user(mock_user.username, mock_user.email, password="some_password")
+    monkeypatch.setattr(hashing_pool, "max_pending", 0)
+    data = {"username": mock_user.email, "password": "some_password"}
+    response = test_client.post("/api/auth/token", data=data)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
 
 
 def test_get_token_fail_wrong_password(test_client: TestClient, test_db: Session):
@@ -55,3 +87,89 @@ def test_get_token_fail_deleted_user(test_client: TestClient, test_db: Session):
     data = {"username": mock_user.email, "password": "some_password"}
     response = test_client.post("/api/auth/token", data=data)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def login(test_client: TestClient, test_db: Session) -> Token:
+    mock_user: User = UserFactory()
+    UserRepository(test_db).add_user(mock_user.username, mock_user.email, password="some_password")
+    data = {"username": mock_user.email, "password": "some_password"}
+    return Token(**test_client.post("/api/auth/token", data=data).json())
+
+
+def test_refresh_token(test_client: TestClient, test_db: Session, monkeypatch):
+    """
+    Test the case where a user gets new tokens with a refresh token, without the password being verified
+    """
+    issued = login(test_client, test_db)
+    monkeypatch.setattr(hashing_pool, "verify", None)
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": issued.refresh_token})
+    assert response.status_code == status.HTTP_200_OK
+    refreshed = Token(**response.json())
+    assert len(refreshed.access_token.split(".")) == 3
+    assert refreshed.refresh_token != issued.refresh_token
+    # the new token can be used in turn
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": refreshed.refresh_token})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_refresh_token_reused(test_client: TestClient, test_db: Session):
+    """
+    Test the case where a refresh token is used twice, which revokes the tokens issued from it
+    """
+    issued = login(test_client, test_db)
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": issued.refresh_token})
+    refreshed = Token(**response.json())
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": issued.refresh_token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": refreshed.refresh_token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_refresh_token_invalid(test_client: TestClient, test_db: Session):
+    """
+    Test the case where a user tries to get new tokens with an unknown refresh token
+    """
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": "unknown"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_refresh_token_inactive_user(test_client: TestClient, test_db: Session):
+    """
+    Test the case where a user who has been deactivated since logging in tries to get new tokens
+    """
+    issued = login(test_client, test_db)
+    test_db.query(User).update({User.is_active: False})
+    test_db.commit()
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": issued.refresh_token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_revoke_token(test_client: TestClient, test_db: Session):
+    """
+    Test the case where a user revokes their refresh token on logout
+    """
+    issued = login(test_client, test_db)
+    response = test_client.post("/api/auth/revoke", json={"refresh_token": issued.refresh_token})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["revoked"]
+    response = test_client.post("/api/auth/refresh", json={"refresh_token": issued.refresh_token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = test_client.post("/api/auth/revoke", json={"refresh_token": "unknown"})
+    assert not response.json()["revoked"]
+
+
+def test_get_token_cache_stats(test_client: TestClient, admin_token_header: Token):
+    """
+    Test the case where an admin gets the counters of the token cache
+    """
+    response = test_client.get("/api/auth/stats", headers=admin_token_header)
+    assert response.status_code == status.HTTP_200_OK
+    assert 0 <= response.json()["hit_ratio"] <= 1
+
+
+def test_get_token_cache_stats_as_non_admin(test_client: TestClient, non_admin_token_header: Token):
+    """
+    Test the case where a non-admin user tries to get the counters of the token cache
+    """
+    response = test_client.get("/api/auth/stats", headers=non_admin_token_header)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
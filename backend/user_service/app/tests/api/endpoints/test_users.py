@@ -1,10 +1,13 @@
+from api.endpoints import users
 from api.models.token import Token
 from api.models.user_request import (
     CreateUserRequest,
     UpdateUserRequest,
     DeleteUserRequest,
 )
+from db.models.refresh_token import RefreshToken
 from db.models.user import User
+from db.repositories.refresh_token_repository import RefreshTokenRepository
 from db.repositories.user_repository import UserRepository
 from sqlalchemy.orm import Session
 from starlette import status
@@ -12,6 +15,7 @@ from starlette.testclient import TestClient
 from tests.mock_factories import UserFactory
 
 from api.models.role import Role
+from utils.hashing_pool import hashing_pool
 from utils.token import generate_jwt
 
 
@@ -29,6 +33,19 @@ def test_create_user(test_client: TestClient, test_db: Session):
     assert response.status_code == status.HTTP_200_OK
 
 
+def test_create_user_busy(test_client: TestClient, test_db: Session, monkeypatch):
+    """
+    Test the case where a user can't be added as too many passwords are being hashed
+    """
+    mock_user: User = UserFactory()
+    monkeypatch.setattr(hashing_pool, "max_pending", 0)
+    request = CreateUserRequest(username=mock_user.username, email=mock_user.email, password="some_password")
+    response = test_client.post("/api/users", json=request.dict())
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+    assert not UserRepository(test_db).get_user_by_email(mock_user.email)
+
+
 def test_create_user_duplicate_username(test_client: TestClient, test_db: Session):
     """
     Test the case where there is already a user with the same username in the DB when creating a user
@@ -234,13 +251,16 @@ def test_delete_user_as_non_admin(test_client: TestClient, test_db: Session, non
     assert response.status_code == status.HTTP_403_FORBIDDEN
 
 
-def test_update_user_as_admin(test_client: TestClient, test_db: Session, admin_token_header: Token):
+def test_update_user_as_admin(test_client: TestClient, test_db: Session, admin_token_header: Token, monkeypatch):
     """
     Test the case where an admin update an existing user's role
     """
+    pushed = []
+    monkeypatch.setattr(users, "push_storage_allowance", lambda *args: pushed.append(args))
     mock_user: User = UserFactory()
     repo = UserRepository(test_db)
     added_user = repo.add_user(mock_user.username, mock_user.email, password="some_password")
+    RefreshTokenRepository(test_db).issue(added_user.user_id)
     request = UpdateUserRequest(
         user_id=added_user.user_id,
         role=Role.UPLOADER,
@@ -253,6 +273,10 @@ def test_update_user_as_admin(test_client: TestClient, test_db: Session, admin_t
     assert added_user.role == Role.UPLOADER
     assert added_user.storage_allowance == 500
     assert added_user.is_active == 0
+    # the new allowance is pushed to the file service
+    assert pushed == [(added_user.user_id, 500)]
+    # the deactivated user's refresh tokens are revoked
+    assert test_db.query(RefreshToken).filter(RefreshToken.revoked_at.is_(None)).count() == 0
 
 
 def test_update_user_as_admin_not_found(test_client: TestClient, test_db: Session, admin_token_header: Token):
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from db.models.refresh_token import RefreshToken
+from db.models.user import User
+from db.repositories.refresh_token_repository import RefreshTokenRepository, hash_token
+from db.repositories.user_repository import UserRepository
+from sqlalchemy.orm import Session
+from tests.mock_factories import UserFactory
+
+
+def add_user(test_db: Session) -> User:
+    mock_user: User = UserFactory()
+    return UserRepository(test_db).add_user(mock_user.username, mock_user.email, password="password")
+
+
+def test_issue(test_db: Session):
+    """
+    Test issuing a refresh token, which is stored only as a hash
+    """
+    user = add_user(test_db)
+    token = RefreshTokenRepository(test_db).issue(user.user_id)
+    row = test_db.query(RefreshToken).filter(RefreshToken.user_id == user.user_id).one()
+    assert row.token_hash == hash_token(token) != token
+    assert row.expires_at > datetime.utcnow()
+    assert row.revoked_at is None
+
+
+def test_issue_cleans_up_expired(test_db: Session):
+    """
+    Test the case where a new login removes the user's expired tokens
+    """
+    user = add_user(test_db)
+    repo = RefreshTokenRepository(test_db)
+    repo.issue(user.user_id)
+    test_db.query(RefreshToken).update({RefreshToken.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    test_db.commit()
+    repo.issue(user.user_id)
+    assert test_db.query(RefreshToken).count() == 1
+
+
+def test_rotate(test_db: Session):
+    """
+    Test using a refresh token, which revokes it and issues the next one of the family
+    """
+    user = add_user(test_db)
+    repo = RefreshTokenRepository(test_db)
+    token = repo.issue(user.user_id)
+    user_id, new_token = repo.rotate(token)
+    assert user_id == user.user_id
+    assert new_token != token
+    old_row = test_db.query(RefreshToken).filter(RefreshToken.token_hash == hash_token(token)).one()
+    new_row = test_db.query(RefreshToken).filter(RefreshToken.token_hash == hash_token(new_token)).one()
+    assert old_row.revoked_at is not None
+    assert new_row.revoked_at is None
+    assert new_row.family_id == old_row.family_id
+
+
+def test_rotate_reused(test_db: Session):
+    """
+    Test the case where a refresh token is used again, which revokes the whole family
+    """
+    user = add_user(test_db)
+    repo = RefreshTokenRepository(test_db)
+    token = repo.issue(user.user_id)
+    other_login = repo.issue(user.user_id)
+    _, new_token = repo.rotate(token)
+    assert repo.rotate(token) is None
+    assert repo.rotate(new_token) is None
+    # tokens of other logins are left alone
+    assert repo.rotate(other_login)
+
+
+def test_rotate_invalid(test_db: Session):
+    """
+    Test the case where an unknown or expired refresh token is used
+    """
+    user = add_user(test_db)
+    repo = RefreshTokenRepository(test_db)
+    assert repo.rotate("unknown") is None
+    token = repo.issue(user.user_id)
+    test_db.query(RefreshToken).update({RefreshToken.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    test_db.commit()
+    assert repo.rotate(token) is None
+
+
+def test_revoke(test_db: Session):
+    """
+    Test revoking a refresh token with the rest of its family
+    """
+    user = add_user(test_db)
+    repo = RefreshTokenRepository(test_db)
+    token = repo.issue(user.user_id)
+    _, new_token = repo.rotate(token)
+    assert repo.revoke(token)
+    assert repo.rotate(new_token) is None
+    assert not repo.revoke("unknown")
+
+
+def test_revoke_user(test_db: Session):
+    """
+    Test revoking all refresh tokens of a user
+    """
+    user = add_user(test_db)
+    other_user = add_user(test_db)
+    repo = RefreshTokenRepository(test_db)
+    tokens = [repo.issue(user.user_id), repo.issue(user.user_id)]
+    other_token = repo.issue(other_user.user_id)
+    repo.revoke_user(user.user_id)
+    assert all(repo.rotate(token) is None for token in tokens)
+    assert repo.rotate(other_token)
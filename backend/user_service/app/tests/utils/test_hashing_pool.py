@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from utils import password
+from utils.hashing_pool import HashingPool, HashingPoolBusyError
+
+
+def test_verify_in_pool():
+    pool = HashingPool(workers=1, max_pending=4, rounds=4)
+    hashed_password = asyncio.run(pool.hash("some_password"))
+    assert asyncio.run(pool.verify("some_password", hashed_password)) == (True, None)
+    assert asyncio.run(pool.verify("wrong_password", hashed_password)) == (False, None)
+    pool.shutdown()
+
+
+def test_busy_pool():
+    pool = HashingPool(workers=0, max_pending=0, rounds=4)
+    with pytest.raises(HashingPoolBusyError):
+        asyncio.run(pool.hash("some_password"))
+    assert pool.rejected == 1
+
+
+def test_tune(monkeypatch):
+    pool = HashingPool(workers=0, max_pending=4)
+    # each extra round doubles the time
+    monkeypatch.setattr(password, "measure_hash_seconds", lambda rounds: 0.03)
+    assert asyncio.run(pool.tune(target_ms=250, min_rounds=10, max_rounds=14)) == 13
+    monkeypatch.setattr(password, "measure_hash_seconds", lambda rounds: 1)
+    assert asyncio.run(pool.tune(target_ms=250, min_rounds=10, max_rounds=14)) == 10
+    monkeypatch.setattr(password, "measure_hash_seconds", lambda rounds: 0.0001)
+    assert asyncio.run(pool.tune(target_ms=250, min_rounds=10, max_rounds=14)) == 14
@@ -13,3 +13,22 @@ def test_hash_password():
     test_password = "super-secure_pa$$word"
     hashed_password = password.get_hash(test_password)
     pwd_context.verify(test_password, hashed_password)
+
+
+def test_verify_and_update_stale_cost():
+    test_password = "super-secure_pa$$word"
+    hashed_password = password.hash_with(test_password, rounds=4)
+    # the hash is of the current cost, and kept
+    assert password.verify_and_update(test_password, hashed_password, rounds=4) == (True, None)
+    verified, new_hash = password.verify_and_update(test_password, hashed_password, rounds=5)
+    assert verified
+    assert new_hash.startswith("$2b$05$")
+    assert password.verify_hash(test_password, new_hash)
+    assert password.verify_and_update("wrong", hashed_password, rounds=5) == (False, None)
+
+
+def test_verify_and_update_higher_cost():
+    test_password = "super-secure_pa$$word"
+    # a hash of a higher cost, such as one made under another setting, is never weakened
+    hashed_password = password.hash_with(test_password, rounds=5)
+    assert password.verify_and_update(test_password, hashed_password, rounds=4) == (True, None)
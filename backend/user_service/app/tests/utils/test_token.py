@@ -1,11 +1,16 @@
+from datetime import datetime
+
 import pytest
 from db.models.user import User
 from fastapi import HTTPException
 from jose import jwt, ExpiredSignatureError
 from tests.mock_factories import UserFactory
 
+from api.models.jwt_payload import JWTPayload
+from api.models.role import Role
 from config import settings
 from utils.token import generate_jwt, auth_with_jwt
+from utils.token_cache import TokenCache, token_cache
 
 
 def test_generate_jwt_claims():
@@ -17,6 +22,7 @@ def test_generate_jwt_claims():
     decoded_token = jwt.decode(token.access_token, key="secret", algorithms="HS256")
     assert decoded_token["sub"] == mock_user.user_id
     assert decoded_token["role"] == mock_user.role
+    assert decoded_token["storage_allowance"] == mock_user.storage_allowance
     assert isinstance(decoded_token["exp"], int)
 
 
@@ -40,3 +46,27 @@ def test_auth_with_jwt():
     token = generate_jwt(mock_user)
     with pytest.raises(HTTPException):
         auth_with_jwt(token.access_token)
+
+
+def test_auth_with_jwt_cached():
+    settings.JWT_SECRET_KEY = "secret"
+    settings.JWT_ALGORITHM = "HS256"
+    payload = JWTPayload(
+        sub="user_id", exp=datetime(2077, 1, 1), role=Role.VIEWER, username="guy", email="halla@world.com"
+    )
+    access_token = jwt.encode(payload.dict(), key="secret", algorithm="HS256")
+    hits = token_cache.hits
+    first = auth_with_jwt(access_token)
+    # the second request with the token skips verification
+    assert auth_with_jwt(access_token) is first
+    assert token_cache.hits == hits + 1
+
+
+def test_token_cache_expiry():
+    cache = TokenCache(max_entries=10)
+    payload = JWTPayload(
+        sub="user_id", exp=datetime(2000, 1, 1), role=Role.VIEWER, username="guy", email="halla@world.com"
+    )
+    cache.put("token", payload)
+    # expired tokens are never served, and have to be verified again
+    assert cache.get("token") is None
@@ -0,0 +1,57 @@
+"""
+A util module for calls to the file service
+"""
+import json
+import urllib.request
+from datetime import datetime, timedelta
+
+from fastapi.logger import logger
+from jose import jwt
+
+from api.models.jwt_payload import JWTPayload
+from api.models.role import Role
+from config import settings
+
+
+def service_token() -> str:
+    """
+    Issue a short-lived admin JWT for the user service itself, to call admin endpoints of the file service with.
+    Returns:
+        encoded JWT
+    """
+    payload = JWTPayload(
+        sub="user-service",
+        exp=datetime.utcnow() + timedelta(minutes=1),
+        role=Role.ADMIN,
+        username="user-service",
+        email=settings.ADMIN_USER_EMAIL,
+    )
+    return jwt.encode(payload.dict(), key=settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+
+def push_storage_allowance(user_id: str, storage_allowance: int) -> bool:
+    """
+    Let the file service know a user's new storage allowance, which it checks uploads against.
+    A failed push is only logged. The file service keeps the previous allowance until the user's next token, issued
+    after the change and carrying the new allowance, is used for an upload
+    Args:
+        user_id: user whose allowance changed
+        storage_allowance: new allowance in bytes
+
+    Returns:
+        True if the file service took it, False otherwise
+    """
+    if not settings.FILE_SERVICE_URL:
+        return False
+    request = urllib.request.Request(
+        f"{settings.FILE_SERVICE_URL}/api/files/allowance",
+        data=json.dumps({"user_id": user_id, "storage_allowance": storage_allowance}).encode(),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {service_token()}"},
+        method="PUT",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=settings.FILE_SERVICE_TIMEOUT_SECONDS):
+            return True
+    except Exception as e:
+        logger.error(f"Failed to push storage allowance of {user_id} to file service: {e}")
+        return False
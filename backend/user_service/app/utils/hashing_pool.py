@@ -0,0 +1,123 @@
+"""
+A util module for hashing and verifying passwords off the event loop and the request thread pool.
+bcrypt is deliberately slow, so a burst of logins used to take up the whole thread pool of FastAPI and starve every
+other sync endpoint. Hashing runs in a dedicated pool of processes instead, which also keeps it from contending for the
+GIL, and logins beyond what the pool can queue are turned away rather than piling up.
+"""
+import asyncio
+import math
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi.logger import logger
+
+from config import settings
+from utils import password
+
+
+class HashingPoolBusyError(Exception):
+    pass
+
+
+class HashingPool:
+    """
+    Bounded pool of hashing workers.
+    The number of hashing jobs queued or running is counted on the event loop, so it needs no locking.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int = 12):
+        """
+        Args:
+            workers: number of worker processes. Hashing runs in the default thread pool if 0
+            max_pending: most jobs queued or running before new ones are turned away
+            rounds: bcrypt cost of new hashes
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Run a hashing job in the pool
+        Args:
+            fn: module level function to run
+            *args: arguments of the function
+
+        Raises:
+            HashingPoolBusyError: if the pool has as many jobs as it can queue
+
+        Returns:
+            what the function returns
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashingPoolBusyError("Too many passwords being checked at once, please try again")
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.pending += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password, and hash it again if the stored hash is of a lower cost than the current one
+        Args:
+            plain_password: password to verify
+            hashed_password: stored hash
+
+        Returns:
+            whether the password matches, and the new hash to store if the stored one is stale
+        """
+        return await self.run(password.verify_and_update, plain_password, hashed_password, self.rounds)
+
+    async def hash(self, plain_password: str) -> str:
+        """
+        Hash a password with the current cost
+        Args:
+            plain_password: password to hash
+
+        Returns:
+            the hash
+        """
+        return await self.run(password.hash_with, plain_password, self.rounds)
+
+    async def tune(self, target_ms: float, min_rounds: int, max_rounds: int) -> int:
+        """
+        Pick the highest bcrypt cost whose hash takes no longer than the target on this machine, to set
+        `BCRYPT_ROUNDS` of a deployment to. It's used by the pool from then on.
+        Each extra round doubles the time, so it's worked out from a single measurement at the lowest cost.
+        Args:
+            target_ms: target time of a hash in milliseconds
+            min_rounds: lowest cost to pick
+            max_rounds: highest cost to pick
+
+        Returns:
+            the picked cost
+        """
+        seconds = await self.run(password.measure_hash_seconds, min_rounds)
+        extra = math.floor(math.log2(target_ms / 1000 / seconds)) if seconds > 0 else max_rounds - min_rounds
+        self.rounds = max(min_rounds, min(max_rounds, min_rounds + extra))
+        logger.info(f"bcrypt cost tuned to {self.rounds}: {seconds * 1000:.1f}ms at {min_rounds}")
+        return self.rounds
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# the cost is set per deployment rather than tuned by each worker, which could each pick another one and keep hashing
+# the passwords of each other's logins again
+hashing_pool = HashingPool(settings.HASHING_WORKERS, settings.HASHING_MAX_PENDING, settings.BCRYPT_ROUNDS)
+
+
+async def stop_hashing_pool() -> None:
+    """
+    Stop the hashing workers. This will be initiated as the API service shuts down
+    """
+    hashing_pool.shutdown()
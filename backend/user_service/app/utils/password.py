@@ -1,6 +1,18 @@
+import time
+from typing import Dict, Optional, Tuple
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from config import settings
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+# contexts of the hashing workers by bcrypt cost
+_contexts: Dict[int, CryptContext] = {}
 
 
 def verify_hash(password: str, hashed_password: str) -> bool:
@@ -9,3 +21,69 @@ def verify_hash(password: str, hashed_password: str) -> bool:
 
 def get_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+def context_for(rounds: int) -> CryptContext:
+    """
+    Get a context that makes hashes of the given cost, and takes hashes of a lower cost as stale.
+    Hashes of a higher cost are kept, so passwords are never hashed again with a weaker one
+    Args:
+        rounds: log2 of the number of bcrypt rounds
+
+    Returns:
+        the context
+    """
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+        )
+    return _contexts[rounds]
+
+
+def verify_and_update(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password, and hash it again if the stored hash is of a lower cost. Runs in the hashing workers
+    Args:
+        password: password to verify
+        hashed_password: stored hash
+        rounds: current bcrypt cost
+
+    Returns:
+        whether the password matches, and the new hash to store if the stored one is stale
+    """
+    return context_for(rounds).verify_and_update(password, hashed_password)
+
+
+def hash_with(password: str, rounds: int) -> str:
+    """
+    Hash a password with the given cost. Runs in the hashing workers
+    Args:
+        password: password to hash
+        rounds: bcrypt cost
+
+    Returns:
+        the hash
+    """
+    return context_for(rounds).hash(password)
+
+
+def measure_hash_seconds(rounds: int, samples: int = 3) -> float:
+    """
+    Measure how long a hash of the given cost takes on this machine. Runs in the hashing workers
+    Args:
+        rounds: bcrypt cost
+        samples: number of hashes to take the fastest of
+
+    Returns:
+        seconds a hash takes
+    """
+    context = context_for(rounds)
+    best = float("inf")
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("cost-tuning-password")
+        best = min(best, time.perf_counter() - started)
+    return best
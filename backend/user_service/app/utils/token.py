@@ -1,6 +1,7 @@
 """
 A util module for all the token related operations
 """
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -15,6 +16,7 @@ from starlette import status
 
 from api.models.jwt_payload import JWTPayload
 from config import settings
+from utils.token_cache import token_cache
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
@@ -29,12 +31,15 @@ def generate_jwt(user: User) -> Token:
     Returns:
         JWT typed bearer token
     """
+    issued_at = datetime.utcnow()
     payload = JWTPayload(
         sub=user.user_id,
-        exp=datetime.utcnow() + timedelta(minutes=settings.TOKEN_EXPIRE_MINUTES),
+        exp=issued_at + timedelta(minutes=settings.TOKEN_EXPIRE_MINUTES),
         role=user.role,
         username=user.username,
         email=user.email,
+        storage_allowance=user.storage_allowance,
+        iat=issued_at,
     )
     return Token(
         token_type="bearer",
@@ -43,11 +48,29 @@ def generate_jwt(user: User) -> Token:
 
 
 def auth_with_jwt(token: str = Depends(reusable_oauth2)) -> Optional[JWTPayload]:
+    """
+    Check if the JWT token is valid.
+    Tokens that have been verified are cached until they expire, so reusing one skips the signature check.
+    Args:
+        token: token to check
+
+    Returns:
+        Decoded JWT with all the claims
+    """
+    started = time.perf_counter()
+    payload = token_cache.get(token)
+    if payload is not None:
+        token_cache.record_time(hit=True, seconds=time.perf_counter() - started)
+        return payload
     try:
         decoded_jwt = jwt.decode(token, settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM)
+        payload = JWTPayload(**decoded_jwt)
     except (jwt.JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Credential validation failed.",
         )
-    return JWTPayload(**decoded_jwt)
+    finally:
+        token_cache.record_time(hit=False, seconds=time.perf_counter() - started)
+    token_cache.put(token, payload)
+    return payload
@@ -0,0 +1,48 @@
+"""
+Benchmark for password verification throughput of logins.
+Verifies a burst of logins through the hashing pool with an increasing number of workers, at the bcrypt cost tuned to
+the target latency, and prints the logins per second overall and per worker core. Doesn't need DB.
+
+Usage:
+    $ PYTHONPATH=./app python benchmarks/login_throughput.py --logins 64 --workers 1 2 4 --target-ms 250
+"""
+import argparse
+import asyncio
+import time
+
+from utils import password
+from utils.hashing_pool import HashingPool
+
+
+async def run(logins: int, workers: int, target_ms: float, min_rounds: int, max_rounds: int) -> None:
+    pool = HashingPool(workers=workers, max_pending=logins)
+    rounds = await pool.tune(target_ms, min_rounds, max_rounds)
+    hashed_password = password.hash_with("benchmark-password", rounds)
+    # warm the worker processes up
+    await asyncio.gather(*[pool.verify("benchmark-password", hashed_password) for _ in range(workers)])
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[pool.verify("benchmark-password", hashed_password) for _ in range(logins)])
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+    assert all(verified for verified, _ in results)
+    print(
+        f"workers={workers:<3} cost={rounds:<3} {logins / elapsed:8.1f} logins/s "
+        f"{logins / elapsed / workers:8.1f} logins/s/core {elapsed / logins * workers * 1000:8.1f} ms/login"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64, help="logins verified at once")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="hashing worker processes to try")
+    parser.add_argument("--target-ms", type=float, default=250, help="target time of a hash to tune the cost to")
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    args = parser.parse_args()
+    for workers in args.workers:
+        asyncio.run(run(args.logins, workers, args.target_ms, args.min_rounds, args.max_rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, List, Callable, Dict
 
@@ -11,6 +13,17 @@ from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from tqdm import tqdm
 from urllib3.exceptions import HTTPError
 
+# files from this size are uploaded in parts using a resumable upload session
+RESUMABLE_UPLOAD_THRESHOLD = 32 * 1024 * 1024
+# maximum number of parts sent concurrently, which is also the size of the connection pool
+MAX_PARALLEL_UPLOADS = 16
+# number of times a broken download is resumed before giving up
+DOWNLOAD_RETRIES = 3
+# number of times the missing parts of a resumable upload are sent again before giving up
+PART_RETRIES = 3
+# maximum number of files the server lists in a page
+LIST_PAGE_SIZE = 100
+
 
 def request_wrapper(func):
     """
@@ -31,12 +44,21 @@ def request_wrapper(func):
     return wrapper
 
 
+class UploadProgress:
+    """
+    Progress of an upload in parts, reported in the same way as `MultipartEncoderMonitor` does
+    """
+
+    def __init__(self):
+        self.bytes_read = 0
+
+
 class ApiClient:
     def __init__(self):
         self.base_url = "http://fs-service.localhost/api"
 
         retry = Retry(total=3, status_forcelist=[500, 502, 504], backoff_factor=1)
-        adapter = HTTPAdapter(max_retries=retry)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=MAX_PARALLEL_UPLOADS)
         session = requests.Session()
         session.mount("http://", adapter)
         session.mount("https://", adapter)
@@ -75,6 +97,32 @@ class ApiClient:
             data={"username": email, "password": password},
         )
 
+    @request_wrapper
+    def refresh_token(self, refresh_token: str) -> Optional[Dict]:
+        """
+        Send refresh request to user service to get new tokens without the password.
+        The refresh token can be used only once, and a new one is returned along with the JWT.
+        Args:
+            refresh_token: refresh token issued with the previous JWT
+
+        Returns:
+            JWT token and the next refresh token in a dict
+            eg. {token_type: Bearer, access_token: <jwt_token>, refresh_token: <refresh_token>}
+        """
+        return self.session.post(url=self.base_url + "/auth/refresh", json={"refresh_token": refresh_token})
+
+    @request_wrapper
+    def revoke_token(self, refresh_token: str) -> Optional[Dict]:
+        """
+        Send revoke request to user service so the refresh token can't be used anymore
+        Args:
+            refresh_token: refresh token to revoke
+
+        Returns:
+            whether the token was revoked in a dict {revoked: bool}
+        """
+        return self.session.post(url=self.base_url + "/auth/revoke", json={"refresh_token": refresh_token})
+
     @request_wrapper
     def get_my_info(self, headers: dict) -> Optional[Dict]:
         """
@@ -87,10 +135,10 @@ class ApiClient:
         """
         return self.session.get(url=self.base_url + "/users/my", headers=headers)
 
-    @request_wrapper
     def get_file_list(self, limit: int, sort_by: str, desc: bool, headers: dict) -> Optional[Dict[str, List[Dict]]]:
         """
-        Get a list of file metadata from user service
+        Get a list of file metadata from file service.
+        Lists longer than a page are fetched page by page, following the cursor of each page.
         Args:
             limit: max number of items to fetch
             sort_by: field to sort the list by
@@ -98,13 +146,39 @@ class ApiClient:
             headers: Authorization headers with JWT
 
         Returns:
-            a list of file meta in a dict (parsed by request wrapper)
+            a list of file meta in a dict {files: [...]}
         """
-        return self.session.get(
-            url=self.base_url + "/files/list/",
-            params={"limit": limit, "sort_by": sort_by, "desc": desc},
-            headers=headers,
-        )
+        files = []
+        cursor = None
+        while len(files) < limit:
+            page = self.get_file_list_page(min(limit - len(files), LIST_PAGE_SIZE), sort_by, desc, cursor, headers)
+            files += page["files"]
+            cursor = page.get("next_cursor")
+            if not cursor:
+                break
+        return {"files": files}
+
+    @request_wrapper
+    def get_file_list_page(
+        self, limit: int, sort_by: str, desc: bool, cursor: Optional[str], headers: dict
+    ) -> Optional[Dict]:
+        """
+        Get a page of file metadata from file service
+        Args:
+            limit: max number of items in the page
+            sort_by: field to sort the list by
+            desc: whether to sort the list in descending order
+            cursor: cursor of the page to get. The first page if None
+            headers: Authorization headers with JWT
+
+        Returns:
+            a page of file meta with the cursor to the next page in a dict (parsed by request wrapper)
+        """
+        # totals of the storage aren't shown by CLI
+        params = {"limit": limit, "sort_by": sort_by, "desc": desc, "with_totals": False}
+        if cursor:
+            params["cursor"] = cursor
+        return self.session.get(url=self.base_url + "/files/list/", params=params, headers=headers)
 
     @request_wrapper
     def get_storage_used(self, headers: dict) -> Optional[Dict]:
@@ -118,10 +192,31 @@ class ApiClient:
         """
         return self.session.get(url=self.base_url + "/files/usage", headers=headers)
 
+    def upload_file(
+        self, file: Path, get_headers: Callable[[], dict], progress_callback: Callable, parallel: int = 1
+    ) -> Optional[Dict]:
+        """
+        Upload a file to file service.
+        Files bigger than `RESUMABLE_UPLOAD_THRESHOLD` are uploaded in parts, so a failed part can be sent again
+        without starting the whole upload over. Uploading with more than one connection also uses parts.
+        Args:
+            file: file in Path object
+            get_headers: returns Authorization headers with JWT. Called for every request, as a long upload can
+                outlive the JWT
+            progress_callback: callback that prints the upload progress
+            parallel: number of parts to send concurrently
+
+        Returns:
+            Uploaded file metadata in dict if successful
+        """
+        if file.stat().st_size < RESUMABLE_UPLOAD_THRESHOLD and parallel <= 1:
+            return self.upload_file_at_once(file, get_headers(), progress_callback)
+        return self.upload_file_in_parts(file, get_headers, progress_callback, parallel)
+
     @request_wrapper
-    def upload_file(self, file: Path, headers: dict, progress_callback: Callable) -> Optional[Dict]:
+    def upload_file_at_once(self, file: Path, headers: dict, progress_callback: Callable) -> Optional[Dict]:
         """
-        Upload a file to file service
+        Upload a file to file service in a single request
         Args:
             file: file in Path object
             headers: Authorization headers with JWT
@@ -135,6 +230,118 @@ class ApiClient:
         headers["Content-Type"] = encoder.content_type
         return self.session.post(url=self.base_url + "/files/upload", data=monitor, headers=headers)
 
+    def upload_file_in_parts(
+        self, file: Path, get_headers: Callable[[], dict], progress_callback: Callable, parallel: int = 1
+    ) -> Optional[Dict]:
+        """
+        Upload a file to file service using a resumable upload session.
+        Parts are sent over `parallel` connections at once, and the server writes each of them straight into its
+        place in the file. When a part fails, the parts received by the server are checked and only the missing ones
+        are sent again.
+        Args:
+            file: file in Path object
+            get_headers: returns Authorization headers with JWT. Called for every part
+            progress_callback: callback that prints the upload progress
+            parallel: number of parts to send concurrently
+
+        Returns:
+            Uploaded file metadata in dict if successful
+        """
+        parallel = min(max(parallel, 1), MAX_PARALLEL_UPLOADS)
+        upload = self.create_upload_session(file.name, file.stat().st_size, get_headers())
+        upload_id, part_size = upload["upload_id"], upload["part_size"]
+        # same as the server, so an empty file has no parts and goes straight to completion
+        part_count = -(-upload["size"] // part_size)
+        progress = UploadProgress()
+        lock = threading.Lock()
+
+        def send_part(part_number: int) -> None:
+            # every worker reads its own part, so a file handle can't be shared
+            with file.open("rb") as f:
+                f.seek(part_number * part_size)
+                data = f.read(part_size)
+            part = self.upload_part(upload_id, part_number, data, get_headers())
+            with lock:
+                progress.bytes_read += part["size"]
+                progress_callback(progress)
+
+        for attempt in range(PART_RETRIES + 1):
+            received = {part["part_number"] for part in upload["received_parts"]}
+            progress.bytes_read = sum(part["size"] for part in upload["received_parts"])
+            progress_callback(progress)
+            missing = [n for n in range(part_count) if n not in received]
+            try:
+                with ThreadPoolExecutor(max_workers=parallel) as executor:
+                    # list() re-raises the first failure after the running parts are done
+                    list(executor.map(send_part, missing))
+                break
+            except (HTTPError, requests.RequestException):
+                if attempt == PART_RETRIES:
+                    raise
+                upload = self.get_upload_session(upload_id, get_headers())
+        return self.complete_upload_session(upload_id, get_headers())
+
+    @request_wrapper
+    def create_upload_session(self, filename: str, size: int, headers: dict) -> Optional[Dict]:
+        """
+        Start a resumable upload session
+        Args:
+            filename: name of the file to upload
+            size: size of the file in bytes
+            headers: Authorization headers with JWT
+
+        Returns:
+            Upload session in dict (parsed by request wrapper)
+        """
+        return self.session.post(
+            url=self.base_url + "/files/uploads", json={"filename": filename, "size": size}, headers=headers
+        )
+
+    @request_wrapper
+    def get_upload_session(self, upload_id: str, headers: dict) -> Optional[Dict]:
+        """
+        Get the state of a resumable upload session
+        Args:
+            upload_id: id of the upload session
+            headers: Authorization headers with JWT
+
+        Returns:
+            Upload session with the received parts in dict (parsed by request wrapper)
+        """
+        return self.session.get(url=self.base_url + f"/files/uploads/{upload_id}", headers=headers)
+
+    @request_wrapper
+    def upload_part(self, upload_id: str, part_number: int, data: bytes, headers: dict) -> Optional[Dict]:
+        """
+        Send a part of the file of a resumable upload session
+        Args:
+            upload_id: id of the upload session
+            part_number: 0-based part number
+            data: bytes of the part
+            headers: Authorization headers with JWT
+
+        Returns:
+            Received part info in dict (parsed by request wrapper)
+        """
+        return self.session.put(
+            url=self.base_url + f"/files/uploads/{upload_id}/parts/{part_number}",
+            data=data,
+            headers={**headers, "Content-Type": "application/octet-stream"},
+        )
+
+    @request_wrapper
+    def complete_upload_session(self, upload_id: str, headers: dict) -> Optional[Dict]:
+        """
+        Finish a resumable upload session once all the parts are sent
+        Args:
+            upload_id: id of the upload session
+            headers: Authorization headers with JWT
+
+        Returns:
+            Uploaded file metadata in dict if successful (parsed by request wrapper)
+        """
+        return self.session.post(url=self.base_url + f"/files/uploads/{upload_id}/complete", headers=headers)
+
     @request_wrapper
     def delete_file(self, filename: str, headers: dict) -> Optional[Dict]:
         """
@@ -148,23 +355,70 @@ class ApiClient:
         """
         return self.session.delete(url=self.base_url + "/files", params={"filename": filename}, headers=headers)
 
-    def download_file(self, filename: str, download_path: Path, headers: dict) -> None:
-        response = self.session.get(url=self.base_url + "/files", params={"filename": filename}, headers=headers)
+    @request_wrapper
+    def delete_files(self, filenames: List[str], headers: dict) -> Optional[Dict]:
+        """
+        Send a bulk delete request to file service
+        Args:
+            filenames: names of the files to delete
+            headers: Authorization headers with JWT
+
+        Returns:
+            whether each file was deleted in dict (parsed by request wrapper)
+        """
+        return self.session.post(url=self.base_url + "/files/delete", json={"filenames": filenames}, headers=headers)
+
+    def download_file(self, filename: str, download_path: Path, get_headers: Callable[[], dict]) -> None:
+        """
+        Download a file from file service.
+        If the connection breaks, the download is resumed from the bytes received so far with a range request. The
+        range is asked for only if the file is still the one first received, and the whole file is sent otherwise.
+        Args:
+            filename: name of the file to download
+            download_path: path to save the file to
+            get_headers: returns Authorization headers with JWT. Called for every request, as a long download can
+                outlive the JWT
+
+        Raises:
+            HTTPError: if the server answers with an error, which is never written to the file
+        """
+        response = self.session.get(url=self.base_url + "/files", params={"filename": filename}, headers=get_headers())
         if response.status_code == 404:
             raise HTTPError("File does not exist!")
-        with self.session.get(
-            url=self.base_url + "/files/download",
-            params={"filename": filename},
-            headers=headers,
-            stream=True,
-        ) as r:
-            with tqdm(
-                total=int(r.headers.get("content-length")),
-                unit_scale=True,
-                unit="B",
-                dynamic_ncols=True,
-            ) as bar:
-                with download_path.open("wb") as f:
-                    for chunk in r.iter_content(1000):
-                        f.write(chunk)
-                        bar.update(len(chunk))
+        received = 0
+        # validator of the file being received, to resume only as long as the file hasn't been replaced
+        validator = None
+        with tqdm(
+            total=response.json()["size"],
+            unit_scale=True,
+            unit="B",
+            dynamic_ncols=True,
+        ) as bar, download_path.open("wb") as f:
+            for attempt in range(DOWNLOAD_RETRIES + 1):
+                range_headers = {"Range": f"bytes={received}-", "If-Range": validator} if received and validator else {}
+                try:
+                    with self.session.get(
+                        url=self.base_url + "/files/download",
+                        params={"filename": filename},
+                        headers={**get_headers(), **range_headers},
+                        stream=True,
+                    ) as r:
+                        if r.status_code not in (200, 206):
+                            # errors are not retried, only broken connections are
+                            raise HTTPError(f"Download failed with status {r.status_code}")
+                        if r.status_code == 200:
+                            validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+                            if received:
+                                # the server sent the whole file instead, such as one that's been replaced
+                                f.seek(0)
+                                f.truncate()
+                                bar.update(-received)
+                                received = 0
+                        for chunk in r.iter_content(1000):
+                            f.write(chunk)
+                            received += len(chunk)
+                            bar.update(len(chunk))
+                    break
+                except requests.RequestException:
+                    if attempt == DOWNLOAD_RETRIES:
+                        raise
@@ -1,14 +1,23 @@
+import base64
+import json
 import os
 import pwd
+import threading
+import time
 from pathlib import Path
+from typing import Tuple, Optional
 
 import click
 from tqdm import tqdm
 
-from .api_client import ApiClient
+from .api_client import ApiClient, MAX_PARALLEL_UPLOADS
 from urllib3.exceptions import HTTPError
 
 
+# the access token is renewed when it has less than this many seconds left
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+
 class Environment:
     """
     Contains context that is shared among different commands
@@ -18,13 +27,56 @@ class Environment:
         self.api_base_url: str = "http://fs-service.localhost"
         self.token_file: Path = Path("/home") / pwd.getpwuid(os.getuid()).pw_name / ".files"
         self.token = None
+        self.refresh_token = None
+        # parts of an upload are sent from several threads, and a refresh token can be used only once
+        self._refresh_lock = threading.Lock()
 
         if self.token_file.exists():
             with self.token_file.open("r") as f:
-                self.token = f.read()
+                content = f.read()
+            try:
+                tokens = json.loads(content)
+                self.token = tokens["access_token"]
+                self.refresh_token = tokens.get("refresh_token")
+            except (ValueError, TypeError, KeyError):
+                # saved by an older version, which kept only the access token
+                self.token = content
+
+    def save_tokens(self, tokens: dict) -> None:
+        """
+        Save the tokens issued by the user service to the token file for future requests
+        Args:
+            tokens: token response of the user service
+        """
+        self.token = tokens["access_token"]
+        self.refresh_token = tokens.get("refresh_token")
+        with self.token_file.open("w") as f:
+            json.dump({"access_token": self.token, "refresh_token": self.refresh_token}, f)
 
     def get_headers(self):
-        return {"Authorization": f"Bearer {self.token}"}
+        # access tokens are short-lived. Get a new one with the refresh token rather than asking to login again
+        with self._refresh_lock:
+            if self.refresh_token and self.token_expires_in() < TOKEN_REFRESH_MARGIN_SECONDS:
+                try:
+                    self.save_tokens(ApiClient().refresh_token(self.refresh_token))
+                except HTTPError:
+                    # the refresh token is no longer valid. The request fails with the old token, asking to login
+                    pass
+            return {"Authorization": f"Bearer {self.token}"}
+
+    def token_expires_in(self) -> float:
+        """
+        Get the seconds left until the access token expires, read from its claims without verifying it
+        Returns:
+            seconds left, 0 if the token can't be read
+        """
+        exp: Optional[int] = None
+        try:
+            payload = self.token.split(".")[1]
+            exp = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["exp"]
+        except (AttributeError, IndexError, ValueError, KeyError, TypeError):
+            pass
+        return exp - time.time() if exp else 0
 
 
 pass_environment = click.make_pass_decorator(Environment, ensure=True)
@@ -46,9 +98,8 @@ def login(ctx: Environment):
     client = ApiClient()
     try:
         res = client.get_token(email, password)
-        # save to a file for future requests
-        with ctx.token_file.open("w") as f:
-            f.write(res["access_token"])
+        # save to a file for future requests. The refresh token keeps the login going once the JWT expires
+        ctx.save_tokens(res)
         click.echo(f"Login successful!\n")
         click.echo("Now try `fs files upload` to upload your files.")
     except HTTPError as e:
@@ -63,6 +114,12 @@ def logout(ctx: Environment):
     Logout and invalidate auth token
     """
     if ctx.token_file.is_file():
+        if ctx.refresh_token:
+            try:
+                ApiClient().revoke_token(ctx.refresh_token)
+            except HTTPError:
+                # logged out locally all the same
+                pass
         ctx.token_file.unlink()
         click.echo("Logout Successful! Please login again to use the service.")
     else:
@@ -146,8 +203,15 @@ def list(ctx: Environment, limit: int, sort_by: str, desc: bool):
 
 @file.command()
 @click.argument("file", type=click.Path(exists=True))
+@click.option(
+    "--parallel",
+    "-p",
+    default=1,
+    type=click.IntRange(1, MAX_PARALLEL_UPLOADS),
+    help="Number of parts of the file to upload concurrently",
+)
 @pass_environment
-def upload(ctx: Environment, file: str):
+def upload(ctx: Environment, file: str, parallel: int):
     """
     Uploads a file to the storage
     """
@@ -162,8 +226,9 @@ def upload(ctx: Environment, file: str):
         try:
             res = client.upload_file(
                 Path(file),
-                ctx.get_headers(),
+                ctx.get_headers,
                 lambda x: bar.update(x.bytes_read - bar.n),
+                parallel=parallel,
             )
             click.echo(f"File {res['filename']} uploaded successfully")
         except HTTPError as e:
@@ -171,16 +236,24 @@ def upload(ctx: Environment, file: str):
 
 
 @file.command()
-@click.argument("filename", type=str)
+@click.argument("filenames", type=str, nargs=-1, required=True)
 @pass_environment
-def delete(ctx: Environment, filename: str):
+def delete(ctx: Environment, filenames: Tuple[str, ...]):
     """
-    Delete a file from the storage
+    Delete files from the storage. Several files are deleted with a single request
     """
     client = ApiClient()
     try:
-        res = client.delete_file(filename, ctx.get_headers())
-        click.echo(f"File {res['filename']} deleted successfully")
+        if len(filenames) == 1:
+            res = client.delete_file(filenames[0], ctx.get_headers())
+            click.echo(f"File {res['filename']} deleted successfully")
+            return
+        res = client.delete_files(list(filenames), ctx.get_headers())
+        for item in res["files"]:
+            if item["deleted"]:
+                click.echo(f"File {item['filename']} deleted successfully")
+            else:
+                click.echo(f"ERROR! File {item['filename']} not found")
     except HTTPError as e:
         click.echo(f"ERROR! {e}")
 
@@ -209,7 +282,7 @@ def download(ctx: Environment, filename: str, dest: str):
         click.confirm(f"This will overwrite the existing file at {dest}. Continue?", abort=True)
     client = ApiClient()
     try:
-        client.download_file(filename, dest, ctx.get_headers())
+        client.download_file(filename, dest, ctx.get_headers)
         click.echo(f"File {filename} downloaded at {dest.absolute()} successfully")
     except HTTPError as e:
         click.echo(f"ERROR! {e}")
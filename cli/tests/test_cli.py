@@ -133,6 +133,31 @@ def test_file_upload(register_and_login):
         assert "uploaded successfully" in result.output
 
 
+def test_file_upload_parallel(register_and_login):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("test_file.txt", mode="w") as f:
+            f.write("This is a test file" * 1_000_000)
+        result = runner.invoke(upload, args=["--parallel", "4", "test_file.txt"])
+        assert result.exit_code == 0
+        assert "uploaded successfully" in result.output
+        # check the parts are assembled in order
+        Path("test_file.txt").unlink()
+        runner.invoke(download, args=["test_file.txt"])
+        with open("test_file.txt", mode="r") as f:
+            assert f.read() == "This is a test file" * 1_000_000
+
+
+def test_file_upload_parallel_empty(register_and_login):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("empty.txt").touch()
+        # an empty file has no parts to send
+        result = runner.invoke(upload, args=["--parallel", "4", "empty.txt"])
+        assert result.exit_code == 0
+        assert "uploaded successfully" in result.output
+
+
 def test_file_upload_fail_no_file(register_and_login):
     runner = CliRunner()
     result = runner.invoke(upload, args="non-existent-file")
@@ -150,6 +175,21 @@ def test_file_list(register_and_login):
         assert "test_file.txt" in result.output
 
 
+def test_file_list_pages(register_and_login, monkeypatch):
+    # a page per file, so the list is put together by following cursors
+    monkeypatch.setattr("fs_cli.api_client.LIST_PAGE_SIZE", 1)
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for name in ("first.txt", "second.txt"):
+            with open(name, mode="w") as f:
+                f.write("This is a test file" * 100)
+            runner.invoke(upload, args=name)
+        result = runner.invoke(list, args="-l 5")
+        assert result.exit_code == 0
+        assert "first.txt" in result.output
+        assert "second.txt" in result.output
+
+
 def test_file_delete_success(register_and_login):
     runner = CliRunner()
     with runner.isolated_filesystem():
@@ -169,6 +209,23 @@ def test_file_delete_success(register_and_login):
         assert "test_file.txt" not in result.output
 
 
+def test_file_delete_many(register_and_login):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for filename in ("first.txt", "second.txt"):
+            with open(filename, mode="w") as f:
+                f.write("This is a test file" * 100)
+            runner.invoke(upload, args=filename)
+        result = runner.invoke(delete, args=["first.txt", "second.txt", "non-existent-file"])
+        assert result.exit_code == 0
+        assert "File first.txt deleted successfully" in result.output
+        assert "File second.txt deleted successfully" in result.output
+        assert "ERROR! File non-existent-file not found" in result.output
+        result = runner.invoke(list)
+        assert "first.txt" not in result.output
+        assert "second.txt" not in result.output
+
+
 def test_file_delete_fail_no_file(register_and_login):
     runner = CliRunner()
     result = runner.invoke(delete, args="non-existent-file")
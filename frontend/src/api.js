@@ -1,6 +1,8 @@
 import axios from "axios";
 import Vue from "vue";
 
+const BASE_URL = "http://fs-service.localhost/api/";
+
 function getAuthHeaders() {
   const jwt = Vue.$cookies.get("token");
   if (jwt) {
@@ -10,12 +12,69 @@ function getAuthHeaders() {
   }
 }
 
+// save the tokens issued by the user service in cookies
+export function saveTokens(tokens) {
+  Vue.$cookies.set("token", tokens.access_token);
+  if (tokens.refresh_token) {
+    Vue.$cookies.set("refresh_token", tokens.refresh_token);
+  }
+}
+
+export function removeTokens() {
+  Vue.$cookies.remove("token");
+  Vue.$cookies.remove("refresh_token");
+}
+
+// a refresh token can be used only once, so requests failing at the same time
+// share a single refresh
+let refreshing = null;
+
+function refreshTokens() {
+  if (!refreshing) {
+    refreshing = axios
+      .post(
+        "auth/refresh",
+        { refresh_token: Vue.$cookies.get("refresh_token") },
+        { baseURL: BASE_URL, timeout: 3000 }
+      )
+      .then((response) => saveTokens(response.data))
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+}
+
+// access tokens are short-lived. An expired one is renewed with the refresh
+// token and the request is sent again, once. The retry skips this interceptor,
+// so a request that's still refused fails as it is
+async function renewOnForbidden(err) {
+  if (
+    !err.response ||
+    err.response.status !== 403 ||
+    !Vue.$cookies.get("refresh_token")
+  ) {
+    throw err;
+  }
+  try {
+    await refreshTokens();
+  } catch (refreshErr) {
+    throw err;
+  }
+  return axios.request({
+    ...err.config,
+    headers: { ...err.config.headers, ...getAuthHeaders() },
+  });
+}
+
 function getClient() {
-  return axios.create({
-    baseURL: "http://fs-service.localhost/api/",
+  const client = axios.create({
+    baseURL: BASE_URL,
     headers: getAuthHeaders(),
     timeout: 3000,
   });
+  client.interceptors.response.use(undefined, renewOnForbidden);
+  return client;
 }
 const api = {
   async createUser(email, username, password) {
@@ -29,6 +88,9 @@ const api = {
 
     return getClient().post("auth/token", params);
   },
+  async revokeToken(refresh_token) {
+    return getClient().post("auth/revoke", { refresh_token });
+  },
   async getCurrentUserInfo() {
     return getClient().get("users/my");
   },
@@ -46,12 +46,13 @@ const actions = {
   async fetchFileMetas({ commit, state }) {
     commit("SET_TABLE_LOADING", true);
     try {
+      // the list comes with the file count and storage usage
       const fileMetasRes = await api.getFileList(state.sortOptions);
-      const countRes = await api.getFileCount({});
       commit("SET_FILE_METAS", {
         fileMetas: fileMetasRes.data.files,
-        totalFileCount: countRes.data.count,
+        totalFileCount: fileMetasRes.data.total_count,
       });
+      commit("SET_STORAGE_USED", fileMetasRes.data.total_bytes);
     } catch (err) {
       if (err.response.status === 403) {
         await router.push("/login");
@@ -66,7 +67,7 @@ const actions = {
     }
   },
 
-  async uploadFile({ commit, state, rootState }, uploadingFile) {
+  async uploadFile({ commit, dispatch, state, rootState }, uploadingFile) {
     // check file storage limit before uploading
     if (
       state.storageUsed + uploadingFile.size >
@@ -113,6 +114,7 @@ const actions = {
         { root: true }
       );
       commit("ADD_FILE_META_TO_TABLE", uploadedFileMeta.data);
+      await dispatch("fetchStorageUsed");
     } catch (err) {
       if (err.response.status === 403) {
         await router.push("/login");
@@ -177,6 +179,7 @@ const actions = {
           await dispatch("fetchFileMetas");
         } else {
           commit("DELETE_FILE_META_FROM_TABLE", file);
+          await dispatch("fetchStorageUsed");
         }
       }
     } catch (err) {